@@ -0,0 +1,315 @@
+"""Проверки записи и чтения во всех форматах хранения, журнала и базы SQLite
+
+Запуск: python -m pytest -q (или python -m unittest)
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from transport_generator import generate_system
+from transport_segments import write_segments
+from transport_snapshot import open_snapshot
+from transport_system import (
+    CallbackSink,
+    FileOperationError,
+    Passenger,
+    SilentSink,
+    TransportSystem,
+)
+
+
+def signature(system):
+    """Состояние системы, не зависящее от порядка загрузки"""
+    return (
+        sorted((r.id, r.start_point, r.end_point) for r in system.routes),
+        sorted((p.id, p.name, p.ticket_number) for p in system.passengers),
+        sorted(
+            (t.id, t.type, t.name, t.capacity, t.route.id if t.route else None,
+             tuple(p.id for p in t.passengers))
+            for t in system.transports
+        ),
+        sorted((passenger_id, t.id) for passenger_id, t in system._passenger_locations.items()),
+    )
+
+
+def make_system(compact=False):
+    system = generate_system(passengers=600, occupancy=0.5, seed=5, compact=compact)
+    # Пассажиры без места - для посадок после записи
+    system.add_passengers(Passenger(10**6 + i, f"Запасной {i}", f"9999-{i:08d}") for i in range(20))
+    return system
+
+
+def empty_system(compact=False):
+    """Пустая система и список сообщений об ошибках, выданных ею"""
+    errors = []
+    sink = CallbackSink(lambda level, text: errors.append(text), level=logging.ERROR)
+    return TransportSystem(events=sink, compact=compact), errors
+
+
+def spare(system, count=1):
+    """Зарегистрированные пассажиры, которые сейчас не едут"""
+    free = [p for p in system.passengers if p.id not in system._passenger_locations]
+    return free[:count]
+
+
+def move_riders(system):
+    """Несколько мутаций разных видов"""
+    first, second = system.transports[0], system.transports[1]
+    for passenger in spare(system, 2):
+        if not second.add_passenger(passenger):
+            raise AssertionError("посадка не выполнена")
+    rider = next(iter(first.passengers))
+    first.remove_passenger(rider)
+    second.remove_passenger(next(iter(second.passengers)))
+    system.add_passenger(Passenger(2 * 10**6, "Новый пассажир", "8888-00000001"))
+    system.assign_route_to_transport(first.id, system.routes[-1].id)
+
+
+class FormatRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def check(self, save, load, name, compact=False):
+        system = make_system(compact)
+        target = self.path(name)
+        self.assertTrue(save(system, target))
+        loaded, errors = empty_system(compact)
+        load(loaded, target)
+        self.assertEqual(errors, [])
+        self.assertEqual(signature(loaded), signature(system))
+        return loaded
+
+    def test_json(self):
+        for stream in (False, True):
+            self.check(lambda s, f: s.save_to_json(f, stream=stream),
+                       lambda s, f: s.load_from_json(f, stream=stream), f"data-{stream}.json")
+
+    def test_xml(self):
+        for stream in (False, True):
+            self.check(lambda s, f: s.save_to_xml(f, stream=stream),
+                       lambda s, f: s.load_from_xml(f, stream=stream), f"data-{stream}.xml")
+
+    def test_compact_store(self):
+        self.check(lambda s, f: s.save_to_json(f, stream=True),
+                   lambda s, f: s.load_from_json(f, stream=True), "compact.json", compact=True)
+
+    def test_binary(self):
+        self.check(TransportSystem.save_to_binary, TransportSystem.load_from_binary, "data.tsnp")
+
+    def test_binary_lazy_reader(self):
+        system = make_system()
+        target = self.path("data.tsnp")
+        system.save_to_binary(target)
+        transport = system.transports[3]
+        with open_snapshot(target) as snapshot:
+            found = snapshot.find_transport(transport.id)
+            self.assertEqual(found.name, transport.name)
+            self.assertEqual([p.id for p in found.passengers], [p.id for p in transport.passengers])
+
+    def test_binary_truncated(self):
+        system = make_system()
+        target = self.path("data.tsnp")
+        system.save_to_binary(target)
+        with open(target, 'r+b') as f:
+            f.truncate(os.path.getsize(target) // 2)
+        loaded, errors = empty_system()
+        loaded.load_from_binary(target)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(loaded.transports, [])
+
+    def test_sqlite(self):
+        self.check(TransportSystem.save_to_sqlite, TransportSystem.load_from_sqlite, "data.db")
+
+    def test_shards(self):
+        for file_format in ("json", "xml"):
+            self.check(lambda s, f: s.save_to_shards(f, shards=3, file_format=file_format),
+                       TransportSystem.load_from_shards, f"shards-{file_format}")
+
+    def test_segments(self):
+        for file_format in ("json", "xml"):
+            self.check(lambda s, f: s.save_to_segments(f, file_format=file_format, chunk_size=4),
+                       TransportSystem.load_from_segments, f"segments-{file_format}")
+
+
+class SegmentsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rewrites_only_changed_segments(self):
+        system = make_system()
+        written, total = write_segments(system, self.directory, chunk_size=4)
+        self.assertEqual(written, total)
+
+        self.assertEqual(write_segments(system, self.directory, chunk_size=4)[0], 0)
+
+        # Посадка меняет один транспорт - переписывается один его сегмент
+        system.transports[-1].add_passenger(spare(system)[0])
+        written, total = write_segments(system, self.directory, chunk_size=4)
+        self.assertEqual(written, 1)
+
+        loaded, errors = empty_system()
+        loaded.load_from_segments(self.directory)
+        self.assertEqual(errors, [])
+        self.assertEqual(signature(loaded), signature(system))
+
+        # После загрузки запись тоже инкрементальная
+        loaded.transports[0].remove_passenger(next(iter(loaded.transports[0].passengers)))
+        self.assertEqual(write_segments(loaded, self.directory, chunk_size=4)[0], 1)
+        reloaded, errors = empty_system()
+        reloaded.load_from_segments(self.directory)
+        self.assertEqual(errors, [])
+        self.assertEqual(signature(reloaded), signature(loaded))
+
+    def test_other_chunk_size_rewrites_all(self):
+        system = make_system()
+        write_segments(system, self.directory, chunk_size=4)
+        written, total = write_segments(system, self.directory, chunk_size=8)
+        self.assertEqual(written, total)
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def recover(self):
+        recovered = TransportSystem.recover(self.directory, events=SilentSink())
+        recovered.disable_journal()
+        return recovered
+
+    def test_recover_after_mutations(self):
+        system = make_system()
+        self.assertTrue(system.enable_journal(self.directory))
+        move_riders(system)
+        system.disable_journal()
+        self.assertEqual(signature(self.recover()), signature(system))
+
+    def test_recover_after_compaction(self):
+        system = make_system()
+        system.enable_journal(self.directory)
+        move_riders(system)
+        self.assertTrue(system.compact_journal())
+        system.transports[2].add_passenger(spare(system)[0])
+        system.disable_journal()
+        self.assertEqual(signature(self.recover()), signature(system))
+
+    def test_recovered_journal_continues(self):
+        system = make_system()
+        system.enable_journal(self.directory)
+        move_riders(system)
+        system.disable_journal()
+
+        recovered = TransportSystem.recover(self.directory, events=SilentSink())
+        recovered.transports[4].add_passenger(spare(recovered)[0])
+        recovered.disable_journal()
+        self.assertEqual(signature(self.recover()), signature(recovered))
+
+    def test_torn_last_line_skipped(self):
+        system = make_system()
+        system.enable_journal(self.directory)
+        move_riders(system)
+        path = system.journal.journal_path
+        system.disable_journal()
+        with open(path, 'ab') as f:
+            f.write(b'[999999,"board",1')
+        self.assertEqual(signature(self.recover()), signature(system))
+
+    def test_unnumbered_entry_rejected(self):
+        system = make_system()
+        system.enable_journal(self.directory)
+        path = system.journal.journal_path
+        system.disable_journal()
+        with open(path, 'ab') as f:
+            f.write(b'["alight",1,1]\n')
+        with self.assertRaises(FileOperationError):
+            TransportSystem.recover(self.directory, events=SilentSink())
+
+    def test_unregistered_passenger_not_journaled(self):
+        system = make_system()
+        system.enable_journal(self.directory)
+        stranger = Passenger(3 * 10**6, "Без регистрации", "7777-00000001")
+        self.assertFalse(system.transports[0].add_passenger(stranger))
+        self.assertTrue(system.transports[1].board_many([stranger]).rejected)
+        self.assertIsNone(system.find_passenger_transport(stranger.id))
+        system.disable_journal()
+        self.assertEqual(signature(self.recover()), signature(system))
+
+
+class SqliteStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "data.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self):
+        loaded, errors = empty_system()
+        loaded.load_from_sqlite(self.filename)
+        self.assertEqual(errors, [])
+        return loaded
+
+    def test_mutations_written_on_close(self):
+        system = make_system()
+        self.assertTrue(system.enable_sqlite(self.filename, batch_size=1000, flush_interval=None))
+        move_riders(system)
+        system.disable_sqlite()
+        self.assertEqual(signature(self.load()), signature(system))
+
+    def test_flushed_mutations_visible_while_open(self):
+        system = make_system()
+        system.enable_sqlite(self.filename, batch_size=1000, flush_interval=None)
+        move_riders(system)
+        system.storage.flush()
+        try:
+            self.assertEqual(signature(self.load()), signature(system))
+        finally:
+            system.disable_sqlite()
+
+    def test_reattach_without_replace(self):
+        system = make_system()
+        system.save_to_sqlite(self.filename)
+        loaded = self.load()
+        self.assertTrue(loaded.enable_sqlite(self.filename, replace=False))
+        move_riders(loaded)
+        loaded.disable_sqlite()
+        self.assertEqual(signature(self.load()), signature(loaded))
+
+    def test_unregistered_passenger_not_stored(self):
+        system = make_system()
+        system.enable_sqlite(self.filename)
+        stranger = Passenger(3 * 10**6, "Без регистрации", "7777-00000001")
+        self.assertFalse(system.transports[0].add_passenger(stranger))
+        system.disable_sqlite()
+        self.assertEqual(signature(self.load()), signature(system))
+
+    def test_poison_batch_dropped(self):
+        system = make_system()
+        system.enable_sqlite(self.filename, batch_size=1000, flush_interval=None)
+        storage = system.storage
+        # Повтор уже записанного пассажира нарушает уникальный индекс
+        storage.append("add_passenger", system.passengers[0])
+        with self.assertRaises(FileOperationError):
+            storage.flush()
+        self.assertEqual(storage._pending_count, 0)
+
+        move_riders(system)
+        system.disable_sqlite()
+        self.assertEqual(signature(self.load()), signature(system))
+
+
+if __name__ == "__main__":
+    unittest.main()
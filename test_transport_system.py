@@ -0,0 +1,127 @@
+"""Проверки индексов системы и PassengerSet
+
+Запуск: python -m pytest -q (или python -m unittest)
+"""
+import unittest
+
+from transport_system import (
+    Bus,
+    DuplicateIdError,
+    Passenger,
+    PassengerSet,
+    Route,
+    SilentSink,
+    Tram,
+    TransportSystem,
+)
+
+
+def make_system():
+    system = TransportSystem(events=SilentSink())
+    system.add_route(Route(1, "Вокзал", "Центр"))
+    system.add_passengers(Passenger(i, f"Пассажир {i}", f"0000-{i:08d}") for i in range(1, 6))
+    system.add_transport(Bus(1, "Автобус 1", 3, "А1"))
+    system.add_transport(Tram(2, "Трамвай 2", 3, "Т2"))
+    system.assign_route_to_transport(1, 1)
+    return system
+
+
+class IndexTest(unittest.TestCase):
+    def test_find_by_id_and_ticket(self):
+        system = make_system()
+        self.assertEqual(system.find_passenger(3).name, "Пассажир 3")
+        self.assertEqual(system.find_passenger_by_ticket("0000-00000004").id, 4)
+        self.assertEqual(system.find_transport(2).line_number, "Т2")
+        self.assertEqual([t.id for t in system.find_transports_on_route(1)], [1])
+        self.assertEqual([t.id for t in system.find_transports_by_type("tram")], [2])
+
+    def test_duplicate_ids_rejected(self):
+        system = make_system()
+        self.assertFalse(system.add_passenger(Passenger(1, "Двойник", "9999-00000001")))
+        self.assertFalse(system.add_transport(Bus(1, "Двойник", 10, "А9")))
+        self.assertFalse(system.add_route(Route(1, "Порт", "Парк")))
+        self.assertEqual(len(system.passengers), 5)
+        self.assertEqual(len(system.transports), 2)
+        self.assertEqual(system.find_passenger(1).name, "Пассажир 1")
+
+    def test_duplicate_ids_in_batch_rejected(self):
+        system = make_system()
+        result = system.add_passengers([
+            Passenger(6, "Новый", "0000-00000006"),
+            Passenger(1, "Двойник", "9999-00000001"),
+            Passenger(7, "Двойник билета", "0000-00000006"),
+        ])
+        self.assertEqual([p.id for p in result.accepted], [6])
+        self.assertEqual([p.id for p, _ in result.rejected], [1, 7])
+        self.assertTrue(all(isinstance(e, DuplicateIdError) for _, e in result.rejected))
+        self.assertEqual(system.find_passenger_by_ticket("0000-00000006").id, 6)
+
+    def test_passenger_location(self):
+        system = make_system()
+        bus, tram = system.transports
+        passenger = system.find_passenger(1)
+        self.assertTrue(bus.add_passenger(passenger))
+        self.assertIs(system.find_passenger_transport(1), bus)
+        # Пассажир не может находиться в двух транспортных средствах сразу
+        self.assertFalse(tram.add_passenger(passenger))
+        self.assertNotIn(passenger, tram.passengers)
+        self.assertTrue(bus.remove_passenger(passenger))
+        self.assertIsNone(system.find_passenger_transport(1))
+        self.assertTrue(tram.add_passenger(passenger))
+        self.assertIs(system.find_passenger_transport(1), tram)
+
+    def test_capacity(self):
+        system = make_system()
+        bus = system.transports[0]
+        for passenger_id in (1, 2, 3):
+            self.assertTrue(bus.add_passenger(system.find_passenger(passenger_id)))
+        self.assertFalse(bus.add_passenger(system.find_passenger(4)))
+        self.assertIsNone(system.find_passenger_transport(4))
+
+
+class PassengerSetTest(unittest.TestCase):
+    def setUp(self):
+        self.riders = [Passenger(i, f"Пассажир {i}", f"билет {i}") for i in range(1, 5)]
+
+    def test_order_and_membership(self):
+        riders = PassengerSet(self.riders[:3])
+        riders.add(self.riders[0])
+        self.assertEqual(list(riders), self.riders[:3])
+        self.assertIn(self.riders[1], riders)
+        riders.remove(self.riders[1])
+        self.assertNotIn(self.riders[1], riders)
+        self.assertEqual(len(riders), 2)
+
+    def test_share_copies_on_original_write(self):
+        riders = PassengerSet(self.riders[:2])
+        copy = riders.share()
+        riders.add(self.riders[2])
+        riders.remove(self.riders[0])
+        self.assertEqual(list(copy), self.riders[:2])
+        self.assertEqual(list(riders), [self.riders[1], self.riders[2]])
+
+    def test_share_copies_on_copy_write(self):
+        riders = PassengerSet(self.riders[:2])
+        copy = riders.share()
+        copy.clear()
+        self.assertEqual(list(riders), self.riders[:2])
+        # Вторая запись в уже отделенный оригинал не копирует словарь снова
+        riders.add(self.riders[3])
+        items = riders._items
+        riders.discard(self.riders[0])
+        self.assertIs(riders._items, items)
+        self.assertEqual(len(copy), 0)
+
+    def test_snapshot_unaffected_by_later_boarding(self):
+        system = make_system()
+        bus = system.transports[0]
+        bus.add_passenger(system.find_passenger(1))
+        view = system.snapshot()
+        bus.add_passenger(system.find_passenger(2))
+        bus.remove_passenger(system.find_passenger(1))
+        self.assertEqual([p.id for p in view.find_transport(1).passengers], [1])
+        self.assertEqual([p.id for p in bus.passengers], [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
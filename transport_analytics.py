@@ -0,0 +1,202 @@
+"""Аналитика парка на столбцах NumPy
+
+Для каждого транспортного средства хранятся столбцы: id, вместимость,
+число пассажиров, код типа и id маршрута (0 - маршрут не назначен).
+Столбцы обновляются по мере посадок, высадок, регистрации транспорта и
+назначения маршрутов (через TransportSystem._record), а после загрузки
+из файла строятся заново, поэтому запросы не обходят transports.
+
+Требуется пакет numpy; подключение - TransportSystem.enable_analytics().
+
+Пример:
+    analytics = system.enable_analytics()
+    analytics.group_by("route", "free", "sum")    # свободные места по маршрутам
+    analytics.group_by("type", "load", "mean")    # средняя загрузка по типам
+    analytics.most_full(10)
+"""
+import threading
+
+import numpy as np
+
+from transport_system import TYPE_CODES, TYPE_NAMES
+
+COLUMNS = ("occupancy", "capacity", "free", "load")
+STATS = ("sum", "mean", "max", "min", "count")
+
+
+def _NO_ROWS(transports):
+    # Срез нужен только ради блокировок: транспорт в нем не запоминается
+    return ()
+
+
+class FleetAnalytics:
+    def __init__(self, system):
+        self.system = system
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self):
+        """Заполнение столбцов по текущему состоянию системы и подключение к ней
+
+        Столбцы заполняются, и system.analytics назначается под
+        блокировками среза системы (TransportSystem._capture): мутации до
+        этого уже учтены в столбцах, следующие придут через apply.
+        """
+        self.system._capture(select=_NO_ROWS, attach=self._fill)
+
+    def _fill(self):
+        transports = self.system.transports
+        with self._lock:
+            self._size = 0
+            self._allocate(max(len(transports), 16))
+            self._rows = {}
+            self._append(transports)
+        self.system.analytics = self
+
+    def _allocate(self, capacity):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.capacity = np.zeros(capacity, dtype=np.int64)
+        self.occupancy = np.zeros(capacity, dtype=np.int64)
+        self.type_code = np.zeros(capacity, dtype=np.int8)
+        self.route_id = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self, needed):
+        if needed <= len(self.ids):
+            return
+        new_capacity = max(needed, 2 * len(self.ids))
+        for name in ("ids", "capacity", "occupancy", "type_code", "route_id"):
+            old = getattr(self, name)
+            column = np.zeros(new_capacity, dtype=old.dtype)
+            column[:self._size] = old[:self._size]
+            setattr(self, name, column)
+
+    def _append(self, transports):
+        start = self._size
+        end = start + len(transports)
+        self._grow(end)
+        rows = slice(start, end)
+        self.ids[rows] = [transport.id for transport in transports]
+        self.capacity[rows] = [transport.capacity for transport in transports]
+        self.occupancy[rows] = [len(transport.passengers) for transport in transports]
+        self.type_code[rows] = [
+            TYPE_CODES.get(getattr(transport, 'type', 'transport'), 0) for transport in transports
+        ]
+        self.route_id[rows] = [
+            transport.route.id if transport.route is not None else 0 for transport in transports
+        ]
+        for row, transport in enumerate(transports, start):
+            self._rows[transport.id] = row
+        self._size = end
+
+    def apply(self, operation, args):
+        """Учет одной мутации системы (вызывается из TransportSystem._record)"""
+        with self._lock:
+            if operation == "board":
+                self.occupancy[self._rows[args[0].id]] += 1
+            elif operation == "alight":
+                self.occupancy[self._rows[args[0].id]] -= 1
+            elif operation == "board_many":
+                self.occupancy[self._rows[args[0].id]] += len(args[1])
+            elif operation == "assign_route":
+                self.route_id[self._rows[args[0].id]] = args[1].id
+            elif operation == "add_transport":
+                self._append([args[0]])
+            elif operation == "add_transports":
+                self._append(list(args[0]))
+
+    def __len__(self):
+        return self._size
+
+    def _column(self, column):
+        size = self._size
+        if column == "occupancy":
+            return self.occupancy[:size]
+        if column == "capacity":
+            return self.capacity[:size]
+        if column == "free":
+            return self.capacity[:size] - self.occupancy[:size]
+        if column == "load":
+            capacity = self.capacity[:size]
+            return np.divide(
+                self.occupancy[:size], capacity,
+                out=np.zeros(size, dtype=np.float64), where=capacity > 0
+            )
+        raise ValueError(f"Неизвестный столбец: {column}; допустимы {', '.join(COLUMNS)}")
+
+    def group_by(self, key, column="occupancy", stat="sum", as_arrays=False):
+        """Агрегат столбца по маршрутам (key="route") или типам (key="type")
+
+        column - occupancy, capacity, free (свободные места) или load
+        (доля занятых мест); stat - sum, mean, max, min или count.
+        Возвращает словарь {маршрут или тип: значение}; при as_arrays=True -
+        пару массивов (ключи, значения). Транспорт без маршрута в
+        группировке по маршрутам попадает в группу 0.
+        """
+        if stat not in STATS:
+            raise ValueError(f"Неизвестная статистика: {stat}; допустимы {', '.join(STATS)}")
+        with self._lock:
+            if key == "route":
+                keys = self.route_id[:self._size].copy()
+            elif key == "type":
+                keys = self.type_code[:self._size].copy()
+            else:
+                raise ValueError(f"Неизвестный ключ группировки: {key}; допустимы route и type")
+            # Копия, чтобы посадки во время расчета не меняли данные под ним
+            values = np.array(self._column(column))
+
+        if not len(keys):
+            groups = keys
+            result = np.zeros(0)
+        else:
+            groups, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            if stat == "count":
+                result = counts
+            elif stat in ("sum", "mean"):
+                result = np.bincount(inverse, weights=values, minlength=len(groups))
+                if stat == "mean":
+                    result = result / counts
+                elif values.dtype.kind == "i":
+                    result = result.astype(np.int64)
+            else:
+                # Максимум и минимум по группам: сортировка по ключу и reduceat по границам групп
+                order = np.argsort(inverse, kind="stable")
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+                reduce = np.maximum if stat == "max" else np.minimum
+                result = reduce.reduceat(values[order], starts)
+
+        if as_arrays:
+            return groups, result
+        if key == "type":
+            return {TYPE_NAMES.get(int(code), "transport"): value for code, value in zip(groups.tolist(), result.tolist())}
+        return dict(zip(groups.tolist(), result.tolist()))
+
+    def _top(self, values, k):
+        """Строки k наибольших значений по убыванию"""
+        k = min(k, len(values))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.argpartition(values, len(values) - k)[len(values) - k:]
+        return rows[np.argsort(values[rows], kind="stable")[::-1]]
+
+    def most_full(self, k=10):
+        """k самых загруженных единиц транспорта: [(id, доля занятых мест)]"""
+        with self._lock:
+            load = self._column("load")
+            rows = self._top(load, k)
+            return list(zip(self.ids[rows].tolist(), load[rows].tolist()))
+
+    def top_free(self, k=10):
+        """k единиц транспорта с наибольшим числом свободных мест: [(id, мест)]"""
+        with self._lock:
+            free = self._column("free")
+            rows = self._top(free, k)
+            return list(zip(self.ids[rows].tolist(), free[rows].tolist()))
+
+    def utilization_by_type(self):
+        """Доля занятых мест по типам: сумма пассажиров / сумма мест"""
+        occupancy = self.group_by("type", "occupancy", "sum")
+        capacity = self.group_by("type", "capacity", "sum")
+        return {
+            name: occupancy[name] / capacity[name] if capacity[name] else 0.0
+            for name in capacity
+        }
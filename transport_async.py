@@ -0,0 +1,230 @@
+"""Асинхронный фасад транспортной системы для сетевых турникетов
+
+Запросы board, alight и assign_route не выполняются сразу, а ставятся
+в очередь своего транспортного средства. Фоновая задача раз в max_delay
+секунд (или как только накопится max_batch запросов) применяет очереди:
+подряд идущие посадки в один транспорт выполняются одним board_many.
+Порядок запросов внутри одного транспорта сохраняется.
+
+При подключенном журнале мутаций пакеты применяются в пуле потоков,
+чтобы fsync не останавливал цикл событий, и после каждого пакета журнал
+сбрасывается на диск одним fsync: ответ на запрос приходит, когда его
+мутация уже записана (групповая фиксация). Так же с базой SQLite
+(TransportSystem.enable_sqlite): пакет фиксируется одной транзакцией.
+Сохранение в файл также выполняется в пуле потоков, по срезу системы,
+поэтому очереди продолжают применяться во время записи.
+
+Пример:
+    async with AsyncTransportSystem(system) as gates:
+        ok = await gates.board(transport_id, passenger_id)
+        await gates.save("transport_data.json")
+"""
+import asyncio
+
+from transport_system import PassengerNotFoundError
+
+
+class AsyncTransportSystem:
+    def __init__(self, system, max_batch=256, max_delay=0.002, executor=None):
+        self.system = system
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.executor = executor
+
+        # id транспорта -> список (операция, аргумент, future) в порядке поступления
+        self._pending = {}
+        self._pending_count = 0
+        self._lock = None
+        self._wakeup = None
+        self._full = None
+        self._worker = None
+
+    async def __aenter__(self):
+        self._start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _start(self):
+        if self._worker is None:
+            self._lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Применение оставшихся запросов и остановка фоновой задачи"""
+        if self._worker is None:
+            return
+        await self.flush()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def _submit(self, transport_id, operation, argument):
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        if self.system.find_transport(transport_id) is None:
+            self.system.events.warning(
+                "Проблема: %s", PassengerNotFoundError(f"Не существует транспорта с ID {transport_id}")
+            )
+            future.set_result(False)
+            return future
+
+        self._pending.setdefault(transport_id, []).append((operation, argument, future))
+        self._pending_count += 1
+        self._wakeup.set()
+        if self._pending_count >= self.max_batch:
+            self._full.set()
+        return future
+
+    def board(self, transport_id, passenger_id):
+        """Посадка пассажира; результат - True/False, как у add_passenger"""
+        return self._submit(transport_id, "board", passenger_id)
+
+    def alight(self, transport_id, passenger_id):
+        """Высадка пассажира; результат - True/False, как у remove_passenger"""
+        return self._submit(transport_id, "alight", passenger_id)
+
+    def assign_route(self, transport_id, route_id):
+        """Назначение маршрута после уже поставленных в очередь посадок и высадок"""
+        return self._submit(transport_id, "assign_route", route_id)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if self._pending_count < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    async def flush(self):
+        """Немедленное применение всех накопленных запросов"""
+        self._start()
+        async with self._lock:
+            await self._flush_locked()
+
+    async def _flush_locked(self):
+        pending, self._pending, self._pending_count = self._pending, {}, 0
+        self._wakeup.clear()
+        self._full.clear()
+        if not pending:
+            return
+
+        try:
+            if self.system.journal is not None or self.system.storage is not None:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._apply, pending
+                )
+            else:
+                results = self._apply(pending)
+        except Exception as e:
+            for requests in pending.values():
+                for _, _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _apply(self, pending):
+        """Применение очередей к системе; возвращает тройки (future, результат, исключение)
+
+        Исключение относится только к своему запросу (или группе посадок
+        одного board_many): уже примененные мутации получают свои
+        результаты. Если не удалось сбросить журнал или базу, исключение
+        получают запросы с результатом True - их мутации могут не
+        сохраниться. Future не трогаются здесь, так как метод может
+        работать вне цикла событий.
+        """
+        system = self.system
+        results = []
+        for transport_id, requests in pending.items():
+            transport = system.find_transport(transport_id)
+            start = 0
+            while start < len(requests):
+                operation, argument, future = requests[start]
+                if operation != "board":
+                    try:
+                        if operation == "alight":
+                            result = transport.remove_passenger(system.find_passenger(argument))
+                        else:
+                            result = system.assign_route_to_transport(transport_id, argument)
+                    except Exception as e:
+                        results.append((future, None, e))
+                    else:
+                        results.append((future, result, None))
+                    start += 1
+                    continue
+
+                end = start
+                while end < len(requests) and requests[end][0] == "board":
+                    end += 1
+                group = requests[start:end]
+                start = end
+                try:
+                    batch = transport.board_many(system.find_passenger(request[1]) for request in group)
+                except Exception as e:
+                    results.extend((future, None, e) for _, _, future in group)
+                    continue
+
+                # board_many принимает первое вхождение пассажира, повторы отклоняются
+                accepted = {passenger.id for passenger in batch.accepted}
+                for _, passenger_id, future in group:
+                    results.append((future, passenger_id in accepted, None))
+                    accepted.discard(passenger_id)
+
+        try:
+            if system.journal is not None:
+                system.journal.sync()
+            if system.storage is not None:
+                system.storage.flush()
+        except Exception as e:
+            results = [
+                (future, None, e) if result is True else (future, result, error)
+                for future, result, error in results
+            ]
+        return results
+
+    async def save(self, filename, **options):
+        """Сохранение в JSON, XML, бинарный снимок или базу SQLite по расширению файла
+
+        Перед записью применяются уже поступившие запросы, поэтому файл
+        содержит все изменения, о которых было сообщено вызывающему коду.
+        Файл пишется по срезу системы (TransportSystem.snapshot), и
+        очереди турникетов продолжают применяться во время записи.
+        Результат - True/False, как у save_to_*: ошибки записи сообщаются
+        через события системы.
+        """
+        self._start()
+        lower = filename.lower()
+        if lower.endswith(".xml"):
+            name = "save_to_xml"
+        elif lower.endswith((".bin", ".tsnp")):
+            name = "save_to_binary"
+        elif lower.endswith((".db", ".sqlite")):
+            name = "save_to_sqlite"
+        else:
+            name = "save_to_json"
+
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            await self._flush_locked()
+            view = await loop.run_in_executor(self.executor, self.system.snapshot)
+        save = getattr(view, name)
+        if self.system.metrics is not None:
+            # Замеряется только вызываемый метод, а не все TIMED_METHODS среза
+            save = self.system.metrics.timed(name, save)
+        return await loop.run_in_executor(self.executor, lambda: save(filename, **options))
@@ -0,0 +1,1404 @@
+"""Замеры производительности транспортной системы
+
+Пример запуска:
+    python transport_benchmark.py json-memory --passengers 1000000
+    python transport_benchmark.py xml-memory --passengers 1000000
+    python transport_benchmark.py save-memory --passengers 1000000
+    python transport_benchmark.py convert --passengers 1000000
+    python transport_benchmark.py boarding --passengers 1000000
+    python transport_benchmark.py passenger-memory --passengers 1000000
+    python transport_benchmark.py snapshot --passengers 1000000
+    python transport_benchmark.py concurrency --passengers 200000 --threads 1 2 4 8
+    python transport_benchmark.py async-gates --gates 2000 --requests 200000
+    python transport_benchmark.py live-save --passengers 1000000
+    python transport_benchmark.py shards --passengers 1000000 --shards 8 --workers 1 2 4 8
+    python transport_benchmark.py segments --passengers 1000000 --changes 10 1000 100000
+    python transport_benchmark.py metrics --passengers 200000
+    python transport_benchmark.py journeys --stops 5000 --routes 20000
+    python transport_benchmark.py analytics --vehicles 300000
+    python transport_benchmark.py report --passengers 1000000
+    python transport_benchmark.py queries --passengers 200000 --writes 0.01 0.1
+    python transport_benchmark.py indexes --passengers 1000000
+    python transport_benchmark.py snils --records 2000000 --check test_snils.txt
+    python transport_benchmark.py sqlite --passengers 1000000 --batches 1 100 1000
+    python transport_benchmark.py suite --scales 1000 100000 --output results.json
+    python transport_benchmark.py suite --output new.json --compare results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import heapq
+import platform
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+import transport_cache
+from transport_async import AsyncTransportSystem
+from transport_generator import generate_system
+from transport_snapshot import convert_to_snapshot, open_snapshot
+from transport_system import Bus, Passenger, Route, SilentSink, StdoutSink, TransportSystem
+
+
+def peak_rss_kb():
+    """Пиковый объем резидентной памяти процесса в КБ"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def write_sample_json(filename, passengers, per_transport=50):
+    """Запись синтетического снимка в JSON без построения объектов"""
+    transports = max(1, (passengers + per_transport - 1) // per_transport)
+    routes = max(1, transports // 10)
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('{\n  "transport_system": {\n    "transports": [\n')
+        for i in range(transports):
+            first = i * per_transport + 1
+            last = min(passengers, first + per_transport - 1)
+            record = {
+                "id": i + 1,
+                "type": "bus",
+                "name": f"Автобус {i + 1}",
+                "capacity": per_transport,
+                "bus_number": f"A{i + 1}",
+                "line_number": None,
+                "carriages": None,
+                "route_id": i % routes + 1,
+                "passengers": list(range(first, last + 1))
+            }
+            f.write(("      " if i == 0 else ",\n      ") + json.dumps(record, ensure_ascii=False))
+        f.write('\n    ],\n    "passengers": [\n')
+        for i in range(1, passengers + 1):
+            record = {"id": i, "name": f"Пассажир {i}", "ticket_number": f"T{i:08d}"}
+            f.write(("      " if i == 1 else ",\n      ") + json.dumps(record, ensure_ascii=False))
+        f.write('\n    ],\n    "routes": [\n')
+        for i in range(1, routes + 1):
+            record = {"id": i, "start_point": f"Остановка {i}", "end_point": f"Остановка {i + 1}"}
+            f.write(("      " if i == 1 else ",\n      ") + json.dumps(record, ensure_ascii=False))
+        f.write('\n    ]\n  }\n}\n')
+
+
+def write_sample_xml(filename, passengers, per_transport=50):
+    """Запись синтетического снимка в XML в порядке секций штатного писателя"""
+    transports = max(1, (passengers + per_transport - 1) // per_transport)
+    routes = max(1, transports // 10)
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<transport_system><transports>")
+        for i in range(transports):
+            first = i * per_transport + 1
+            last = min(passengers, first + per_transport - 1)
+            ids = "".join(f"<passenger_id>{p}</passenger_id>" for p in range(first, last + 1))
+            f.write(
+                f"<transport><id>{i + 1}</id><type>bus</type>"
+                f"<name>{escape(f'Автобус {i + 1}')}</name><capacity>{per_transport}</capacity>"
+                f"<bus_number>A{i + 1}</bus_number><route_id>{i % routes + 1}</route_id>"
+                f"<passengers>{ids}</passengers></transport>"
+            )
+        f.write("</transports><passengers>")
+        for i in range(1, passengers + 1):
+            f.write(
+                f"<passenger><id>{i}</id><name>Пассажир {i}</name>"
+                f"<ticket_number>T{i:08d}</ticket_number></passenger>"
+            )
+        f.write("</passengers><routes>")
+        for i in range(1, routes + 1):
+            f.write(
+                f"<route><id>{i}</id><start_point>Остановка {i}</start_point>"
+                f"<end_point>Остановка {i + 1}</end_point></route>"
+            )
+        f.write("</routes></transport_system>")
+
+
+_SAMPLE_WRITERS = {"json": write_sample_json, "xml": write_sample_xml}
+
+
+def _run_child(args):
+    """Выполнение замера в отдельном процессе, чтобы пик памяти не смешивался"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)] + args,
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _child_load(filename, file_format, stream):
+    rss_before = peak_rss_kb()
+    system = TransportSystem(events=SilentSink())
+    load = system.load_from_json if file_format == "json" else system.load_from_xml
+    start = time.perf_counter()
+    load(filename, stream=stream)
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        "seconds": seconds,
+        "rss_before_kb": rss_before,
+        "rss_peak_kb": peak_rss_kb(),
+        "passengers": len(system.passengers),
+    }))
+
+
+def _child_save(filename, file_format, stream):
+    system = TransportSystem(events=SilentSink())
+    system.load_from_json(filename, stream=True)
+    rss_before = peak_rss_kb()
+    output = f"{filename}.out"
+    start = time.perf_counter()
+    if file_format == "json":
+        system.save_to_json(output, stream=stream)
+    else:
+        system.save_to_xml(output, stream=stream)
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        "seconds": seconds,
+        "rss_before_kb": rss_before,
+        "rss_peak_kb": peak_rss_kb(),
+        "output_kb": os.path.getsize(output) / 1024,
+    }))
+
+
+def _child_convert(source, target, mode):
+    from transport_convert import convert
+
+    rss_before = peak_rss_kb()
+    start = time.perf_counter()
+    if mode == "objects":
+        system = TransportSystem(events=SilentSink())
+        if source.endswith(".xml"):
+            system.load_from_xml(source, stream=True)
+        else:
+            system.load_from_json(source, stream=True)
+        if target.endswith(".xml"):
+            system.save_to_xml(target, stream=True)
+        else:
+            system.save_to_json(target, stream=True)
+    else:
+        convert(source, target, validate=mode == "validate")
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        "seconds": seconds,
+        "rss_before_kb": rss_before,
+        "rss_peak_kb": peak_rss_kb(),
+        "output_kb": os.path.getsize(target) / 1024,
+    }))
+
+
+def bench_convert(passengers):
+    """JSON <-> XML: загрузка в TransportSystem и запись против потокового преобразования"""
+    from transport_convert import convert
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "transport.json")
+        xml_path = os.path.join(tmp, "transport.xml")
+        write_sample_json(json_path, passengers)
+        convert(json_path, xml_path)
+        print(f"Пассажиров: {passengers}, JSON {os.path.getsize(json_path) / 2 ** 20:.1f} МБ, "
+              f"XML {os.path.getsize(xml_path) / 2 ** 20:.1f} МБ")
+        for label, source, target, mode in (
+            ("json -> xml через объекты", json_path, "out.xml", "objects"),
+            ("json -> xml", json_path, "out.xml", "direct"),
+            ("json -> xml с проверкой", json_path, "out.xml", "validate"),
+            ("json -> xml.gz", json_path, "out.xml.gz", "direct"),
+            ("json -> xml.xz", json_path, "out.xml.xz", "direct"),
+            ("xml -> json через объекты", xml_path, "out.json", "objects"),
+            ("xml -> json", xml_path, "out.json", "direct"),
+            ("xml -> json с проверкой", xml_path, "out.json", "validate"),
+        ):
+            result = _run_child(["_convert", source, os.path.join(tmp, target), "--mode", mode])
+            growth_kb = result["rss_peak_kb"] - result["rss_before_kb"]
+            print(
+                f" {label:>26}: {result['seconds']:.2f} с, прирост RSS {growth_kb / 1024:.1f} МБ, "
+                f"файл {result['output_kb'] / 1024:.1f} МБ"
+            )
+    return 0
+
+
+def bench_save_memory(passengers):
+    """Прирост пиковой памяти при сохранении: полный документ против потоковой записи"""
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "snapshot.json")
+        write_sample_json(filename, passengers)
+        print(f"Пассажиров: {passengers}")
+        for file_format in ("json", "xml"):
+            for mode, extra in (("full", []), ("stream", ["--stream"])):
+                result = _run_child(["_save", filename, "--format", file_format] + extra)
+                growth_kb = result["rss_peak_kb"] - result["rss_before_kb"]
+                print(
+                    f" {file_format} {mode:>6}: {result['seconds']:.2f} с, "
+                    f"прирост RSS {growth_kb / 1024:.1f} МБ "
+                    f"(файл {result['output_kb'] / 1024:.1f} МБ)"
+                )
+    return 0
+
+
+def bench_boarding(passengers, per_transport=1000):
+    """Поштучная посадка через add_passenger против пакетной board_many
+
+    Поштучный путь замеряется и с выводом сообщений (в /dev/null), как
+    он работает по умолчанию, и с отключенным выводом.
+    """
+    riders = [Passenger(i, f"Пассажир {i}", f"T{i:08d}") for i in range(1, passengers + 1)]
+    transports = (passengers + per_transport - 1) // per_transport
+    batches = [riders[i:i + per_transport] for i in range(0, passengers, per_transport)]
+
+    timings = {}
+    devnull = open(os.devnull, 'w')
+    modes = (
+        ("add_passenger", StdoutSink(stream=devnull)),
+        ("add_passenger (тихо)", SilentSink()),
+        ("board_many", SilentSink()),
+    )
+    for mode, events in modes:
+        system = TransportSystem(events=events)
+        system.add_passengers(riders)
+        system.add_transports(
+            Bus(i + 1, f"Автобус {i + 1}", per_transport, f"A{i + 1}") for i in range(transports)
+        )
+        start = time.perf_counter()
+        if mode.startswith("add_passenger"):
+            for transport, batch in zip(system.transports, batches):
+                for passenger in batch:
+                    transport.add_passenger(passenger)
+        else:
+            for transport, batch in zip(system.transports, batches):
+                transport.board_many(batch)
+        timings[mode] = time.perf_counter() - start
+        print(f" {mode:>20}: {timings[mode]:.3f} с, {passengers / timings[mode]:,.0f} пасс/с")
+    devnull.close()
+
+    for mode, _ in modes[:2]:
+        print(f" Ускорение board_many относительно {mode}: {timings[mode] / timings['board_many']:.1f} x")
+    return 0
+
+
+def _gate(system, riders, seed):
+    """Турникет: случайные посадки и высадки в общей системе"""
+    rng = random.Random(seed)
+    transports = system.transports
+    operations = 0
+    for passenger in riders:
+        transport = rng.choice(transports)
+        transport.add_passenger(passenger)
+        if rng.random() < 0.3:
+            transport.remove_passenger(passenger)
+        operations += 1
+    return operations
+
+
+def _check_boarding(system):
+    """Вместимость не превышена, каждый пассажир находится не более чем в одном транспорте"""
+    seen = {}
+    for transport in system.transports:
+        if len(transport.passengers) > transport.capacity:
+            return f"{transport.name}: {len(transport.passengers)} из {transport.capacity}"
+        for passenger in transport.passengers:
+            if passenger.id in seen:
+                return f"{passenger.name} сразу в {seen[passenger.id]} и {transport.name}"
+            seen[passenger.id] = transport.name
+            if system.find_passenger_transport(passenger.id) is not transport:
+                return f"Индекс расположения не совпадает для {passenger.name}"
+    if len(seen) != len(system._passenger_locations):
+        return "В индексе расположения есть лишние пассажиры"
+    return None
+
+
+def bench_concurrency(passengers, thread_counts, vehicles=200, capacity=20):
+    """Посадка из пула потоков в общую систему с малой вместимостью транспорта
+
+    Каждый поток получает свой набор пассажиров и часть из них дважды, чтобы
+    потоки соревновались за одних и тех же людей и за последние места.
+    """
+    riders = [Passenger(i, f"Пассажир {i}", f"T{i:08d}") for i in range(1, passengers + 1)]
+    status = 0
+    for threads in thread_counts:
+        system = TransportSystem(events=SilentSink())
+        system.add_passengers(riders)
+        system.add_transports(
+            Bus(i + 1, f"Автобус {i + 1}", capacity, f"A{i + 1}") for i in range(vehicles)
+        )
+        shares = [riders[i::threads] + riders[:passengers // 10] for i in range(threads)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            operations = sum(pool.map(_gate, [system] * threads, shares, range(threads)))
+        elapsed = time.perf_counter() - start
+
+        problem = _check_boarding(system)
+        print(
+            f" потоков {threads:>2}: {elapsed:.3f} с, {operations / elapsed:,.0f} опер/с, "
+            f"{'ошибка: ' + problem if problem else 'вместимость соблюдена'}"
+        )
+        if problem:
+            status = 1
+    return status
+
+
+class _DirectGates:
+    """Прямые синхронные вызовы в цикле событий (для сравнения с фасадом)"""
+
+    def __init__(self, system):
+        self.system = system
+
+    async def board(self, transport_id, passenger_id):
+        transport = self.system.find_transport(transport_id)
+        return transport.add_passenger(self.system.find_passenger(passenger_id))
+
+    async def alight(self, transport_id, passenger_id):
+        transport = self.system.find_transport(transport_id)
+        return transport.remove_passenger(self.system.find_passenger(passenger_id))
+
+
+async def _fake_gate(gates, rng, passengers, vehicles, requests, think, latencies):
+    """Турникет: посадка, иногда высадка, с паузой до think секунд между запросами"""
+    loop = asyncio.get_running_loop()
+    for _ in range(requests):
+        transport_id = rng.randint(1, vehicles)
+        passenger_id = rng.randint(1, passengers)
+        start = loop.time()
+        if await gates.board(transport_id, passenger_id) and rng.random() < 0.5:
+            await gates.alight(transport_id, passenger_id)
+        latencies.append(loop.time() - start)
+        await asyncio.sleep(rng.random() * think)
+
+
+async def _drive_gates(gates_count, requests, think, passengers, vehicles, facade, journal, save_to):
+    system = TransportSystem(events=SilentSink())
+    system.add_passengers(Passenger(i, f"Пассажир {i}", f"T{i:08d}") for i in range(1, passengers + 1))
+    system.add_transports(Bus(i, f"Автобус {i}", 50, f"A{i}") for i in range(1, vehicles + 1))
+    if journal is not None:
+        # Напрямую каждая мутация фиксируется своим fsync, фасад делает fsync на пакет
+        system.enable_journal(journal, fsync_every=10 ** 9 if facade else 1, fsync_interval=None)
+
+    latencies = []
+    per_gate = max(1, requests // gates_count)
+
+    async def drive(gates):
+        start = time.perf_counter()
+        tasks = [
+            _fake_gate(gates, random.Random(seed), passengers, vehicles, per_gate, think, latencies)
+            for seed in range(gates_count)
+        ]
+        if save_to is not None:
+            tasks.append(gates.save(save_to))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    try:
+        if not facade:
+            return latencies, await drive(_DirectGates(system))
+        async with AsyncTransportSystem(system) as gates:
+            return latencies, await drive(gates)
+    finally:
+        system.disable_journal()
+
+
+def bench_async_gates(gates_count, requests, think, passengers=100000, vehicles=100):
+    """Задержка и пропускная способность асинхронного фасада под нагрузкой турникетов
+
+    Для сравнения те же турникеты вызывают систему напрямую, в памяти и
+    с журналом мутаций; последний замер запускает сохранение JSON посреди
+    нагрузки.
+    """
+    print(f"Турникетов: {gates_count}, запросов: {requests}, пауза до {think * 1000:.0f} мс")
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = os.path.join(tmp, "journal")
+        for label, facade, journal_dir, save_to in (
+            ("напрямую", False, None, None),
+            ("фасад", True, None, None),
+            ("напрямую + журнал", False, journal, None),
+            ("фасад + журнал", True, journal, None),
+            ("фасад + save", True, None, os.path.join(tmp, "snapshot.json")),
+        ):
+            latencies, elapsed = asyncio.run(_drive_gates(
+                gates_count, requests, think, passengers, vehicles, facade, journal_dir, save_to
+            ))
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            print(
+                f" {label:>18}: {len(latencies) / elapsed:,.0f} запр/с, "
+                f"p50 {p50:.2f} мс, p99 {p99:.2f} мс, макс {latencies[-1] * 1000:.2f} мс"
+            )
+    return 0
+
+
+def _suite_operations(system, tmp, lookups, rng):
+    """Операции набора замеров: (имя, число операций, функция)"""
+    transport_ids = [rng.randint(1, len(system.transports)) for _ in range(lookups)]
+    passenger_ids = [rng.randint(1, len(system.passengers)) for _ in range(lookups)]
+    route_ids = [rng.randint(1, len(system.routes)) for _ in range(lookups)]
+    boarded = [
+        (transport, passenger)
+        for transport in system.transports for passenger in transport.passengers
+    ]
+    boarded = rng.sample(boarded, min(lookups, len(boarded)))
+
+    def find(method, ids):
+        def run():
+            for record_id in ids:
+                method(record_id)
+        return run
+
+    def remove():
+        for transport, passenger in boarded:
+            transport.remove_passenger(passenger)
+
+    def add():
+        for transport, passenger in boarded:
+            transport.add_passenger(passenger)
+
+    def show():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            system.show_system_info()
+
+    operations = [
+        ("find_transport", lookups, find(system.find_transport, transport_ids)),
+        ("find_passenger", lookups, find(system.find_passenger, passenger_ids)),
+        ("find_route", lookups, find(system.find_route, route_ids)),
+        ("remove_passenger", len(boarded), remove),
+        ("add_passenger", len(boarded), add),
+        ("show_system_info", 1, show),
+    ]
+    for file_format in ("json", "xml"):
+        filename = os.path.join(tmp, f"suite.{file_format}")
+        save = getattr(system, f"save_to_{file_format}")
+        load = getattr(TransportSystem(events=SilentSink()), f"load_from_{file_format}")
+        for stream in (False, True):
+            suffix = " stream" if stream else ""
+            operations.append((
+                f"save_to_{file_format}{suffix}", 1, lambda save=save, stream=stream: save(filename, stream=stream)
+            ))
+            operations.append((
+                f"load_from_{file_format}{suffix}", 1, lambda load=load, stream=stream: load(filename, stream=stream)
+            ))
+    return operations
+
+
+def _child_suite(scale, seed, lookups, repeat, memory):
+    """Замеры одного масштаба: лучшее время из repeat прогонов и пик памяти tracemalloc
+
+    Операции выполняются по кругу (высадка, затем посадка тех же
+    пассажиров), поэтому каждый прогон начинается с того же состояния.
+    """
+    rng = random.Random(seed)
+
+    start = time.perf_counter()
+    system = generate_system(passengers=scale, seed=seed)
+    records = [{"operation": "generate_system", "count": 1, "seconds": time.perf_counter() - start}]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        operations = _suite_operations(system, tmp, lookups, rng)
+        timings = {name: [] for name, _, _ in operations}
+        for _ in range(repeat):
+            for name, _, run in operations:
+                start = time.perf_counter()
+                run()
+                timings[name].append(time.perf_counter() - start)
+
+        # Отдельный прогон под tracemalloc, чтобы трассировка не искажала время
+        peaks = {}
+        if memory:
+            tracemalloc.start()
+            for name, _, run in operations:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                run()
+                peaks[name] = (tracemalloc.get_traced_memory()[1] - base) / 1024
+            tracemalloc.stop()
+
+    for name, count, _ in operations:
+        record = {"operation": name, "count": count, "seconds": min(timings[name])}
+        if count > 1:
+            record["per_op_us"] = record["seconds"] / count * 1e6
+        if name in peaks:
+            record["peak_kb"] = peaks[name]
+        records.append(record)
+
+    print(json.dumps({"scale": scale, "rss_peak_kb": peak_rss_kb(), "operations": records}))
+
+
+def _compare_results(results, baseline_file, threshold, min_seconds=0.001):
+    """Сравнение с прошлым прогоном; регрессия - замедление больше threshold раз
+
+    Замеры короче min_seconds в прошлом прогоне слишком шумные и не сравниваются.
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {
+        (run["scale"], record["operation"]): record["seconds"]
+        for run in baseline["runs"] for record in run["operations"]
+    }
+
+    regressions = 0
+    print(f"Сравнение с {baseline_file} (порог {threshold:.2f} x):")
+    for run in results["runs"]:
+        for record in run["operations"]:
+            old = previous.get((run["scale"], record["operation"]))
+            if not old or old < min_seconds:
+                continue
+            ratio = record["seconds"] / old
+            mark = ""
+            if ratio > threshold:
+                mark = "  <- регрессия"
+                regressions += 1
+            print(f" {run['scale']:>9} {record['operation']:>22}: {ratio:.2f} x{mark}")
+    return 1 if regressions else 0
+
+
+def bench_suite(scales, seed, lookups, repeat, memory, output, compare, threshold):
+    """Набор замеров на сгенерированных системах разного размера
+
+    Каждый масштаб замеряется в отдельном процессе; результаты
+    сохраняются в JSON для сравнения между запусками (--compare).
+    """
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "lookups": lookups,
+        "repeat": repeat,
+        "runs": []
+    }
+    for scale in scales:
+        args = [
+            "_suite", str(scale), "--seed", str(seed),
+            "--lookups", str(lookups), "--repeat", str(repeat)
+        ]
+        run = _run_child(args + ([] if memory else ["--no-memory"]))
+        results["runs"].append(run)
+
+        print(f"Масштаб {scale} пассажиров, пик RSS {run['rss_peak_kb'] / 1024:.1f} МБ")
+        for record in run["operations"]:
+            line = f" {record['operation']:>22}: {record['seconds']:.4f} с"
+            if "per_op_us" in record:
+                line += f" ({record['per_op_us']:.2f} мкс/опер)"
+            if "peak_kb" in record:
+                line += f", пик {record['peak_kb'] / 1024:.1f} МБ"
+            print(line)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {output}")
+    if compare:
+        return _compare_results(results, compare, threshold)
+    return 0
+
+
+def bench_sqlite(passengers, batch_sizes, boardings=20000, lookups=1000, seed=1):
+    """База SQLite: запись, открытие с поиском по индексам и дозапись посадок"""
+    from transport_sqlite import open_database
+
+    system = generate_system(passengers=passengers, occupancy=0.3, seed=seed)
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "transport.json")
+        db_path = os.path.join(tmp, "transport.db")
+
+        start = time.perf_counter()
+        system.save_to_json(json_path, stream=True, compact=True)
+        print(f"Пассажиров: {passengers}, запись JSON: {time.perf_counter() - start:.2f} с", end="")
+        start = time.perf_counter()
+        system.save_to_sqlite(db_path)
+        print(f", запись базы: {time.perf_counter() - start:.2f} с")
+
+        loaded = TransportSystem(events=SilentSink())
+        start = time.perf_counter()
+        loaded.load_from_json(json_path, stream=True)
+        print(f" полная загрузка JSON: {time.perf_counter() - start:.2f} с")
+        start = time.perf_counter()
+        loaded.load_from_sqlite(db_path)
+        print(f" полная загрузка базы: {time.perf_counter() - start:.2f} с")
+        del loaded
+
+        tickets = [system.passengers[rng.randrange(passengers)].ticket_number for _ in range(lookups)]
+        transport_ids = [rng.choice(system.transports).id for _ in range(lookups)]
+        start = time.perf_counter()
+        with open_database(db_path) as db:
+            opened = time.perf_counter() - start
+            start = time.perf_counter()
+            for ticket_number in tickets:
+                db.find_passenger_by_ticket(ticket_number)
+            by_ticket = (time.perf_counter() - start) / lookups
+            start = time.perf_counter()
+            for transport_id in transport_ids:
+                db.find_transport(transport_id)
+            by_transport = (time.perf_counter() - start) / lookups
+        print(f" открытие базы: {opened * 1000:.2f} мс, пассажир по билету: {by_ticket * 1e6:.0f} мкс, "
+              f"транспорт с пассажирами: {by_transport * 1e6:.0f} мкс")
+
+        # Посадка и высадка с дозаписью в базу при разном размере транзакции
+        seated = [
+            (transport, passenger)
+            for transport in system.transports for passenger in list(transport.passengers)[:1]
+        ][:boardings // 2]
+        system.set_event_sink(SilentSink())
+        for batch_size in [None] + list(batch_sizes):
+            if batch_size is not None:
+                system.enable_sqlite(db_path, batch_size=batch_size, flush_interval=None, replace=False)
+            start = time.perf_counter()
+            for transport, passenger in seated:
+                transport.remove_passenger(passenger)
+                transport.add_passenger(passenger)
+            system.disable_sqlite()
+            elapsed = time.perf_counter() - start
+            label = "без базы" if batch_size is None else f"транзакция на {batch_size}"
+            print(f" {label:>20}: {len(seated) * 2 / elapsed:,.0f} мутаций/с")
+    return 0
+
+
+def bench_snils(records, check_file=None, seed=1):
+    """Пакетная проверка СНИЛС на NumPy против поштучной проверки"""
+    from transport_snils import check_samples, read_samples, validate_snils
+    from transport_system import snils_checksum, snils_reason
+
+    if check_file:
+        samples = read_samples(check_file)
+        mismatches = check_samples(samples)
+        print(f"Проверка номеров из {check_file}: {len(samples)}, расхождений: {len(mismatches)}")
+        for number, expected, reason, scalar in mismatches:
+            print(f" {number}: коды {reason} / {scalar}, в файле отмечен как "
+                  + ("корректный" if expected else "некорректный"))
+
+    rng = random.Random(seed)
+    numbers = []
+    for _ in range(records):
+        number = rng.randrange(10 ** 9)
+        checksum = snils_checksum(number) if rng.random() < 0.9 else rng.randrange(100)
+        digits = f"{number:09d}"
+        numbers.append(f"{digits[:3]}-{digits[3:6]}-{digits[6:]} {checksum:02d}")
+
+    start = time.perf_counter()
+    result = validate_snils(numbers)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    reference = [snils_reason(number) for number in numbers]
+    looped = time.perf_counter() - start
+    print(f"Номеров: {records}, корректных: {int(result.valid.sum())}")
+    print(f" NumPy: {vectorized:.2f} с, цикл Python: {looped:.2f} с, "
+          f"результаты совпадают: {result.reasons.tolist() == reference}")
+    return 0
+
+
+def bench_indexes(passengers, lookups=1000, seed=1):
+    """Поиск по билету, маршруту и типу: полный обход против вторичных индексов"""
+    system = generate_system(passengers=passengers, seed=seed)
+    rng = random.Random(seed)
+    tickets = [system.passengers[rng.randrange(passengers)].ticket_number for _ in range(lookups)]
+    route_ids = [rng.choice(system.routes).id for _ in range(lookups)]
+    types = [rng.choice(("bus", "tram", "train")) for _ in range(lookups)]
+
+    def scan_ticket(ticket_number):
+        return next((p for p in system.passengers if p.ticket_number == ticket_number), None)
+
+    def scan_route(route_id):
+        return [t for t in system.transports if t.route is not None and t.route.id == route_id]
+
+    def scan_type(transport_type):
+        return [t for t in system.transports if t.type == transport_type]
+
+    print(f"Пассажиров: {passengers}, транспорта: {len(system.transports)}")
+    for label, keys, scan, index in (
+        ("пассажир по билету", tickets, scan_ticket, system.find_passenger_by_ticket),
+        ("транспорт маршрута", route_ids, scan_route, system.find_transports_on_route),
+        ("транспорт по типу", types, scan_type, system.find_transports_by_type),
+    ):
+        # Полный обход медленный, поэтому замеряется на части ключей
+        scanned = keys[:max(1, len(keys) // 50)]
+        start = time.perf_counter()
+        for key in scanned:
+            scan(key)
+        scan_time = (time.perf_counter() - start) / len(scanned)
+        start = time.perf_counter()
+        for key in keys:
+            index(key)
+        index_time = (time.perf_counter() - start) / len(keys)
+        print(f" {label:>20}: обход {scan_time * 1e6:.0f} мкс, индекс {index_time * 1e6:.2f} мкс")
+    return 0
+
+
+def bench_queries(passengers, write_shares, requests=20000, seed=1):
+    """Запросы панели мониторинга с кэшем и без при разной доле посадок
+
+    Запись - высадка сидящего пассажира и его повторная посадка: она
+    всегда меняет систему (и сбрасывает кэш), а состояние после прохода
+    остается прежним.
+    """
+    system = generate_system(passengers=passengers, occupancy=0.4, seed=seed)
+    route_ids = [route.id for route in system.routes]
+    transports = system.transports
+    seated = [(transport, passenger) for transport in transports for passenger in transport.passengers]
+    print(f"Пассажиров: {passengers}, транспорта: {len(transports)}, запросов: {requests}")
+
+    for share in write_shares:
+        rng = random.Random(seed)
+        plan = []
+        for _ in range(requests):
+            if seated and rng.random() < share:
+                plan.append(("write",) + rng.choice(seated))
+            else:
+                plan.append((rng.choice(("route", "riders", "occupancy", "totals")),
+                             rng.choice(route_ids), rng.choice(transports).id))
+
+        for mode in ("без кэша", "с кэшем"):
+            if mode == "с кэшем":
+                queries = system.enable_query_cache()
+            else:
+                system.disable_query_cache()
+                queries = None
+            writes = 0
+            start = time.perf_counter()
+            for kind, first, second in plan:
+                if kind == "write":
+                    writes += first.remove_passenger(second)
+                    writes += first.add_passenger(second)
+                elif queries is None:
+                    if kind == "route":
+                        transport_cache.vehicles_on_route(system, first)
+                    elif kind == "riders":
+                        transport_cache.riders(system, second)
+                    elif kind == "occupancy":
+                        transport_cache.occupancy_by_route(system)
+                    else:
+                        transport_cache.totals(system)
+                elif kind == "route":
+                    queries.vehicles_on_route(first)
+                elif kind == "riders":
+                    queries.riders(second)
+                elif kind == "occupancy":
+                    queries.occupancy_by_route()
+                else:
+                    queries.totals()
+            elapsed = time.perf_counter() - start
+            line = f" посадок {share:.0%}, {mode:>8}: {elapsed:.3f} с, {elapsed / requests * 1e6:.1f} мкс/запрос, мутаций {writes}"
+            if queries is not None:
+                stats = queries.stats()
+                line += f", попаданий {stats['hit_ratio']:.0%}"
+            print(line)
+        system.disable_query_cache()
+    return 0
+
+
+def _board_loop(pairs, stop, gate, latencies):
+    """Писатель: высадка и повторная посадка пассажиров, пока не выставлен stop"""
+    while not stop.is_set():
+        for transport, passenger in pairs:
+            start = time.perf_counter()
+            with gate:
+                transport.remove_passenger(passenger)
+                transport.add_passenger(passenger)
+            latencies.append(time.perf_counter() - start)
+            if stop.is_set():
+                break
+
+
+def _check_saved(filename, system):
+    """Каждый пассажир в файле не более чем в одном транспорте, вместимость соблюдена"""
+    with open(filename, encoding='utf-8') as f:
+        data = json.load(f)["transport_system"]
+    seen = set()
+    for transport in data["transports"]:
+        if len(transport["passengers"]) > transport["capacity"]:
+            return f"транспорт {transport['id']} переполнен"
+        if not seen.isdisjoint(transport["passengers"]):
+            return f"пассажир в двух транспортных средствах (транспорт {transport['id']})"
+        seen.update(transport["passengers"])
+    if len(data["passengers"]) != len(system.passengers):
+        return "записаны не все пассажиры"
+    return None
+
+
+def bench_live_save(passengers, seed=1):
+    """Задержка посадки в другом потоке во время записи большого JSON
+
+    Сравниваются: посадка без записи; запись с остановкой посадки на все
+    время записи (общая блокировка); запись по срезу snapshot() при
+    идущей посадке; запись прямо из живых списков, без среза.
+    """
+    from transport_system import _write_json_stream
+
+    system = generate_system(passengers=passengers, occupancy=0.3, seed=seed)
+    pairs = [
+        (transport, passenger)
+        for transport in system.transports for passenger in list(transport.passengers)[:1]
+    ]
+    system.set_event_sink(SilentSink())
+    repeats = 20
+    start = time.perf_counter()
+    for _ in range(repeats):
+        system.snapshot()
+    print(f"Пассажиров: {passengers}, транспорта: {len(system.transports)}, "
+          f"срез: {(time.perf_counter() - start) / repeats * 1000:.2f} мс")
+
+    def save_live(filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            _write_json_stream(f, TransportSystem._json_sections(system), compact=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "transport.json")
+        start = time.perf_counter()
+        system.save_to_json(filename, stream=True, compact=True)
+        duration = time.perf_counter() - start
+
+        for label, gate, save in (
+            ("без записи", None, None),
+            ("пауза посадки", threading.Lock(), lambda: system.save_to_json(filename, stream=True, compact=True)),
+            ("по срезу", None, lambda: system.save_to_json(filename, stream=True, compact=True)),
+            ("живые списки", None, lambda: save_live(filename)),
+        ):
+            latencies = []
+            stop = threading.Event()
+            writer = threading.Thread(
+                target=_board_loop,
+                args=(pairs, stop, gate or contextlib.nullcontext(), latencies)
+            )
+            writer.start()
+            time.sleep(0.05)
+            start = time.perf_counter()
+            problem = None
+            if save is None:
+                time.sleep(duration)
+            else:
+                try:
+                    if gate is not None:
+                        with gate:
+                            save()
+                    else:
+                        save()
+                    problem = _check_saved(filename, system)
+                except (RuntimeError, ValueError) as e:
+                    problem = str(e)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            writer.join()
+
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            print(
+                f" {label:>13}: запись {elapsed:.2f} с, посадок {len(latencies) / elapsed:,.0f}/с, "
+                f"p50 {p50:.3f} мс, p99 {p99:.3f} мс, макс {latencies[-1] * 1000:.1f} мс, "
+                f"{'ошибка: ' + problem if problem else 'файл согласован'}"
+            )
+    return 0
+
+
+def bench_report(passengers):
+    """Полный отчет против сводки и одной страницы с фильтром"""
+    system = generate_system(passengers=passengers, seed=1)
+    route_id = system.routes[0].id
+    for label, options in (
+        ("полный отчет (show_system_info)", {}),
+        ("только сводка", {"summary_only": True}),
+        ("страница 50 единиц транспорта", {"sections": ("transports",), "limit": 50}),
+        ("поезда с загрузкой от 50%, 50 шт.", {
+            "sections": ("transports",), "transport_type": "train", "min_occupancy": 0.5, "limit": 50
+        }),
+        (f"пассажиры маршрута {route_id}, 100 шт.", {
+            "sections": ("passengers",), "route_id": route_id, "limit": 100
+        }),
+    ):
+        with open(os.devnull, 'w', encoding='utf-8') as sink:
+            start = time.perf_counter()
+            system.write_report(sink, **options)
+            elapsed = time.perf_counter() - start
+        print(f" {label:>36}: {elapsed * 1000:.2f} мс")
+    return 0
+
+
+def bench_analytics(vehicles, passengers_per_vehicle=3, seed=1):
+    """Агрегаты по парку: цикл по transports против столбцов NumPy"""
+    system = generate_system(
+        passengers=vehicles * passengers_per_vehicle, transports=vehicles,
+        routes=max(1, vehicles // 20), occupancy=0.05, seed=seed
+    )
+    start = time.perf_counter()
+    analytics = system.enable_analytics()
+    if analytics is None:
+        return 1
+    print(f"Транспорта: {vehicles}, построение столбцов: {time.perf_counter() - start:.3f} с")
+
+    def loop_free_by_route():
+        free = {}
+        for transport in system.transports:
+            key = transport.route.id if transport.route else 0
+            free[key] = free.get(key, 0) + transport.capacity - len(transport.passengers)
+        return free
+
+    def loop_load_by_type():
+        totals = {}
+        for transport in system.transports:
+            occupied, seats = totals.get(transport.type, (0, 0))
+            totals[transport.type] = (occupied + len(transport.passengers), seats + transport.capacity)
+        return {name: occupied / seats for name, (occupied, seats) in totals.items()}
+
+    def loop_most_full():
+        return heapq.nlargest(
+            10, ((len(t.passengers) / t.capacity, t.id) for t in system.transports)
+        )
+
+    for label, loop, vectorized in (
+        ("свободные места по маршрутам", loop_free_by_route,
+         lambda: analytics.group_by("route", "free", "sum")),
+        ("загрузка по типам", loop_load_by_type, analytics.utilization_by_type),
+        ("10 самых загруженных", loop_most_full, lambda: analytics.most_full(10)),
+        ("макс. пассажиров по маршрутам", None,
+         lambda: analytics.group_by("route", "occupancy", "max", as_arrays=True)),
+    ):
+        line = f" {label:>30}:"
+        if loop is not None:
+            start = time.perf_counter()
+            loop()
+            looped = time.perf_counter() - start
+            line += f" цикл {looped * 1000:.1f} мс,"
+        start = time.perf_counter()
+        vectorized()
+        line += f" NumPy {(time.perf_counter() - start) * 1000:.1f} мс"
+        print(line)
+
+    # Стоимость поддержания столбцов: высадка и обратная посадка уже сидящих пассажиров
+    seated = [
+        (transport, passenger)
+        for transport in system.transports[:50000] for passenger in list(transport.passengers)[:1]
+    ]
+    for mode in ("без аналитики", "с аналитикой"):
+        if mode == "без аналитики":
+            system.disable_analytics()
+        else:
+            system.enable_analytics()
+        start = time.perf_counter()
+        for transport, passenger in seated:
+            transport.remove_passenger(passenger)
+        for transport, passenger in seated:
+            transport.add_passenger(passenger)
+        elapsed = time.perf_counter() - start
+        print(f" высадка и посадка {mode}: {elapsed / max(1, len(seated)) / 2 * 1e9:.0f} нс/опер")
+    return 0
+
+
+def bench_journeys(stops, routes, queries=200, seed=1):
+    """Поиск поездок в синтетическом городе: первый и повторный проход
+    матрицы queries x queries остановок, а также после изменения сети"""
+    rng = random.Random(seed)
+    names = [f"Остановка {i}" for i in range(stops)]
+    # Цепочка связывает все остановки, остальные маршруты случайные
+    pairs = [(names[i], names[i + 1]) for i in range(stops - 1)]
+    pairs += [tuple(rng.sample(names, 2)) for _ in range(max(0, routes - len(pairs)))]
+
+    system = TransportSystem(events=SilentSink())
+    system.add_routes(Route(i, start, end) for i, (start, end) in enumerate(pairs, 1))
+    system.add_transports(Bus(i, f"Автобус {i}", 50, f"A{i}") for i in range(1, len(pairs) + 1))
+    for transport in system.transports:
+        system.assign_route_to_transport(transport.id, transport.id)
+
+    origins = rng.sample(names, min(queries, stops))
+    destinations = rng.sample(names, min(queries, stops))
+    count = len(origins) * len(destinations)
+    print(f"Остановок: {stops}, маршрутов: {len(pairs)}, запросов в проходе: {count}")
+
+    def run(label):
+        start = time.perf_counter()
+        legs = 0
+        for origin in origins:
+            for destination in destinations:
+                legs += len(system.plan_journey(origin, destination))
+        elapsed = time.perf_counter() - start
+        print(f" {label:>22}: {elapsed:.3f} с, {elapsed / count * 1e6:.2f} мкс/запрос, "
+              f"в среднем участков {legs / count:.1f}")
+
+    run("первый проход")
+    run("повторный проход")
+    system.add_transport(Bus(len(pairs) + 1, "Новый автобус", 50, "N1"))
+    system.assign_route_to_transport(len(pairs) + 1, 1)
+    run("после изменения сети")
+    run("повторный проход")
+    return 0
+
+
+def bench_metrics(passengers, repeat=5, per_transport=1000):
+    """Стоимость метрик: посадка, высадка и поиск с выключенными и включенными метриками"""
+    riders = [Passenger(i, f"Пассажир {i}", f"T{i:08d}") for i in range(1, passengers + 1)]
+    batches = [riders[i:i + per_transport] for i in range(0, passengers, per_transport)]
+    system = TransportSystem(events=SilentSink())
+    system.add_passengers(riders)
+    system.add_transports(
+        Bus(i + 1, f"Автобус {i + 1}", per_transport, f"A{i + 1}") for i in range(len(batches))
+    )
+    pairs = list(zip(system.transports, batches))
+
+    def board():
+        for transport, batch in pairs:
+            for passenger in batch:
+                transport.add_passenger(passenger)
+
+    def alight():
+        for transport, batch in pairs:
+            for passenger in batch:
+                transport.remove_passenger(passenger)
+
+    def find():
+        find_passenger = system.find_passenger
+        for passenger_id in range(1, passengers + 1):
+            find_passenger(passenger_id)
+
+    print(f"Пассажиров: {passengers}, лучшее из {repeat}")
+    for mode in ("выключены", "включены"):
+        if mode == "включены":
+            system.enable_metrics()
+        # Посадка начинается с пустого транспорта, высадка - с полного
+        timings = {"add_passenger": [], "remove_passenger": [], "find_passenger": []}
+        for _ in range(repeat):
+            for name, run in (("add_passenger", board), ("remove_passenger", alight), ("find_passenger", find)):
+                start = time.perf_counter()
+                run()
+                timings[name].append(time.perf_counter() - start)
+        for name, values in timings.items():
+            print(f" метрики {mode:>9}, {name:>16}: {min(values) / passengers * 1e9:.0f} нс/опер")
+    system.disable_metrics()
+    return 0
+
+
+def bench_shards(passengers, shards, worker_counts):
+    """Загрузка и сохранение шардированного снимка при разном числе процессов"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "snapshot.json")
+        directory = os.path.join(tmp, "shards")
+        write_sample_json(source, passengers)
+        print(f"Пассажиров: {passengers}, шардов: {shards}, ядер: {os.cpu_count()}")
+
+        system = TransportSystem(events=SilentSink())
+        start = time.perf_counter()
+        system.load_from_json(source)
+        print(f" один файл, загрузка: {time.perf_counter() - start:.3f} с")
+        start = time.perf_counter()
+        system.save_to_json(source, compact=True)
+        print(f" один файл, сохранение: {time.perf_counter() - start:.3f} с")
+
+        for workers in worker_counts:
+            start = time.perf_counter()
+            system.save_to_shards(directory, shards, workers=workers)
+            saved = time.perf_counter() - start
+
+            loaded_system = TransportSystem(events=SilentSink())
+            start = time.perf_counter()
+            loaded_system.load_from_shards(directory, workers=workers)
+            loaded = time.perf_counter() - start
+            print(f" процессов {workers:>2}: сохранение {saved:.3f} с, загрузка {loaded:.3f} с")
+    return 0
+
+
+def bench_segments(passengers, change_counts, chunk_size=256, seed=1):
+    """Контрольная точка сегментированного снимка после N посадок и высадок
+
+    Сравнивается с полной записью одного JSON и первой (полной) записью
+    сегментов.
+    """
+    system = generate_system(passengers=passengers, occupancy=0.3, seed=seed)
+    system.set_event_sink(SilentSink())
+    rng = random.Random(seed)
+    print(f"Пассажиров: {passengers}, транспорта: {len(system.transports)}, сегмент: {chunk_size}")
+
+    def size_of(directory):
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "transport.json")
+        directory = os.path.join(tmp, "segments")
+        start = time.perf_counter()
+        system.save_to_json(filename, compact=True)
+        print(f" один JSON: {time.perf_counter() - start:.3f} с, {os.path.getsize(filename) / 2**20:.1f} МБ")
+
+        start = time.perf_counter()
+        system.save_to_segments(directory, chunk_size=chunk_size)
+        print(f" сегменты, полная запись: {time.perf_counter() - start:.3f} с, "
+              f"{size_of(directory) / 2**20:.1f} МБ")
+
+        occupied = [transport for transport in system.transports if transport.passengers]
+        for changes in change_counts:
+            for transport in rng.sample(occupied, min(changes, len(occupied))):
+                passenger = next(iter(transport.passengers))
+                transport.remove_passenger(passenger)
+                transport.add_passenger(passenger)
+            before = set(os.listdir(directory))
+            start = time.perf_counter()
+            system.save_to_segments(directory, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - start
+            written = [name for name in os.listdir(directory) if name not in before]
+            print(
+                f" изменено транспорта {changes:>7}: {elapsed:.3f} с, "
+                f"сегментов {len(written)}, "
+                f"{sum(os.path.getsize(os.path.join(directory, name)) for name in written) / 2**20:.2f} МБ"
+            )
+
+        loaded = TransportSystem(events=SilentSink())
+        start = time.perf_counter()
+        loaded.load_from_segments(directory)
+        elapsed = time.perf_counter() - start
+        same = loaded._load_counts() == system._load_counts()
+        print(f" загрузка сегментов: {elapsed:.3f} с, {'данные совпадают' if same else 'данные различаются'}")
+    return 0
+
+
+class _DictPassenger:
+    """Пассажир с __dict__, как до введения __slots__ (для сравнения)"""
+
+    def __init__(self, passenger_id, name, ticket_number):
+        self.id = passenger_id
+        self.name = name
+        self.ticket_number = ticket_number
+        self.snils = None
+
+
+def _measure_passengers(passengers, compact, passenger_class=Passenger):
+    tracemalloc.start()
+    system = TransportSystem(events=SilentSink(), compact=compact)
+    system.add_passengers(
+        passenger_class(i, f"Пассажир {i % 5000}", f"T{i:08d}") for i in range(1, passengers + 1)
+    )
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used / passengers
+
+
+def bench_passenger_memory(passengers):
+    """Байт на пассажира: объекты с __dict__, с __slots__ и колоночное хранилище"""
+    print(f"Пассажиров: {passengers}")
+    for label, compact, passenger_class in (
+        ("__dict__ (до изменений)", False, _DictPassenger),
+        ("__slots__", False, Passenger),
+        ("PassengerStore", True, Passenger),
+    ):
+        print(f" {label:>24}: {_measure_passengers(passengers, compact, passenger_class):.0f} байт")
+    return 0
+
+
+def bench_snapshot(passengers, lookups=1000):
+    """Холодный старт: открытие бинарного снимка против загрузки JSON"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "snapshot.json")
+        target = os.path.join(tmp, "snapshot.bin")
+        write_sample_json(source, passengers)
+        convert_to_snapshot(source, target)
+        print(
+            f"Пассажиров: {passengers}, JSON {os.path.getsize(source) / 2 ** 20:.1f} МБ, "
+            f"снимок {os.path.getsize(target) / 2 ** 20:.1f} МБ"
+        )
+
+        start = time.perf_counter()
+        TransportSystem(events=SilentSink()).load_from_json(source, stream=True)
+        print(f" загрузка JSON: {time.perf_counter() - start:.3f} с")
+
+        start = time.perf_counter()
+        with open_snapshot(target) as reader:
+            opened = time.perf_counter() - start
+            ids = random.Random(1).sample(range(1, passengers + 1), min(lookups, passengers))
+            start = time.perf_counter()
+            for passenger_id in ids:
+                reader.find_passenger(passenger_id)
+            lookup = (time.perf_counter() - start) / len(ids)
+        print(f" открытие снимка: {opened * 1000:.2f} мс")
+        print(f" find_passenger в снимке: {lookup * 1e6:.1f} мкс")
+    return 0
+
+
+def bench_load_memory(file_format, passengers, max_ratio=None):
+    """Сравнение пиковой памяти обычной и потоковой загрузки"""
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, f"snapshot.{file_format}")
+        _SAMPLE_WRITERS[file_format](filename, passengers)
+        file_kb = os.path.getsize(filename) / 1024
+
+        print(f"Размер файла: {file_kb / 1024:.1f} МБ, пассажиров: {passengers}")
+        results = {}
+        for mode, extra in (("full", []), ("stream", ["--stream"])):
+            result = _run_child(["_load", filename, "--format", file_format] + extra)
+            growth_kb = result["rss_peak_kb"] - result["rss_before_kb"]
+            result["growth_to_file"] = growth_kb / file_kb
+            results[mode] = result
+            print(
+                f" {mode:>6}: {result['seconds']:.2f} с, "
+                f"прирост RSS {growth_kb / 1024:.1f} МБ "
+                f"({result['growth_to_file']:.2f} x размер файла)"
+            )
+
+    if max_ratio is not None and results["stream"]["growth_to_file"] > max_ratio:
+        print(f"Потоковая загрузка превысила допустимое отношение {max_ratio}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры транспортной системы")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for file_format in ("json", "xml"):
+        memory = commands.add_parser(
+            f"{file_format}-memory", help=f"пиковая память загрузки {file_format.upper()}"
+        )
+        memory.add_argument("--passengers", type=int, default=200000)
+        memory.add_argument("--max-ratio", type=float, default=None,
+                            help="допустимый прирост RSS относительно размера файла")
+
+    boarding = commands.add_parser("boarding", help="поштучная и пакетная посадка")
+    boarding.add_argument("--passengers", type=int, default=200000)
+
+    passenger_memory = commands.add_parser("passenger-memory", help="байт на пассажира")
+    passenger_memory.add_argument("--passengers", type=int, default=200000)
+
+    snapshot = commands.add_parser("snapshot", help="открытие бинарного снимка")
+    snapshot.add_argument("--passengers", type=int, default=200000)
+
+    concurrency = commands.add_parser("concurrency", help="посадка из нескольких потоков")
+    concurrency.add_argument("--passengers", type=int, default=200000)
+    concurrency.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+
+    async_gates = commands.add_parser("async-gates", help="асинхронный фасад под нагрузкой турникетов")
+    async_gates.add_argument("--gates", type=int, default=2000)
+    async_gates.add_argument("--requests", type=int, default=200000)
+    async_gates.add_argument("--think", type=float, default=0.1,
+                             help="наибольшая пауза турникета между запросами, с")
+
+    live_save = commands.add_parser("live-save", help="задержка посадки во время записи JSON")
+    live_save.add_argument("--passengers", type=int, default=1000000)
+
+    sqlite = commands.add_parser("sqlite", help="хранение в базе SQLite")
+    sqlite.add_argument("--passengers", type=int, default=1000000)
+    sqlite.add_argument("--batches", type=int, nargs="+", default=[1, 100, 1000])
+
+    snils = commands.add_parser("snils", help="пакетная проверка СНИЛС")
+    snils.add_argument("--records", type=int, default=2000000)
+    snils.add_argument("--check", help="файл с размеченными номерами, например test_snils.txt")
+
+    indexes = commands.add_parser("indexes", help="вторичные индексы по билету, маршруту и типу")
+    indexes.add_argument("--passengers", type=int, default=1000000)
+
+    queries = commands.add_parser("queries", help="кэш запросов при чтении с редкими посадками")
+    queries.add_argument("--passengers", type=int, default=200000)
+    queries.add_argument("--requests", type=int, default=20000)
+    queries.add_argument("--writes", type=float, nargs="+", default=[0.0, 0.01, 0.1])
+
+    report = commands.add_parser("report", help="отчет о системе: полный, сводка и страницы")
+    report.add_argument("--passengers", type=int, default=1000000)
+
+    analytics = commands.add_parser("analytics", help="агрегаты по парку на NumPy")
+    analytics.add_argument("--vehicles", type=int, default=300000)
+
+    journeys = commands.add_parser("journeys", help="поиск поездок в синтетическом городе")
+    journeys.add_argument("--stops", type=int, default=5000)
+    journeys.add_argument("--routes", type=int, default=20000)
+    journeys.add_argument("--queries", type=int, default=200, help="остановок отправления и назначения")
+
+    metrics = commands.add_parser("metrics", help="стоимость метрик на горячих путях")
+    metrics.add_argument("--passengers", type=int, default=200000)
+
+    segments = commands.add_parser("segments", help="инкрементальная запись сегментированного снимка")
+    segments.add_argument("--passengers", type=int, default=1000000)
+    segments.add_argument("--changes", type=int, nargs="+", default=[10, 1000, 100000])
+    segments.add_argument("--chunk-size", type=int, default=256)
+
+    sharded = commands.add_parser("shards", help="шардированный снимок в пуле процессов")
+    sharded.add_argument("--passengers", type=int, default=1000000)
+    sharded.add_argument("--shards", type=int, default=8)
+    sharded.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+
+    save_memory = commands.add_parser("save-memory", help="пиковая память при сохранении")
+    save_memory.add_argument("--passengers", type=int, default=200000)
+
+    converter = commands.add_parser("convert", help="потоковое преобразование JSON <-> XML")
+    converter.add_argument("--passengers", type=int, default=1000000)
+
+    suite = commands.add_parser("suite", help="набор замеров на сгенерированных данных")
+    suite.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000],
+                       help="число пассажиров, вплоть до 10000000")
+    suite.add_argument("--seed", type=int, default=1)
+    suite.add_argument("--lookups", type=int, default=10000)
+    suite.add_argument("--repeat", type=int, default=3, help="прогонов, берется лучшее время")
+    suite.add_argument("--no-memory", action="store_true", help="без замера пика памяти")
+    suite.add_argument("--output", help="файл для результатов в JSON")
+    suite.add_argument("--compare", help="прошлые результаты для сравнения")
+    suite.add_argument("--threshold", type=float, default=1.2)
+
+    child_suite = commands.add_parser("_suite")
+    child_suite.add_argument("scale", type=int)
+    child_suite.add_argument("--seed", type=int, default=1)
+    child_suite.add_argument("--lookups", type=int, default=10000)
+    child_suite.add_argument("--repeat", type=int, default=3)
+    child_suite.add_argument("--no-memory", action="store_true")
+
+    child_convert = commands.add_parser("_convert")
+    child_convert.add_argument("source")
+    child_convert.add_argument("target")
+    child_convert.add_argument("--mode", choices=("objects", "direct", "validate"), default="direct")
+
+    for name in ("_load", "_save"):
+        child = commands.add_parser(name)
+        child.add_argument("filename")
+        child.add_argument("--format", choices=("json", "xml"), default="json")
+        child.add_argument("--stream", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command in ("json-memory", "xml-memory"):
+        return bench_load_memory(args.command.split("-")[0], args.passengers, args.max_ratio)
+    if args.command == "boarding":
+        return bench_boarding(args.passengers)
+    if args.command == "passenger-memory":
+        return bench_passenger_memory(args.passengers)
+    if args.command == "snapshot":
+        return bench_snapshot(args.passengers)
+    if args.command == "save-memory":
+        return bench_save_memory(args.passengers)
+    if args.command == "concurrency":
+        return bench_concurrency(args.passengers, args.threads)
+    if args.command == "live-save":
+        return bench_live_save(args.passengers)
+    if args.command == "sqlite":
+        return bench_sqlite(args.passengers, args.batches)
+    if args.command == "snils":
+        return bench_snils(args.records, args.check)
+    if args.command == "indexes":
+        return bench_indexes(args.passengers)
+    if args.command == "queries":
+        return bench_queries(args.passengers, args.writes, args.requests)
+    if args.command == "report":
+        return bench_report(args.passengers)
+    if args.command == "analytics":
+        return bench_analytics(args.vehicles)
+    if args.command == "journeys":
+        return bench_journeys(args.stops, args.routes, args.queries)
+    if args.command == "metrics":
+        return bench_metrics(args.passengers)
+    if args.command == "segments":
+        return bench_segments(args.passengers, args.changes, args.chunk_size)
+    if args.command == "shards":
+        return bench_shards(args.passengers, args.shards, args.workers)
+    if args.command == "async-gates":
+        return bench_async_gates(args.gates, args.requests, args.think)
+    if args.command == "convert":
+        return bench_convert(args.passengers)
+    if args.command == "suite":
+        return bench_suite(
+            args.scales, args.seed, args.lookups, args.repeat, not args.no_memory,
+            args.output, args.compare, args.threshold
+        )
+    if args.command == "_suite":
+        _child_suite(args.scale, args.seed, args.lookups, args.repeat, not args.no_memory)
+    if args.command == "_convert":
+        _child_convert(args.source, args.target, args.mode)
+    if args.command == "_load":
+        _child_load(args.filename, args.format, args.stream)
+    if args.command == "_save":
+        _child_save(args.filename, args.format, args.stream)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
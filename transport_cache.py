@@ -0,0 +1,138 @@
+"""Кэш ответов на частые запросы к транспортной системе
+
+Ответ хранится вместе с номером версии данных, от которых он зависит:
+    vehicles_on_route - _network_version системы (добавление маршрутов и
+                        транспорта, назначение маршрута, загрузка);
+    riders            - _network_version и номер изменения состава
+                        пассажиров самого транспорта;
+    occupancy_by_route, totals - _version системы (любая мутация).
+Посадка в один автобус не сбрасывает ответы про другой транспорт и
+маршруты. Устаревший ответ обнаруживается при чтении и вычисляется
+заново; старые записи вытесняются по LRU, когда их больше max_entries.
+Ответы общие для всех вызывающих, изменять их нельзя.
+
+Изменения в обход TransportSystem (например, прямое присваивание
+transport.route) кэш не видит.
+
+Пример:
+    queries = system.enable_query_cache()
+    queries.vehicles_on_route(3)
+    queries.stats()
+"""
+import threading
+from collections import OrderedDict
+
+
+def vehicles_on_route(system, route_id):
+    """Транспорт, назначенный на маршрут (без кэша)"""
+    return tuple(system.find_transports_on_route(route_id))
+
+
+def riders(system, transport_id):
+    """Пассажиры транспорта (без кэша); None, если транспорта нет"""
+    transport = system.find_transport(transport_id)
+    return None if transport is None else tuple(transport.passengers)
+
+
+def occupancy_by_route(system):
+    """{id маршрута: (пассажиров, мест)} по транспорту на маршрутах (без кэша)"""
+    result = {}
+    for transport in system.transports:
+        if transport.route is not None:
+            occupied, seats = result.get(transport.route.id, (0, 0))
+            result[transport.route.id] = (occupied + len(transport.passengers), seats + transport.capacity)
+    return result
+
+
+def totals(system):
+    """Итоги из сводки show_system_info (без кэша)"""
+    return {
+        "transports": len(system.transports),
+        "passengers": len(system.passengers),
+        "routes": len(system.routes),
+        "in_transit": len(system._passenger_locations),
+        "seats": system._seats
+    }
+
+
+class QueryCache:
+    def __init__(self, system, max_entries=1024):
+        if max_entries < 1:
+            raise ValueError("Размер кэша должен быть положительным")
+        self.system = system
+        self.max_entries = max_entries
+        # ключ -> (версия, ответ); порядок - от давно использованных к недавним
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key, version, compute):
+        """Ответ для key, если он вычислен при той же версии, иначе compute()
+
+        version нужно получить до вычисления: тогда мутация во время
+        compute() оставит у записи старую версию, и ответ пересчитается
+        при следующем чтении.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                self.stale += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def vehicles_on_route(self, route_id):
+        system = self.system
+        return self.get(
+            ("vehicles_on_route", route_id), system._network_version,
+            lambda: vehicles_on_route(system, route_id)
+        )
+
+    def riders(self, transport_id):
+        system = self.system
+        transport = system.find_transport(transport_id)
+        version = (system._network_version, None if transport is None else transport._version)
+        return self.get(("riders", transport_id), version, lambda: riders(system, transport_id))
+
+    def occupancy_by_route(self):
+        system = self.system
+        return self.get(("occupancy_by_route",), system._version, lambda: occupancy_by_route(system))
+
+    def totals(self):
+        system = self.system
+        return self.get(("totals",), system._version, lambda: totals(system))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Счетчики попаданий и промахов; stale - промахи из-за устаревших ответов"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / requests if requests else 0.0
+            }
@@ -0,0 +1,294 @@
+"""Потоковое преобразование JSON <-> XML без построения объектов системы
+
+Записи переносятся по одной: JSON читается _JsonStreamReader, XML -
+iterparse с удалением обработанных элементов, а запись идет через те же
+_write_json_stream / _write_xml_stream, что и у save_to_*. Память не
+зависит от размера файла; секции выводятся в порядке входного файла,
+отсутствующие добавляются пустыми. Формат определяется по расширению
+(.xml - XML, остальное - JSON), сжатие - по суффиксу .gz (gzip) или
+.xz / .lzma (lzma) либо явно параметрами source_compression и
+target_compression ("none", "gzip", "lzma").
+
+При validate=True проверяются ссылки транспорта на маршруты и
+пассажиров, повторы ID и пассажиры сразу в двух транспортных средствах.
+Для этого хранятся только множества ID (IdSet), а ссылки на секции,
+которые в файле идут позже транспорта, откладываются в массивы и
+проверяются в конце. Результат пишется во временный файл и заменяет
+target только после успешной проверки.
+
+Пример:
+    convert("transport_data.json", "transport_data.xml.gz", validate=True)
+
+    python -m transport_convert transport_data.xml transport_data.json --validate
+"""
+import argparse
+import gzip
+import json
+import lzma
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from array import array
+
+from transport_io import SECTIONS, XML_TEXT, json_sections, xml_sections
+from transport_system import (
+    DuplicateIdError,
+    FileOperationError,
+    InvalidDataError,
+    PassengerNotFoundError,
+    TransportError,
+    _write_json_stream,
+    _write_xml_stream,
+)
+
+COMPRESSIONS = ("none", "gzip", "lzma")
+
+_SUFFIXES = ((".gz", "gzip"), (".xz", "lzma"), (".lzma", "lzma"))
+
+
+def compression_of(filename, compression=None):
+    """Сжатие файла: явное или по суффиксу имени"""
+    if compression is not None:
+        if compression not in COMPRESSIONS:
+            raise InvalidDataError(f"Неизвестное сжатие: {compression}; допустимы {', '.join(COMPRESSIONS)}")
+        return compression
+    lower = filename.lower()
+    for suffix, name in _SUFFIXES:
+        if lower.endswith(suffix):
+            return name
+    return "none"
+
+
+def format_of(filename):
+    """Формат файла по расширению без суффикса сжатия"""
+    lower = filename.lower()
+    for suffix, _ in _SUFFIXES:
+        if lower.endswith(suffix):
+            lower = lower[:-len(suffix)]
+            break
+    return "xml" if lower.endswith(".xml") else "json"
+
+
+def open_stream(filename, mode, compression="none"):
+    """Открытие файла с учетом сжатия; mode - "rt", "rb", "wt" или "wb" """
+    encoding = 'utf-8' if "t" in mode else None
+    if compression == "gzip":
+        return gzip.open(filename, mode, compresslevel=6, encoding=encoding)
+    if compression == "lzma":
+        # Уровень 1: словарь в несколько МБ вместо ~100 МБ памяти у уровня по умолчанию
+        return lzma.open(filename, mode, preset=1 if "w" in mode else None, encoding=encoding)
+    return open(filename, mode.replace("t", ""), encoding=encoding)
+
+
+class IdSet:
+    """Множество ID для проверки ссылок без хранения объектов
+
+    Пока ID неотрицательные и достаточно плотные (битовая карта занимает
+    не больше 8 байт на элемент), множество хранится битовой картой -
+    около 1/8 байта на возможный ID; иначе переходит на обычный set.
+    """
+
+    __slots__ = ("_bits", "_set", "_count")
+
+    def __init__(self):
+        self._bits = bytearray()
+        self._set = None
+        self._count = 0
+
+    def add(self, item_id):
+        """Добавление ID; False, если он уже был в множестве"""
+        if self._set is None:
+            byte = item_id >> 3
+            if item_id >= 0 and byte >= len(self._bits) and byte < 8 * self._count + (1 << 16):
+                self._bits.extend(bytes(max(byte + 1, 2 * len(self._bits)) - len(self._bits)))
+            if 0 <= byte < len(self._bits):
+                mask = 1 << (item_id & 7)
+                if self._bits[byte] & mask:
+                    return False
+                self._bits[byte] |= mask
+                self._count += 1
+                return True
+            self._set = set(self._iter_bits())
+            self._bits = bytearray()
+
+        if item_id in self._set:
+            return False
+        self._set.add(item_id)
+        self._count += 1
+        return True
+
+    def _iter_bits(self):
+        for byte, value in enumerate(self._bits):
+            if value:
+                for bit in range(8):
+                    if value >> bit & 1:
+                        yield byte << 3 | bit
+
+    def __contains__(self, item_id):
+        if self._set is not None:
+            return item_id in self._set
+        byte = item_id >> 3
+        return 0 <= byte < len(self._bits) and bool(self._bits[byte] >> (item_id & 7) & 1)
+
+    def __len__(self):
+        return self._count
+
+
+class ReferenceCheck:
+    """Проверка ссылок и повторов ID по мере переноса записей"""
+
+    def __init__(self):
+        self.ids = {section: IdSet() for section in SECTIONS}
+        self.boarded = IdSet()
+        self.finished = set()
+        # Отложенные ссылки: пары (id транспорта, id маршрута или пассажира)
+        self._route_refs = array('q')
+        self._passenger_refs = array('q')
+
+    def record(self, section, data):
+        if not self.ids[section].add(data["id"]):
+            raise DuplicateIdError(f"Повторяется ID {data['id']} в секции {section}")
+        if section != "transports":
+            return
+
+        transport_id = data["id"]
+        route_id = data.get("route_id")
+        if route_id:
+            if "routes" in self.finished:
+                self._check_route(transport_id, route_id)
+            else:
+                self._route_refs.extend((transport_id, route_id))
+        for passenger_id in data["passengers"]:
+            if not self.boarded.add(passenger_id):
+                raise InvalidDataError(
+                    f"Пассажир {passenger_id} находится сразу в нескольких транспортных средствах"
+                )
+            if "passengers" in self.finished:
+                self._check_passenger(transport_id, passenger_id)
+            else:
+                self._passenger_refs.extend((transport_id, passenger_id))
+
+    def _check_route(self, transport_id, route_id):
+        if route_id not in self.ids["routes"]:
+            raise PassengerNotFoundError(f"Транспорт {transport_id}: не существует маршрута с ID {route_id}")
+
+    def _check_passenger(self, transport_id, passenger_id):
+        if passenger_id not in self.ids["passengers"]:
+            raise PassengerNotFoundError(f"Транспорт {transport_id}: не существует пассажира с ID {passenger_id}")
+
+    def finish(self):
+        """Проверка отложенных ссылок после переноса всех секций"""
+        for refs, check in ((self._route_refs, self._check_route), (self._passenger_refs, self._check_passenger)):
+            for index in range(0, len(refs), 2):
+                check(refs[index], refs[index + 1])
+
+
+def _records(section, records, counts, check):
+    for data in records:
+        if check is not None:
+            check.record(section, data)
+        counts[section] += 1
+        yield data
+    if check is not None:
+        check.finished.add(section)
+
+
+def _sections(source_sections, counts, check):
+    """Секции входного файла с подсчетом и проверкой записей; недостающие - пустые"""
+    for section, records in source_sections:
+        counts.setdefault(section, 0)
+        yield section, _records(section, records, counts, check)
+    for section in SECTIONS:
+        if section not in counts:
+            counts[section] = 0
+            yield section, ()
+
+
+def convert(source, target, validate=False, compact=False,
+            source_compression=None, target_compression=None):
+    """Преобразование файла source в target (JSON или XML, со сжатием или без)
+
+    compact=True убирает отступы в JSON. Возвращает число перенесенных
+    записей по секциям. При ошибке разбора выбрасывает
+    FileOperationError, при ошибке проверки - исключение TransportError;
+    target в обоих случаях не меняется.
+    """
+    source_compression = compression_of(source, source_compression)
+    target_compression = compression_of(target, target_compression)
+    source_format = format_of(source)
+    target_format = format_of(target)
+    check = ReferenceCheck() if validate else None
+    counts = {}
+
+    tmp_path = f"{target}.tmp"
+    try:
+        with open_stream(source, "rb" if source_format == "xml" else "rt", source_compression) as src:
+            if source_format == "xml":
+                sections = xml_sections(src)
+            else:
+                sections = json_sections(src)
+            sections = _sections(sections, counts, check)
+
+            with open_stream(tmp_path, "wt", target_compression) as dst:
+                if target_format == "xml":
+                    _write_xml_stream(dst, (
+                        (section, map(XML_TEXT[section], records)) for section, records in sections
+                    ), serialize=str)
+                else:
+                    _write_json_stream(dst, sections, compact=compact)
+        if check is not None:
+            check.finish()
+        os.replace(tmp_path, target)
+    except (ET.ParseError, json.JSONDecodeError, EOFError, lzma.LZMAError, gzip.BadGzipFile) as e:
+        _remove(tmp_path)
+        raise FileOperationError(f"Поврежден файл {source}: {e}") from e
+    except (KeyError, TypeError, AttributeError) as e:
+        _remove(tmp_path)
+        raise InvalidDataError(f"Некорректная запись в {source}: {e!r}") from e
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    return counts
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m transport_convert",
+        description="Потоковое преобразование JSON <-> XML (сжатие .gz, .xz по расширению)"
+    )
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--validate", action="store_true",
+                        help="проверить ссылки на маршруты и пассажиров и повторы ID")
+    parser.add_argument("--compact", action="store_true", help="JSON без отступов")
+    parser.add_argument("--source-compression", choices=COMPRESSIONS)
+    parser.add_argument("--target-compression", choices=COMPRESSIONS)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        counts = convert(
+            args.source, args.target, validate=args.validate, compact=args.compact,
+            source_compression=args.source_compression, target_compression=args.target_compression
+        )
+    except (TransportError, OSError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    print(
+        f"Записано в {args.target}: транспорта {counts['transports']}, "
+        f"пассажиров {counts['passengers']}, маршрутов {counts['routes']} "
+        f"за {time.perf_counter() - started:.2f} с"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
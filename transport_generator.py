@@ -0,0 +1,92 @@
+"""Генератор синтетических транспортных систем заданного размера
+
+Одинаковые параметры и seed дают одинаковую систему, поэтому замеры
+на сгенерированных данных можно сравнивать между запусками.
+
+Пример:
+    system = generate_system(passengers=100000, occupancy=0.6, seed=1)
+"""
+import random
+
+from transport_system import Bus, Passenger, Route, SilentSink, Train, Tram, TransportSystem
+
+DEFAULT_MIX = {"bus": 0.6, "tram": 0.25, "train": 0.15}
+
+_FIRST_NAMES = (
+    "Анна", "Иван", "Мария", "Петр", "Елена", "Сергей", "Ольга", "Алексей",
+    "Наталья", "Дмитрий", "Юлия", "Андрей", "Ирина", "Михаил", "Татьяна", "Николай",
+)
+_LAST_NAMES = (
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов",
+    "Михайлов", "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев",
+)
+_STOPS = (
+    "Вокзал", "Центр", "Университет", "Парк", "Рынок", "Больница", "Стадион",
+    "Аэропорт", "Порт", "Заводская", "Библиотека", "Площадь", "Депо", "Школа",
+)
+
+
+def _make_transport(rng, transport_id, transport_type):
+    if transport_type == "tram":
+        return Tram(transport_id, f"Трамвай {transport_id}", rng.randint(80, 150), f"Т{transport_id}")
+    if transport_type == "train":
+        carriages = rng.randint(4, 12)
+        return Train(transport_id, f"Поезд {transport_id}", carriages * rng.randint(60, 100), carriages)
+    return Bus(transport_id, f"Автобус {transport_id}", rng.randint(30, 60), f"А{transport_id}")
+
+
+def generate_system(passengers=1000, transports=None, routes=None, mix=None,
+                    occupancy=0.5, seed=0, events=None, compact=False):
+    """Система с passengers пассажирами
+
+    transports и routes по умолчанию выбираются пропорционально числу
+    пассажиров; mix - доли типов транспорта ("bus", "tram", "train");
+    occupancy - доля мест, занятых пассажирами (насколько хватит
+    пассажиров). Каждый десятый транспорт остается без маршрута.
+    Сообщения при построении не выводятся; events - приемник сообщений
+    готовой системы (по умолчанию SilentSink).
+    """
+    if not 0 <= occupancy <= 1:
+        raise ValueError("occupancy должна быть в пределах от 0 до 1")
+    rng = random.Random(seed)
+    transports = max(1, passengers // 40) if transports is None else transports
+    routes = max(1, transports // 10) if routes is None else routes
+    mix = DEFAULT_MIX if mix is None else mix
+    types, weights = zip(*mix.items())
+
+    system = TransportSystem(events=SilentSink(), compact=compact)
+    system.add_routes(
+        Route(route_id, f"{rng.choice(_STOPS)} {route_id}", f"{rng.choice(_STOPS)} {route_id + 1}")
+        for route_id in range(1, routes + 1)
+    )
+    system.add_passengers(
+        Passenger(
+            passenger_id,
+            f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}",
+            f"{rng.randrange(10000):04d}-{passenger_id:08d}"
+        )
+        for passenger_id in range(1, passengers + 1)
+    )
+    system.add_transports(
+        _make_transport(rng, transport_id, transport_type)
+        for transport_id, transport_type in enumerate(rng.choices(types, weights, k=transports), 1)
+    )
+
+    for transport in system.transports:
+        if routes and rng.random() >= 0.1:
+            system.assign_route_to_transport(transport.id, rng.randint(1, routes))
+
+    # Пассажиры рассаживаются в случайном порядке, пока не кончатся
+    waiting = list(range(1, passengers + 1))
+    rng.shuffle(waiting)
+    start = 0
+    for transport in system.transports:
+        seats = round(transport.capacity * occupancy)
+        transport.board_many(map(system.find_passenger, waiting[start:start + seats]))
+        start += seats
+        if start >= passengers:
+            break
+
+    if events is not None:
+        system.set_event_sink(events)
+    return system
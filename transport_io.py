@@ -0,0 +1,160 @@
+"""Общие помощники чтения и записи файлов для форматов хранения
+
+write_atomic пишет файл через временный файл, fsync и os.replace:
+читатели (в том числе через mmap) до замены видят прежний файл целиком,
+после - новый, а сбой при записи не оставляет наполовину записанного
+файла под рабочим именем.
+
+json_sections / xml_sections читают документы save_to_json /
+save_to_xml потоково, секция за секцией, в виде словарей записей;
+XML_TEXT - текст элемента XML для словаря записи каждой секции.
+"""
+import os
+from itertools import groupby
+from xml.sax.saxutils import escape
+
+from transport_system import (
+    _JsonStreamReader,
+    _iter_xml_records,
+    _passenger_data_from_xml,
+    _route_data_from_xml,
+    _transport_data_from_xml,
+)
+
+SECTIONS = ("transports", "passengers", "routes")
+
+_SECTION_BY_TAG = {"transport": "transports", "passenger": "passengers", "route": "routes"}
+
+
+def _passenger_data_from_xml_record(passenger_elem):
+    # Как и save_to_json, СНИЛС пишется в JSON, только если задан
+    passenger_data = _passenger_data_from_xml(passenger_elem)
+    if passenger_data["snils"] is None:
+        del passenger_data["snils"]
+    return passenger_data
+
+
+_FROM_XML = {
+    "transports": _transport_data_from_xml,
+    "passengers": _passenger_data_from_xml_record,
+    "routes": _route_data_from_xml,
+}
+
+# Текст элементов XML собирается напрямую, без ET.Element и ET.tostring;
+# результат совпадает с _*_data_to_xml (пустой текст - короткий тег)
+def _xml_field(tag, text):
+    return f"<{tag}>{escape(text)}</{tag}>" if text else f"<{tag} />"
+
+
+def _transport_xml_text(transport_data):
+    parts = [
+        "<transport>",
+        _xml_field("id", str(transport_data["id"])),
+        _xml_field("type", transport_data["type"]),
+        _xml_field("name", transport_data["name"]),
+        _xml_field("capacity", str(transport_data["capacity"])),
+    ]
+    for tag in ("bus_number", "line_number", "carriages"):
+        if transport_data.get(tag) is not None:
+            parts.append(_xml_field(tag, str(transport_data[tag])))
+    route_id = transport_data.get("route_id")
+    parts.append(_xml_field("route_id", str(route_id) if route_id else ""))
+    passengers = transport_data["passengers"]
+    if passengers:
+        parts.append("<passengers>")
+        parts.extend(_xml_field("passenger_id", str(passenger_id)) for passenger_id in passengers)
+        parts.append("</passengers></transport>")
+    else:
+        parts.append("<passengers /></transport>")
+    return "".join(parts)
+
+
+def _passenger_xml_text(passenger_data):
+    snils = passenger_data.get("snils")
+    return "".join((
+        "<passenger>",
+        _xml_field("id", str(passenger_data["id"])),
+        _xml_field("name", passenger_data["name"]),
+        _xml_field("ticket_number", passenger_data["ticket_number"]),
+        "" if snils is None else _xml_field("snils", snils),
+        "</passenger>",
+    ))
+
+
+def _route_xml_text(route_data):
+    return "".join((
+        "<route>",
+        _xml_field("id", str(route_data["id"])),
+        _xml_field("start_point", route_data["start_point"]),
+        _xml_field("end_point", route_data["end_point"]),
+        "</route>",
+    ))
+
+
+XML_TEXT = {
+    "transports": _transport_xml_text,
+    "passengers": _passenger_xml_text,
+    "routes": _route_xml_text,
+}
+
+
+def fsync_directory(directory):
+    """Сброс на диск записи каталога (переименований и удалений файлов)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, write, binary=False):
+    """Запись файла через временный файл, fsync и os.replace
+
+    write(f) получает открытый временный файл, текстовый (UTF-8) или
+    двоичный при binary=True. При ошибке временный файл удаляется, а
+    прежний файл остается нетронутым.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        if binary:
+            f = open(tmp_path, 'wb')
+        else:
+            f = open(tmp_path, 'w', encoding='utf-8')
+        with f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def json_sections(f):
+    """Секции документа save_to_json: пары (секция, словари записей) по одной"""
+    reader = _JsonStreamReader(f)
+    for key in reader.keys():
+        if key != "transport_system":
+            reader.value()
+            continue
+        for section in reader.keys():
+            if section in SECTIONS:
+                yield section, reader.items()
+            else:
+                reader.value()
+
+
+def xml_sections(f):
+    """Секции документа save_to_xml: пары (секция, словари записей) по одной"""
+    for tag, elements in groupby(_iter_xml_records(f), key=lambda elem: elem.tag):
+        section = _SECTION_BY_TAG.get(tag)
+        if section is not None:
+            yield section, map(_FROM_XML[section], elements)
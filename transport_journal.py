@@ -0,0 +1,389 @@
+"""Журнал мутаций транспортной системы (write-ahead log)
+
+Каталог журнала содержит:
+    JOURNAL.json            - номер текущего поколения и номер мутации снимка
+    snapshot-NNNNNN.json    - снимок состояния на начало поколения
+    journal-NNNNNN.log      - мутации по одной JSON-строке [номер, операция, аргументы...]
+
+Каждая мутация получает номер (TransportSystem._record) под той же
+блокировкой, под которой меняется память, а снимок поколения берется из
+согласованного среза (TransportSystem.snapshot) и помнит номер среза:
+мутации с номером не больше него в снимке уже есть и при восстановлении
+пропускаются. Поэтому свертка не останавливает посадку: срез и запись
+снимка идут без блокировки журнала, мутации тем временем дописываются
+в старый журнал и при переключении переносятся в новый.
+
+Переключение поколения выполняется заменой JOURNAL.json через
+os.replace: до замены действует старая пара снимок + журнал, после -
+новая, поэтому сбой в любой момент оставляет согласованное состояние.
+Неполная последняя строка журнала (сбой при записи) при восстановлении
+отбрасывается.
+
+Если запись в журнал не удалась, строка мутации отрезается, а журнал
+останавливается (MutationJournal.failed): следующие мутации отклоняются,
+пока свертка (compact_journal) или повторное включение журнала не
+начнет новое поколение со снимка текущего состояния.
+"""
+import json
+import os
+import threading
+import time
+from itertools import count
+
+from transport_io import fsync_directory, write_atomic
+from transport_system import (
+    FileOperationError,
+    SilentSink,
+    TransportError,
+    default_event_sink,
+    _passenger_from_data,
+    _passenger_to_data,
+    _route_from_data,
+    _route_to_data,
+    _transport_from_data,
+    _transport_to_data,
+    _write_json_stream,
+)
+
+MANIFEST = "JOURNAL.json"
+
+
+def _get_id(item):
+    return item.id
+
+
+# Сериализация аргументов мутаций: объекты заменяются данными или ID
+_ENCODERS = {
+    "add_transport": (_transport_to_data,),
+    "add_passenger": (_passenger_to_data,),
+    "add_route": (_route_to_data,),
+    "add_transports": (lambda items: [_transport_to_data(item) for item in items],),
+    "add_passengers": (lambda items: [_passenger_to_data(item) for item in items],),
+    "add_routes": (lambda items: [_route_to_data(item) for item in items],),
+    "assign_route": (_get_id, _get_id),
+    "board": (_get_id, _get_id),
+    "alight": (_get_id, _get_id),
+    "board_many": (_get_id, lambda items: [item.id for item in items]),
+}
+
+
+def _snapshot_name(generation):
+    return f"snapshot-{generation:06d}.json"
+
+
+def _journal_name(generation):
+    return f"journal-{generation:06d}.log"
+
+
+def read_manifest(directory):
+    """(поколение, номер мутации снимка); (0, 0), если журнал в каталоге не создавался"""
+    try:
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest["generation"], manifest["version"]
+    except FileNotFoundError:
+        return 0, 0
+    except (ValueError, KeyError) as e:
+        raise FileOperationError(f"Поврежден {MANIFEST} в {directory}: {e}")
+
+
+def read_generation(directory):
+    """Номер текущего поколения или 0, если журнал в каталоге не создавался"""
+    return read_manifest(directory)[0]
+
+
+def _write_snapshot(view, directory, generation):
+    """Снимок среза системы для нового поколения (манифест не меняется)"""
+    write_atomic(
+        os.path.join(directory, _snapshot_name(generation)),
+        lambda f: _write_json_stream(f, view._json_sections(), compact=True)
+    )
+
+
+def _write_manifest(directory, generation, version):
+    """Переключение манифеста на поколение generation"""
+    write_atomic(
+        os.path.join(directory, MANIFEST),
+        lambda f: json.dump({"generation": generation, "version": version}, f)
+    )
+    fsync_directory(directory)
+
+
+def _switch(directory, generation, version, tail=b""):
+    """Журнал нового поколения с мутациями tail и переключение манифеста на него"""
+    write_atomic(os.path.join(directory, _journal_name(generation)), lambda f: f.write(tail), binary=True)
+    _write_manifest(directory, generation, version)
+
+
+def _remove_stale(directory, generation):
+    """Удаление файлов прошлых поколений"""
+    for name in os.listdir(directory):
+        if name in (_snapshot_name(generation), _journal_name(generation), MANIFEST):
+            continue
+        if name.startswith(("snapshot-", "journal-")):
+            os.remove(os.path.join(directory, name))
+
+
+def _entries_after(path, offset, version):
+    """Строки журнала с позиции offset, номер мутации которых больше version"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        lines = [line for line in f if line.endswith(b"\n")]
+    return b"".join(line for line in lines if json.loads(line)[0] > version)
+
+
+class MutationJournal:
+    """Дозапись мутаций в журнал текущего поколения с пакетным fsync
+
+    Запись после fsync_every изменений или по истечении fsync_interval
+    секунд с прошлого fsync (проверяется при очередной записи); sync()
+    сбрасывает журнал на диск принудительно. Каждая строка пишется в
+    файл одним вызовом write без буфера процесса, поэтому при ошибке ее
+    можно отрезать. Методы можно вызывать из нескольких потоков.
+    """
+
+    def __init__(self, directory, generation, fsync_every=100, fsync_interval=0.5):
+        self.directory = directory
+        self.generation = generation
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self._file = open(self.journal_path, 'ab', buffering=0)
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # Ошибка записи, после которой журнал остановлен (см. compact)
+        self.failed = None
+        self._lock = threading.RLock()
+        # Свертки выполняются по одной; блокировка журнала на время среза
+        # и записи снимка не берется
+        self._compact_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, system, directory, fsync_every=100, fsync_interval=0.5):
+        """Новое поколение журнала, начинающееся со снимка состояния system
+
+        Журнал подключается к system (system.journal) под блокировками
+        среза для снимка, поэтому каждая мутация попадает либо в снимок,
+        либо в журнал. Пока снимок пишется, мутации дописываются в журнал
+        нового поколения; действующим оно становится после записи снимка.
+        """
+        os.makedirs(directory, exist_ok=True)
+        generation = read_generation(directory) + 1
+        # Журнал этого поколения мог остаться от прерванной попытки
+        with open(os.path.join(directory, _journal_name(generation)), 'wb'):
+            pass
+        journal = cls(directory, generation, fsync_every, fsync_interval)
+        previous = system.journal
+        try:
+            view = system._attach("journal", journal)
+            if previous is not None:
+                previous.close()
+            _write_snapshot(view, directory, generation)
+            with journal._lock:
+                journal.sync()
+                _write_manifest(directory, generation, view._version)
+        except BaseException:
+            system.journal = None
+            journal.close()
+            raise
+        _remove_stale(directory, generation)
+        return journal
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, _snapshot_name(self.generation))
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, _journal_name(self.generation))
+
+    def append(self, version, operation, *args):
+        """Запись мутации с номером version
+
+        Вызывается под блокировкой самой мутации. FileOperationError
+        означает, что мутация в журнал не попала.
+        """
+        payload = [version, operation]
+        payload.extend(encode(arg) for encode, arg in zip(_ENCODERS[operation], args))
+        line = (json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + "\n").encode('utf-8')
+
+        with self._lock:
+            if self.failed is not None:
+                raise FileOperationError(f"Журнал {self.journal_path} остановлен после ошибки: {self.failed}")
+            start = self._size
+            try:
+                view = memoryview(line)
+                while view:
+                    view = view[self._file.write(view):]
+                self._size += len(line)
+                self._unsynced += 1
+                if (self._unsynced >= self.fsync_every
+                        or (self.fsync_interval is not None
+                            and time.monotonic() - self._last_sync >= self.fsync_interval)):
+                    self._fsync()
+            except OSError as e:
+                self._fail(e, start)
+                raise FileOperationError(f"Ошибка записи в журнал {self.journal_path}: {e}")
+
+    def _fsync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _fail(self, error, size):
+        """Остановка журнала: строка текущей мутации отрезается, если дописана"""
+        self.failed = error
+        try:
+            if os.fstat(self._file.fileno()).st_size > size:
+                os.ftruncate(self._file.fileno(), size)
+            self._file.close()
+        except OSError:
+            pass
+
+    def sync(self):
+        with self._lock:
+            if self.failed is not None or self._file.closed:
+                return
+            try:
+                self._fsync()
+            except OSError as e:
+                self._fail(e, self._size)
+                raise FileOperationError(f"Ошибка записи в журнал {self.journal_path}: {e}")
+
+    def compact(self, system):
+        """Свертка: снимок текущего состояния становится новым поколением
+
+        Мутации, дописанные в старый журнал во время записи снимка и не
+        попавшие в срез, переносятся в журнал нового поколения.
+        """
+        with self._compact_lock:
+            with self._lock:
+                self.sync()
+                offset = self._size
+                generation = self.generation + 1
+            view = system.snapshot()
+            _write_snapshot(view, self.directory, generation)
+
+            with self._lock:
+                self.sync()
+                old_path = self.journal_path
+                tail = _entries_after(old_path, offset, view._version)
+                _switch(self.directory, generation, view._version, tail)
+                if not self._file.closed:
+                    self._file.close()
+                self.generation = generation
+                self._file = open(self.journal_path, 'ab', buffering=0)
+                self._size = len(tail)
+                self._unsynced = 0
+                self.failed = None
+            _remove_stale(self.directory, generation)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self.sync()
+                self._file.close()
+
+
+def read_entries(path, repair=False):
+    """Записи журнала по одной
+
+    Неполная последняя строка (без перевода строки) пропускается, а при
+    repair=True еще и отрезается, чтобы новые записи не склеились с ней.
+    """
+    offset = 0
+    with open(path, 'rb') as f:
+        for number, line in enumerate(f, 1):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if line.endswith(b"\n"):
+                    raise FileOperationError(f"Повреждена строка {number} журнала {path}")
+                break
+            offset += len(line)
+            yield entry
+        else:
+            return
+
+    if repair:
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+
+
+def _replay(system, entry):
+    """Повторное применение одной мутации через обычный API системы"""
+    operation, *args = entry
+    if operation == "add_transport":
+        transport_data = args[0]
+        transport = system._link_loaded_transport(
+            _transport_from_data(transport_data),
+            transport_data["route_id"], transport_data["passengers"]
+        )
+        return system.add_transport(transport)
+    if operation == "add_passenger":
+        return system.add_passenger(_passenger_from_data(args[0]))
+    if operation == "add_route":
+        return system.add_route(_route_from_data(args[0]))
+    if operation == "add_transports":
+        return not system.add_transports(
+            system._link_loaded_transport(
+                _transport_from_data(data), data["route_id"], data["passengers"]
+            )
+            for data in args[0]
+        ).rejected
+    if operation == "add_passengers":
+        return not system.add_passengers(map(_passenger_from_data, args[0])).rejected
+    if operation == "add_routes":
+        return not system.add_routes(map(_route_from_data, args[0])).rejected
+    if operation == "assign_route":
+        return system.assign_route_to_transport(*args)
+
+    transport = system.find_transport(args[0])
+    if transport is None:
+        return False
+    if operation == "board":
+        return transport.add_passenger(system.find_passenger(args[1]))
+    if operation == "alight":
+        return transport.remove_passenger(system.find_passenger(args[1]))
+    if operation == "board_many":
+        return not transport.board_many(map(system.find_passenger, args[1])).rejected
+    raise FileOperationError(f"Неизвестная операция в журнале: {operation}")
+
+
+def recover(system_class, directory, events=None, fsync_every=100, fsync_interval=0.5, **options):
+    """Загрузка последнего снимка, повтор хвоста журнала и подключение журнала
+
+    Мутации с номером не больше номера снимка в снимке уже есть и
+    пропускаются. Нумерация мутаций восстановленной системы продолжается
+    после последней записи журнала.
+    """
+    generation, snapshot_version = read_manifest(directory)
+    if not generation:
+        raise FileOperationError(f"В каталоге {directory} нет журнала мутаций")
+
+    system = system_class(events=SilentSink(), **options)
+    last = snapshot_version
+    try:
+        with open(os.path.join(directory, _snapshot_name(generation)), 'r', encoding='utf-8') as f:
+            system._load_json_stream(f)
+
+        for number, entry in enumerate(read_entries(os.path.join(directory, _journal_name(generation)), repair=True), 1):
+            if not entry or not isinstance(entry[0], int):
+                raise FileOperationError(f"Запись {number} журнала без номера мутации")
+            version, entry = entry[0], entry[1:]
+            if version <= snapshot_version:
+                continue
+            last = max(last, version)
+            if not _replay(system, entry):
+                raise FileOperationError(
+                    f"Запись {number} журнала не применяется: {entry[0]}"
+                )
+    except FileOperationError:
+        raise
+    except (OSError, ValueError, KeyError, TransportError) as e:
+        raise FileOperationError(f"Не удалось восстановить систему из {directory}: {e}")
+
+    system._versions = count(max(last, next(system._versions)) + 1)
+    system.set_event_sink(events if events is not None else default_event_sink)
+    system.journal = MutationJournal(directory, generation, fsync_every, fsync_interval)
+    return system
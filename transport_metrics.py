@@ -0,0 +1,371 @@
+"""Метрики транспортной системы: счетчики, гистограммы задержек и показатели
+
+Метрики включаются методом TransportSystem.enable_metrics. Пока они
+выключены, горячие пути не выполняют лишней работы: поиск, загрузка и
+сохранение оборачиваются в замер времени только у включившей метрики
+системы, а посадка проверяет одно поле.
+
+Показатели заполненности транспорта не обновляются при каждой посадке,
+а вычисляются в момент снимка или экспорта.
+
+Пример:
+    metrics = system.enable_metrics()
+    ...
+    metrics.write_prometheus("transport.prom")
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from transport_io import write_atomic
+
+# Границы корзин гистограммы задержек, секунды
+DEFAULT_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+TIMED_METHODS = (
+    "find_transport", "find_passenger", "find_route",
+    "load_from_json", "load_from_xml", "load_from_binary", "load_from_shards", "load_from_sqlite",
+    "load_from_segments",
+    "save_to_json", "save_to_xml", "save_to_binary", "save_to_shards", "save_to_sqlite",
+    "save_to_segments",
+)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _ThreadCells:
+    """Ячейки значений по потокам
+
+    Каждый поток пишет только в свою ячейку, поэтому запись обходится
+    без блокировки и без потерь при параллельной работе; при снимке
+    ячейки всех потоков складываются.
+    """
+    __slots__ = ("_local", "_cells", "_lock", "_size")
+
+    def __init__(self, size):
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()
+        self._size = size
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0] * self._size
+            with self._lock:
+                self._cells.append(cell)
+            return cell
+
+    def total(self):
+        with self._lock:
+            cells = list(self._cells)
+        return [sum(values) for values in zip(*cells)] if cells else [0] * self._size
+
+
+class _CounterValue(_ThreadCells):
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self.cell()[0] += amount
+
+    @property
+    def value(self):
+        return self.total()[0]
+
+
+class Counter:
+    """Монотонный счетчик; labels - значения меток в порядке labelnames
+
+    labels() возвращает значение для набора меток, которое можно
+    сохранить и увеличивать без поиска по словарю.
+    """
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def labels(self, labels=()):
+        child = self._values.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._values.setdefault(labels, _CounterValue())
+        return child
+
+    def inc(self, amount=1, labels=()):
+        self.labels(labels).inc(amount)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(labels, child.value) for labels, child in values]
+
+    def snapshot(self):
+        return [
+            {"labels": dict(zip(self.labelnames, labels)), "value": value}
+            for labels, value in self.samples()
+        ]
+
+    def prometheus_lines(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.samples()
+        ]
+
+
+class _HistogramValue(_ThreadCells):
+    # Ячейка: счетчики корзин (последняя - +Inf), затем сумма и количество
+    __slots__ = ("buckets",)
+
+    def __init__(self, buckets):
+        super().__init__(len(buckets) + 3)
+        self.buckets = buckets
+
+    def observe(self, value):
+        cell = self.cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def state(self):
+        values = self.total()
+        return values[:-2], values[-2], values[-1]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (le - верхняя граница включительно)"""
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def labels(self, labels=()):
+        child = self._values.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._values.setdefault(labels, _HistogramValue(self.buckets))
+        return child
+
+    def observe(self, value, labels=()):
+        self.labels(labels).observe(value)
+
+    def samples(self):
+        """Пары (labels, (накопленные счетчики по корзинам, сумма, количество))"""
+        with self._lock:
+            values = list(self._values.items())
+        result = []
+        for labels, child in values:
+            counts, total, count = child.state()
+            cumulative = []
+            running = 0
+            for bucket_count in counts:
+                running += bucket_count
+                cumulative.append(running)
+            result.append((labels, (cumulative, total, count)))
+        return result
+
+    def snapshot(self):
+        bounds = self.buckets + (float("inf"),)
+        return [
+            {
+                "labels": dict(zip(self.labelnames, labels)),
+                "buckets": {_format_value(bound): value for bound, value in zip(bounds, cumulative)},
+                "sum": total,
+                "count": count
+            }
+            for labels, (cumulative, total, count) in self.samples()
+        ]
+
+    def prometheus_lines(self):
+        bounds = self.buckets + (float("inf"),)
+        lines = []
+        for labels, (cumulative, total, count) in self.samples():
+            for bound, value in zip(bounds, cumulative):
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {value}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {_format_value(total)}")
+            lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+class Gauge:
+    """Показатель, значения которого вычисляет collect() в момент снимка
+
+    collect возвращает пары (значения меток, значение).
+    """
+    type = "gauge"
+
+    def __init__(self, name, help_text, labelnames, collect):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        return list(self.collect())
+
+    def snapshot(self):
+        return [
+            {"labels": dict(zip(self.labelnames, labels)), "value": value}
+            for labels, value in self.samples()
+        ]
+
+    def prometheus_lines(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.samples()
+        ]
+
+
+class MetricsRegistry:
+    """Набор метрик с экспортом в словарь и текстовый формат Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, labelnames, collect):
+        return self._add(Gauge(name, help_text, labelnames, collect))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def snapshot(self):
+        """Текущие значения всех метрик в виде словаря"""
+        return {
+            name: {"type": metric.type, "help": metric.help, "samples": metric.snapshot()}
+            for name, metric in self._metrics.items()
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename):
+        """Запись в файл через transport_io.write_atomic, чтобы сборщик
+        (например, textfile collector) не прочитал файл наполовину"""
+        text = self.to_prometheus()
+        write_atomic(filename, lambda f: f.write(text))
+
+
+class TransportMetrics:
+    """Метрики одной транспортной системы"""
+
+    def __init__(self, system, registry=None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        self.boardings = self.registry.counter(
+            "transport_boardings_total", "Успешные посадки пассажиров"
+        )
+        self.errors = self.registry.counter(
+            "transport_errors_total", "Отклоненные операции по типу ошибки", ("error",)
+        )
+        self.latency = self.registry.histogram(
+            "transport_operation_seconds", "Время выполнения операций", ("operation",)
+        )
+        # Значения для посадки создаются заранее: горячий путь обходится без поиска меток
+        self._boarded = self.boardings.labels()
+        self._boarding_latency = self.latency.labels(("add_passenger",))
+        self.registry.gauge(
+            "transport_passengers", "Пассажиров в транспорте", ("transport_id",),
+            lambda: (((str(transport.id),), len(transport.passengers)) for transport in system.transports)
+        )
+        self.registry.gauge(
+            "transport_occupancy_ratio", "Доля занятых мест в транспорте", ("transport_id",),
+            lambda: (
+                ((str(transport.id),), len(transport.passengers) / transport.capacity)
+                for transport in system.transports if transport.capacity
+            )
+        )
+
+    def snapshot(self):
+        return self.registry.snapshot()
+
+    def write_prometheus(self, filename):
+        self.registry.write_prometheus(filename)
+
+    def count_error(self, error):
+        self.errors.inc(1, (type(error).__name__,))
+
+    def count_batch(self, result):
+        if result.accepted:
+            self.boardings.inc(len(result.accepted))
+        for _, error in result.rejected:
+            self.count_error(error)
+
+    def timed_boarding(self, add_passenger, passenger):
+        started = time.perf_counter()
+        boarded = add_passenger(passenger)
+        self._boarding_latency.observe(time.perf_counter() - started)
+        if boarded:
+            self._boarded.inc()
+        return boarded
+
+    def timed(self, operation, method):
+        observe = self.latency.labels((operation,)).observe
+        clock = time.perf_counter
+
+        def timed_method(*args, **kwargs):
+            started = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                observe(clock() - started)
+
+        return timed_method
+
+    def instrument(self, system):
+        """Замер времени методов из TIMED_METHODS у данной системы"""
+        for name in TIMED_METHODS:
+            setattr(system, name, self.timed(name, getattr(type(system), name).__get__(system)))
+
+    @staticmethod
+    def uninstrument(system):
+        for name in TIMED_METHODS:
+            system.__dict__.pop(name, None)
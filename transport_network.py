@@ -0,0 +1,150 @@
+"""Граф остановок и поиск поездок с пересадками
+
+Вершины графа - остановки (start_point и end_point маршрутов), ребра -
+маршруты, на которые назначен хотя бы один транспорт. По умолчанию
+маршрут обслуживается в обе стороны.
+
+Для каждой остановки отправления дерево кратчайших путей строится один
+раз: без весов - поиском в ширину (наименьшее число пересадок), с
+функцией веса маршрута - алгоритмом Дейкстры. Найденные поездки
+кэшируются, поэтому повторные запросы и запросы из той же остановки
+в другие выполняются без обхода графа.
+
+Кэш сбрасывается при изменении сети: TransportSystem увеличивает счетчик
+_network_version при добавлении маршрутов и транспорта, назначении
+маршрута и загрузке из файла. Прямое присваивание transport.route в
+обход системы сеть не видит.
+"""
+import heapq
+from collections import deque
+
+
+class RouteNetwork:
+    def __init__(self, system, bidirectional=True, max_cached=100000):
+        self.system = system
+        self.bidirectional = bidirectional
+        self.max_cached = max_cached
+
+        self._version = None
+        # остановка -> [(соседняя остановка, маршрут)]
+        self._adjacency = {}
+        # id маршрута -> транспорт на нем
+        self._vehicles = {}
+        # (отправление, вес) -> {остановка: (предыдущая остановка, маршрут)}
+        self._trees = {}
+        # (отправление, назначение, вес) -> поездка
+        self._journeys = {}
+
+    def _refresh(self):
+        if self._version != self.system._network_version:
+            self._build()
+
+    def _build(self):
+        self._version = self.system._network_version
+        routes = {}
+        vehicles = {}
+        for transport in self.system.transports:
+            route = transport.route
+            if route is not None:
+                routes[route.id] = route
+                vehicles.setdefault(route.id, []).append(transport)
+
+        adjacency = {}
+        for route in routes.values():
+            adjacency.setdefault(route.start_point, []).append((route.end_point, route))
+            if self.bidirectional:
+                adjacency.setdefault(route.end_point, []).append((route.start_point, route))
+            else:
+                adjacency.setdefault(route.end_point, [])
+
+        self._adjacency = adjacency
+        self._vehicles = vehicles
+        self._trees = {}
+        self._journeys = {}
+
+    def stops(self):
+        """Остановки, которые обслуживает хотя бы один маршрут с транспортом"""
+        self._refresh()
+        return list(self._adjacency)
+
+    def has_stop(self, stop):
+        self._refresh()
+        return stop in self._adjacency
+
+    def vehicles(self, route):
+        """Транспорт, назначенный на маршрут"""
+        self._refresh()
+        return list(self._vehicles.get(route.id, ()))
+
+    def _bfs(self, origin):
+        parents = {origin: None}
+        queue = deque((origin,))
+        adjacency = self._adjacency
+        while queue:
+            stop = queue.popleft()
+            for neighbor, route in adjacency[stop]:
+                if neighbor not in parents:
+                    parents[neighbor] = (stop, route)
+                    queue.append(neighbor)
+        return parents
+
+    def _dijkstra(self, origin, weight):
+        parents = {origin: None}
+        distances = {origin: 0}
+        # Счетчик в кортеже нужен, чтобы куча не сравнивала остановки с равным весом
+        heap = [(0, 0, origin)]
+        counter = 1
+        adjacency = self._adjacency
+        done = set()
+        while heap:
+            distance, _, stop = heapq.heappop(heap)
+            if stop in done:
+                continue
+            done.add(stop)
+            for neighbor, route in adjacency[stop]:
+                candidate = distance + weight(route)
+                if candidate < distances.get(neighbor, float("inf")):
+                    distances[neighbor] = candidate
+                    parents[neighbor] = (stop, route)
+                    heapq.heappush(heap, (candidate, counter, neighbor))
+                    counter += 1
+        return parents
+
+    def plan(self, origin, destination, weight=None):
+        """Поездка из origin в destination
+
+        Возвращает кортеж участков (откуда, куда, маршрут): пустой, если
+        остановки совпадают, и None, если проехать нельзя. weight(route) -
+        неотрицательная стоимость маршрута для алгоритма Дейкстры; без нее
+        ищется поездка с наименьшим числом пересадок.
+        """
+        self._refresh()
+        key = (origin, destination, weight)
+        journey = self._journeys.get(key, False)
+        if journey is not False:
+            return journey
+
+        if origin not in self._adjacency or destination not in self._adjacency:
+            return None
+
+        tree_key = (origin, weight)
+        parents = self._trees.get(tree_key)
+        if parents is None:
+            parents = self._bfs(origin) if weight is None else self._dijkstra(origin, weight)
+            self._trees[tree_key] = parents
+
+        if destination not in parents:
+            journey = None
+        else:
+            legs = []
+            stop = destination
+            while parents[stop] is not None:
+                previous, route = parents[stop]
+                legs.append((previous, stop, route))
+                stop = previous
+            journey = tuple(reversed(legs))
+
+        if len(self._journeys) >= self.max_cached:
+            self._journeys.clear()
+        self._journeys[key] = journey
+        return journey
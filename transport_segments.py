@@ -0,0 +1,284 @@
+"""Сегментированный снимок с инкрементальной записью
+
+Каталог снимка содержит:
+    SEGMENTS.json                                - формат, размер сегмента,
+                                                   поколение и файлы секций
+    segment-<секция>-NNNNNN-GGGGGG.json (.xml)  - записи секции с номерами
+                                                   [N * chunk_size, (N + 1) * chunk_size)
+
+Секции режутся на сегменты по позиции записи в списках системы. Списки
+только пополняются в конец, поэтому запись всегда остается в своем
+сегменте. После первой полной записи система отмечает изменения
+(ChangeTracker, подключается к TransportSystem._record):
+    - посадка, высадка и назначение маршрута помечают сегмент своего
+      транспорта;
+    - пассажиры и маршруты после регистрации не меняются, а новые записи
+      всех секций попадают в хвостовые сегменты.
+Следующая запись в тот же каталог переписывает только помеченные и
+хвостовые сегменты, поэтому контрольная точка почти неизменной сети
+стоит пропорционально изменениям, а не размеру системы.
+
+Сегменты пишутся в файлы нового поколения, затем через os.replace
+заменяется SEGMENTS.json, и только после этого удаляются файлы, на
+которые новый манифест не ссылается. Сбой в любой момент оставляет
+действующим прежний или новый снимок целиком. Каждый сегмент - обычный
+документ save_to_json / save_to_xml с одной секцией.
+"""
+import json
+import os
+import threading
+from itertools import islice
+
+from transport_io import (
+    SECTIONS,
+    XML_TEXT,
+    fsync_directory,
+    json_sections,
+    write_atomic,
+    xml_sections,
+)
+from transport_system import (
+    FileOperationError,
+    InvalidDataError,
+    _OCCUPANCY_OPERATIONS,
+    _passenger_to_data,
+    _route_to_data,
+    _transport_to_data,
+    _write_json_stream,
+    _write_xml_stream,
+)
+
+MANIFEST = "SEGMENTS.json"
+VERSION = 1
+FORMATS = ("json", "xml")
+
+_TO_DATA = {
+    "transports": _transport_to_data,
+    "passengers": _passenger_to_data,
+    "routes": _route_to_data,
+}
+
+# Мутации, меняющие запись уже сохраненного транспорта
+_TRANSPORT_CHANGES = _OCCUPANCY_OPERATIONS | {"assign_route"}
+
+
+def _segment_name(section, index, generation, file_format):
+    return f"segment-{section}-{index:06d}-{generation:06d}.{file_format}"
+
+
+def read_manifest(directory):
+    """Манифест сегментированного снимка или None, если снимка в каталоге нет"""
+    try:
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise FileOperationError(f"Поврежден {MANIFEST} в {directory}: {e}")
+
+    if manifest.get("version") != VERSION or manifest.get("format") not in FORMATS:
+        raise FileOperationError(f"Неподдерживаемый манифест сегментов в {directory}")
+    return manifest
+
+
+class ChangeTracker:
+    """Изменения системы с последней записи в каталог сегментов
+
+    Хранит номер строки каждого транспорта и для измененных сегментов
+    транспорта - номер последнего изменения системы (_version) в нем.
+    Сегмент записан, если его номер не больше номера среза, с которого
+    шла запись (version): номер изменению выдается под блокировкой
+    транспорта, а срез берет блокировки всего транспорта, поэтому
+    изменение с меньшим номером уже есть в срезе. Новые пассажиры,
+    маршруты и транспорт определяются по числу записей в манифесте.
+    """
+
+    def __init__(self, directory, file_format, chunk_size, manifest, transports, version=0):
+        self.directory = os.path.abspath(directory)
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.manifest = manifest
+        self.version = version
+        self._rows = {transport.id: row for row, transport in enumerate(transports)}
+        self._dirty = {}
+        self._lock = threading.Lock()
+
+    def matches(self, directory, file_format, chunk_size):
+        return (self.directory == os.path.abspath(directory)
+                and self.file_format == file_format and self.chunk_size == chunk_size)
+
+    def apply(self, operation, args, version):
+        """Учет одной мутации системы (вызывается из TransportSystem._record)"""
+        with self._lock:
+            if operation in _TRANSPORT_CHANGES:
+                self._dirty[self._rows[args[0].id] // self.chunk_size] = version
+            elif operation == "add_transport":
+                self._rows[args[0].id] = len(self._rows)
+            elif operation == "add_transports":
+                for transport in args[0]:
+                    self._rows[transport.id] = len(self._rows)
+
+    def changed(self):
+        """Сегменты транспорта, измененные после последней записи"""
+        with self._lock:
+            return {index for index, version in self._dirty.items() if version > self.version}
+
+    def saved(self, manifest, version):
+        """Записан срез с номером version: более ранние отметки не нужны"""
+        with self._lock:
+            self.manifest = manifest
+            self.version = version
+            self._dirty = {index: changed for index, changed in self._dirty.items() if changed > version}
+
+
+def _write_segment(path, section, records, file_format):
+    records = map(_TO_DATA[section], records)
+    if file_format == "xml":
+        write_atomic(path, lambda f: _write_xml_stream(
+            f, ((section, map(XML_TEXT[section], records)),), serialize=str
+        ))
+    else:
+        write_atomic(path, lambda f: _write_json_stream(f, ((section, records),), compact=True))
+
+
+def _chunks_to_write(old, count, chunk_size, changed=()):
+    """Номера сегментов секции, которые нужно переписать, по возрастанию
+
+    Кроме измененных это хвост: последний неполный сегмент прошлой
+    записи и все новые, если в секции появились записи.
+    """
+    total = -(-count // chunk_size)
+    written_count = sum(segment["count"] for segment in old)
+    tail = min(written_count // chunk_size, len(old)) if count != written_count else len(old)
+    return sorted(set(range(tail, total)).union(index for index in changed if index < total))
+
+
+def write_segments(system, directory, file_format="json", chunk_size=256):
+    """Запись системы в каталог сегментов; возвращает (записано сегментов, всего)
+
+    Если система уже писала в этот каталог с теми же форматом и размером
+    сегмента, а манифест с тех пор не менялся, переписываются только
+    измененные и хвостовые сегменты, иначе все.
+    """
+    if file_format not in FORMATS:
+        raise InvalidDataError(f"Неизвестный формат сегментов: {file_format}")
+    if chunk_size < 1:
+        raise InvalidDataError("Размер сегмента должен быть положительным")
+
+    os.makedirs(directory, exist_ok=True)
+    previous = read_manifest(directory)
+    tracker = system.changes
+    incremental = (
+        tracker is not None and tracker.matches(directory, file_format, chunk_size)
+        and previous is not None and tracker.manifest is not None
+        and previous["generation"] == tracker.manifest["generation"]
+    )
+    if not incremental:
+        # Строки транспорта фиксируются вместе с подключением учета,
+        # чтобы параллельная регистрация не сдвинула нумерацию
+        with system._registry_lock:
+            tracker = ChangeTracker(directory, file_format, chunk_size, None, system.transports)
+            system.changes = tracker
+
+    old_sections = previous["sections"] if incremental else {}
+    captured = {}
+
+    def select(transports):
+        # Вызывается под блокировками среза, поэтому отметки изменений
+        # согласованы с запоминаемым состоянием
+        count = captured["transports"] = len(transports)
+        indices = captured["indices"] = _chunks_to_write(
+            old_sections.get("transports", ()), count, chunk_size, tracker.changed()
+        )
+        return [
+            row for index in indices
+            for row in range(index * chunk_size, min((index + 1) * chunk_size, count))
+        ]
+
+    # В отличие от snapshot() копируется только транспорт переписываемых
+    # сегментов, а не вся система
+    state, passengers, routes, version = system._capture(select)
+    clones = iter([transport._snapshot_copy(route, riders) for transport, route, riders in state])
+    generation = previous["generation"] + 1 if previous else 1
+    written = 0
+    manifest = {
+        "version": VERSION,
+        "format": file_format,
+        "chunk_size": chunk_size,
+        "generation": generation,
+        "sections": {}
+    }
+
+    for section, count, indices, records in (
+        ("transports", captured["transports"], captured["indices"],
+         lambda start, stop: islice(clones, stop - start)),
+        ("passengers", len(passengers), None, passengers.rows),
+        ("routes", len(routes), None, lambda start, stop: routes[start:stop]),
+    ):
+        manifest[section] = count
+        old = old_sections.get(section, [])
+        if indices is None:
+            indices = _chunks_to_write(old, count, chunk_size)
+        segments = old[:]
+        for index in indices:
+            start = index * chunk_size
+            stop = min(start + chunk_size, count)
+            name = _segment_name(section, index, generation, file_format)
+            _write_segment(os.path.join(directory, name), section, records(start, stop), file_format)
+            segment = {"file": name, "count": stop - start}
+            if index < len(segments):
+                segments[index] = segment
+            else:
+                segments.append(segment)
+            written += 1
+        manifest["sections"][section] = segments
+
+    write_atomic(
+        os.path.join(directory, MANIFEST),
+        lambda f: f.write(json.dumps(manifest, ensure_ascii=False, separators=(",", ":")))
+    )
+    fsync_directory(directory)
+    tracker.saved(manifest, version)
+
+    current = {segment["file"] for segments in manifest["sections"].values() for segment in segments}
+    for name in os.listdir(directory):
+        if name.startswith("segment-") and name not in current:
+            os.remove(os.path.join(directory, name))
+    return written, sum(len(segments) for segments in manifest["sections"].values())
+
+
+def iter_section(directory, manifest, section):
+    """Словари записей секции по всем ее сегментам, по одной"""
+    file_format = manifest["format"]
+    for segment in manifest["sections"][section]:
+        path = os.path.join(directory, segment["file"])
+        count = 0
+        try:
+            with open(path, 'rb' if file_format == "xml" else 'r',
+                      encoding=None if file_format == "xml" else 'utf-8') as f:
+                sections = xml_sections(f) if file_format == "xml" else json_sections(f)
+                for name, records in sections:
+                    if name != section:
+                        raise FileOperationError(f"Сегмент {segment['file']} содержит секцию {name}")
+                    for record in records:
+                        count += 1
+                        yield record
+        except FileNotFoundError:
+            raise FileOperationError(f"Нет сегмента {segment['file']} в {directory}")
+        if count != segment["count"]:
+            raise FileOperationError(
+                f"Число записей в сегменте {segment['file']} ({count}) не совпадает с манифестом ({segment['count']})"
+            )
+
+
+def track_loaded(system, directory, manifest):
+    """Учет изменений после загрузки из каталога: следующая запись будет инкрементальной
+
+    Подключается, только если загружены все записи, иначе номера строк
+    системы не совпадут с сегментами.
+    """
+    if all(len(getattr(system, section)) == manifest[section] for section in SECTIONS):
+        system.changes = ChangeTracker(
+            directory, manifest["format"], manifest["chunk_size"], manifest,
+            system.transports, system._version
+        )
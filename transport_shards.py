@@ -0,0 +1,237 @@
+"""Шардированные снимки транспортной системы
+
+Каталог снимка содержит:
+    SHARDS.json                   - поколение, формат и список шардов
+    shard-GGGGGG-NNN.json (.xml)  - шарды текущего поколения
+
+Транспорт распределяется по шардам по остатку id от деления на число
+шардов, пассажиры в транспорте пишутся в шард своего транспорта,
+остальные пассажиры и маршруты - по остатку своего id. Маршрут, на
+котором работает транспорт из другого шарда, дублируется в шард этого
+транспорта, поэтому каждый шард - самостоятельный файл обычного формата,
+который читается и load_from_json / load_from_xml.
+
+Записи раскладываются по шардам одним проходом по системе, после чего
+каждый шард сериализуется независимо. При workers > 1 шарды пишутся и
+разбираются в пуле процессов: пишущие процессы создаются через fork и
+получают только свой готовый список объектов (где fork недоступен,
+шарды пишутся по очереди в текущем процессе). Объекты при загрузке
+все равно создаются и связываются в текущем процессе, а выигрыш от
+процессов на многоядерной машине не измерен, поэтому по умолчанию
+workers = 1. Новое поколение становится действующим заменой
+SHARDS.json через os.replace, после чего файлы прошлого поколения
+удаляются.
+
+Порядок записей после загрузки отличается от исходного: транспорт,
+пассажиры и маршруты идут по шардам, внутри шарда - в порядке системы.
+"""
+import json
+import multiprocessing
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from transport_io import fsync_directory, write_atomic
+from transport_system import (
+    FileOperationError,
+    InvalidDataError,
+    _iter_xml_records,
+    _passenger_data_from_xml,
+    _passenger_data_to_xml,
+    _passenger_to_data,
+    _route_data_from_xml,
+    _route_data_to_xml,
+    _route_to_data,
+    _transport_data_from_xml,
+    _transport_data_to_xml,
+    _transport_to_data,
+    _write_json_stream,
+    _write_xml_stream,
+)
+
+MANIFEST = "SHARDS.json"
+VERSION = 1
+FORMATS = ("json", "xml")
+
+# Разложенные по шардам объекты для пишущих процессов; задаются перед fork
+_shared_shards = None
+
+
+def _shard_name(generation, index, file_format):
+    return f"shard-{generation:06d}-{index:03d}.{file_format}"
+
+
+def read_manifest(directory):
+    """Манифест шардированного снимка или None, если снимка в каталоге нет"""
+    try:
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        raise FileOperationError(f"Поврежден {MANIFEST} в {directory}: {e}")
+
+    if manifest.get("version") != VERSION or manifest.get("format") not in FORMATS:
+        raise FileOperationError(f"Неподдерживаемый манифест шардов в {directory}")
+    return manifest
+
+
+def _partition(system, count):
+    """Объекты шардов за один проход: список (транспорт, пассажиры, маршруты)"""
+    shards = [([], [], {}) for _ in range(count)]
+    for route in system.routes:
+        shards[route.id % count][2][route.id] = route
+    for transport in system.transports:
+        transports, passengers, routes = shards[transport.id % count]
+        transports.append(transport)
+        passengers.extend(transport.passengers)
+        if transport.route is not None:
+            routes.setdefault(transport.route.id, transport.route)
+
+    locations = system._passenger_locations
+    for passenger in system.passengers:
+        if passenger.id not in locations:
+            shards[passenger.id % count][1].append(passenger)
+    return [(transports, passengers, list(routes.values())) for transports, passengers, routes in shards]
+
+
+def _write_shard(path, shard, file_format):
+    transports, passengers, routes = (list(map(to_data, records)) for to_data, records in zip(
+        (_transport_to_data, _passenger_to_data, _route_to_data), shard
+    ))
+    if file_format == "xml":
+        sections = (
+            ("transports", map(_transport_data_to_xml, transports)),
+            ("passengers", map(_passenger_data_to_xml, passengers)),
+            ("routes", map(_route_data_to_xml, routes))
+        )
+        write_atomic(path, lambda f: _write_xml_stream(f, sections))
+    else:
+        sections = (("transports", transports), ("passengers", passengers), ("routes", routes))
+        write_atomic(path, lambda f: _write_json_stream(f, sections, compact=True))
+    return {
+        "file": os.path.basename(path),
+        "transports": len(transports),
+        "passengers": len(passengers),
+        "routes": len(routes)
+    }
+
+
+def _write_shared_shard(path, index, file_format):
+    return _write_shard(path, _shared_shards[index], file_format)
+
+
+def write_shards(system, directory, shards=4, file_format="json", workers=1):
+    """Запись системы в новое поколение шардированного снимка"""
+    global _shared_shards
+
+    if file_format not in FORMATS:
+        raise InvalidDataError(f"Неизвестный формат шардов: {file_format}")
+    if shards < 1:
+        raise InvalidDataError("Число шардов должно быть положительным")
+
+    os.makedirs(directory, exist_ok=True)
+    previous = read_manifest(directory)
+    generation = previous["generation"] + 1 if previous else 1
+    paths = [
+        os.path.join(directory, _shard_name(generation, index, file_format))
+        for index in range(shards)
+    ]
+    partitions = _partition(system, shards)
+
+    workers = min(workers or 1, shards)
+    if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        _shared_shards = partitions
+        try:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                written = list(pool.map(
+                    _write_shared_shard, paths, range(shards), [file_format] * shards
+                ))
+        finally:
+            _shared_shards = None
+    else:
+        written = [
+            _write_shard(path, shard, file_format)
+            for path, shard in zip(paths, partitions)
+        ]
+
+    manifest = {
+        "version": VERSION,
+        "generation": generation,
+        "format": file_format,
+        "transports": len(system.transports),
+        "passengers": len(system.passengers),
+        "routes": len(system.routes),
+        "shards": written
+    }
+    write_atomic(
+        os.path.join(directory, MANIFEST),
+        lambda f: json.dump(manifest, f, ensure_ascii=False, indent=2)
+    )
+    fsync_directory(directory)
+
+    current = {shard["file"] for shard in written}
+    for name in os.listdir(directory):
+        if name.startswith("shard-") and name not in current:
+            os.remove(os.path.join(directory, name))
+    return manifest
+
+
+def _read_shard(path, file_format):
+    """Разбор одного шарда в пуле: словари (транспорт, пассажиры, маршруты)"""
+    if file_format == "xml":
+        records = {"transport": [], "passenger": [], "route": []}
+        readers = {
+            "transport": _transport_data_from_xml,
+            "passenger": _passenger_data_from_xml,
+            "route": _route_data_from_xml
+        }
+        for elem in _iter_xml_records(path):
+            records[elem.tag].append(readers[elem.tag](elem))
+        return records["transport"], records["passenger"], records["route"]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)["transport_system"]
+    return data["transports"], data["passengers"], data["routes"]
+
+
+def read_shards(directory, workers=1):
+    """Разбор всех шардов текущего поколения
+
+    Возвращает (транспорт, пассажиры, маршруты) в виде словарей;
+    дубликаты маршрутов из разных шардов сводятся к одной записи.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileOperationError(f"В каталоге {directory} нет шардированного снимка")
+
+    paths = [os.path.join(directory, shard["file"]) for shard in manifest["shards"]]
+    formats = [manifest["format"]] * len(paths)
+    workers = min(workers or 1, len(paths))
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                shards = list(pool.map(_read_shard, paths, formats))
+        else:
+            shards = list(map(_read_shard, paths, formats))
+    except ET.ParseError as e:
+        raise FileOperationError(f"Некорректный XML в шарде: {e}")
+    except ValueError as e:
+        raise FileOperationError(f"Некорректный JSON в шарде: {e}")
+
+    routes = {}
+    for _, _, shard_routes in shards:
+        for route_data in shard_routes:
+            known = routes.setdefault(route_data["id"], route_data)
+            if known != route_data:
+                raise InvalidDataError(f"Маршрут с ID {route_data['id']} различается в шардах")
+
+    transports = list(chain.from_iterable(shard[0] for shard in shards))
+    passengers = list(chain.from_iterable(shard[1] for shard in shards))
+    for name, records in (("transports", transports), ("passengers", passengers), ("routes", routes)):
+        if len(records) != manifest[name]:
+            raise FileOperationError(
+                f"Число записей {name} в шардах ({len(records)}) не совпадает с манифестом ({manifest[name]})"
+            )
+    return transports, passengers, list(routes.values())
@@ -0,0 +1,390 @@
+"""Бинарный снимок транспортной системы с ленивым доступом через mmap
+
+Формат (все числа little-endian):
+    заголовок   - сигнатура TSNP, версия и таблица секций (смещение, количество)
+    routes      - записи маршрутов фиксированной длины
+    passengers  - записи пассажиров фиксированной длины
+    transports  - записи транспорта фиксированной длины
+    boardings   - ID пассажиров в транспорте подряд (int64)
+    *_index     - пары (id, номер записи), отсортированные по id
+    heap        - строки в UTF-8, на которые ссылаются записи
+
+Строки в записях задаются парой (смещение в heap, длина в байтах).
+Открытие снимка читает только заголовок и сверяет таблицу секций с
+размером файла; объекты Route, Passenger и Transport создаются при
+первом обращении к ним.
+"""
+import logging
+import mmap
+import os
+import struct
+
+from transport_io import write_atomic
+from transport_system import (
+    CallbackSink,
+    FileOperationError,
+    InvalidDataError,
+    PassengerSet,
+    TYPE_CODES,
+    TYPE_NAMES,
+    TransportSystem,
+    _passenger_data_to_xml,
+    _passenger_from_data,
+    _route_data_to_xml,
+    _route_from_data,
+    _transport_data_to_xml,
+    _transport_from_data,
+    _write_json_stream,
+    _write_xml_stream,
+)
+
+MAGIC = b"TSNP"
+VERSION = 1
+
+SECTIONS = (
+    "routes", "passengers", "transports", "boardings",
+    "route_index", "passenger_index", "transport_index", "heap",
+)
+
+_HEADER = struct.Struct("<4sHH" + "QQ" * len(SECTIONS))
+_ROUTE = struct.Struct("<qQIQI")
+_PASSENGER = struct.Struct("<qQIQIQI")
+_TRANSPORT = struct.Struct("<qB7xqQIQIqqQI")
+_BOARDING = struct.Struct("<q")
+_INDEX_ENTRY = struct.Struct("<qq")
+
+# Размер записи каждой секции; у heap количество задано в байтах
+_RECORD_SIZES = {
+    "routes": _ROUTE.size,
+    "passengers": _PASSENGER.size,
+    "transports": _TRANSPORT.size,
+    "boardings": _BOARDING.size,
+    "route_index": _INDEX_ENTRY.size,
+    "passenger_index": _INDEX_ENTRY.size,
+    "transport_index": _INDEX_ENTRY.size,
+    "heap": 1,
+}
+
+def _align(size, boundary=8):
+    return (size + boundary - 1) // boundary * boundary
+
+
+class _Heap:
+    """Накопитель строк для записи; одинаковые строки хранятся один раз"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets = {}
+
+    def ref(self, text):
+        if text is None:
+            return 0, 0
+        found = self._offsets.get(text)
+        if found is None:
+            encoded = text.encode('utf-8')
+            found = (len(self.data), len(encoded))
+            self.data += encoded
+            self._offsets[text] = found
+        return found
+
+
+def _index_bytes(ids):
+    return b"".join(
+        _INDEX_ENTRY.pack(record_id, row)
+        for record_id, row in sorted((record_id, row) for row, record_id in enumerate(ids))
+    )
+
+
+def write_snapshot(system, filename):
+    """Запись транспортной системы в бинарный снимок"""
+    heap = _Heap()
+    routes = bytearray()
+    passengers = bytearray()
+    transports = bytearray()
+    boardings = bytearray()
+    boarding_count = 0
+
+    for route in system.routes:
+        routes += _ROUTE.pack(route.id, *heap.ref(route.start_point), *heap.ref(route.end_point))
+
+    for passenger in system.passengers:
+        passengers += _PASSENGER.pack(
+            passenger.id, *heap.ref(passenger.name), *heap.ref(passenger.ticket_number),
+            *heap.ref(passenger.snils)
+        )
+
+    for transport in system.transports:
+        transport_type = getattr(transport, 'type', 'transport')
+        number = getattr(transport, 'bus_number', None) or getattr(transport, 'line_number', None)
+        passenger_ids = [passenger.id for passenger in transport.passengers]
+        transports += _TRANSPORT.pack(
+            transport.id,
+            TYPE_CODES.get(transport_type, 0),
+            transport.capacity,
+            *heap.ref(transport.name),
+            *heap.ref(number),
+            getattr(transport, 'carriages', 0),
+            transport.route.id if transport.route else 0,
+            boarding_count,
+            len(passenger_ids)
+        )
+        boardings += struct.pack(f"<{len(passenger_ids)}q", *passenger_ids)
+        boarding_count += len(passenger_ids)
+
+    sections = (
+        (routes, len(system.routes)),
+        (passengers, len(system.passengers)),
+        (transports, len(system.transports)),
+        (boardings, boarding_count),
+        (_index_bytes(route.id for route in system.routes), len(system.routes)),
+        (_index_bytes(passenger.id for passenger in system.passengers), len(system.passengers)),
+        (_index_bytes(transport.id for transport in system.transports), len(system.transports)),
+        (heap.data, len(heap.data)),
+    )
+
+    table = []
+    offset = _align(_HEADER.size)
+    for data, count in sections:
+        table += [offset, count]
+        offset = _align(offset + len(data))
+
+    def write(f):
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, *table))
+        for (data, _), section_offset in zip(sections, table[::2]):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(data)
+
+    # Файл заменяется, а не перезаписывается на месте: открытые
+    # SnapshotReader продолжают читать прежний через свой mmap
+    write_atomic(filename, write, binary=True)
+
+
+class SnapshotReader:
+    """Ленивое чтение бинарного снимка через mmap
+
+    find_* выполняют двоичный поиск по индексу в файле и создают объект
+    только для найденной записи. Созданные объекты кэшируются, поэтому
+    повторные обращения возвращают те же экземпляры.
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        try:
+            if os.fstat(self._file.fileno()).st_size < _HEADER.size:
+                raise InvalidDataError(f"Файл {filename} не является снимком транспортной системы")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (InvalidDataError, OSError, ValueError):
+            self._file.close()
+            raise
+
+        magic, version, _flags, *table = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise InvalidDataError(f"Файл {filename} не является снимком транспортной системы")
+        if version != VERSION:
+            self.close()
+            raise FileOperationError(f"Неподдерживаемая версия снимка: {version}")
+
+        self._sections = {
+            name: (table[2 * i], table[2 * i + 1]) for i, name in enumerate(SECTIONS)
+        }
+        size = len(self._mm)
+        for name, (offset, count) in self._sections.items():
+            if offset < _HEADER.size or offset + count * _RECORD_SIZES[name] > size:
+                self.close()
+                raise FileOperationError(f"Снимок {filename} поврежден: секция {name} выходит за конец файла")
+        self._heap_offset = self._sections["heap"][0]
+        self._routes = {}
+        self._passengers = {}
+        self._transports = {}
+
+    def close(self):
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def route_count(self):
+        return self._sections["routes"][1]
+
+    @property
+    def passenger_count(self):
+        return self._sections["passengers"][1]
+
+    @property
+    def transport_count(self):
+        return self._sections["transports"][1]
+
+    def _string(self, offset, length):
+        if not length:
+            return None
+        if offset + length > self._sections["heap"][1]:
+            raise FileOperationError("Снимок поврежден: строка выходит за пределы heap")
+        start = self._heap_offset + offset
+        try:
+            return str(self._mm[start:start + length], 'utf-8')
+        except UnicodeDecodeError as e:
+            raise FileOperationError(f"Снимок поврежден: {e}")
+
+    def _row_of(self, section, record_id):
+        """Двоичный поиск номера записи по id в индексной секции"""
+        offset, count = self._sections[section]
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            found_id, row = _INDEX_ENTRY.unpack_from(self._mm, offset + middle * _INDEX_ENTRY.size)
+            if found_id < record_id:
+                low = middle + 1
+            elif found_id > record_id:
+                high = middle
+            else:
+                return row
+        return None
+
+    # Записи в виде словарей того же формата, что и в JSON
+    def route_data(self, row):
+        offset = self._sections["routes"][0] + row * _ROUTE.size
+        route_id, start, start_len, end, end_len = _ROUTE.unpack_from(self._mm, offset)
+        return {
+            "id": route_id,
+            "start_point": self._string(start, start_len),
+            "end_point": self._string(end, end_len)
+        }
+
+    def passenger_data(self, row):
+        offset = self._sections["passengers"][0] + row * _PASSENGER.size
+        (passenger_id, name, name_len, ticket, ticket_len,
+         snils, snils_len) = _PASSENGER.unpack_from(self._mm, offset)
+        passenger_data = {
+            "id": passenger_id,
+            "name": self._string(name, name_len),
+            "ticket_number": self._string(ticket, ticket_len)
+        }
+        if snils_len:
+            passenger_data["snils"] = self._string(snils, snils_len)
+        return passenger_data
+
+    def transport_data(self, row):
+        offset = self._sections["transports"][0] + row * _TRANSPORT.size
+        (transport_id, type_code, capacity, name, name_len, number, number_len,
+         carriages, route_id, first, count) = _TRANSPORT.unpack_from(self._mm, offset)
+        if first + count > self._sections["boardings"][1]:
+            raise FileOperationError(f"Снимок поврежден: пассажиры транспорта {transport_id} вне секции boardings")
+        transport_type = TYPE_NAMES.get(type_code, "transport")
+        number = self._string(number, number_len)
+        boardings = self._sections["boardings"][0] + first * _BOARDING.size
+        return {
+            "id": transport_id,
+            "type": transport_type,
+            "name": self._string(name, name_len),
+            "capacity": capacity,
+            "bus_number": number if transport_type == "bus" else None,
+            "line_number": number if transport_type == "tram" else None,
+            "carriages": carriages if transport_type == "train" else None,
+            "route_id": route_id or None,
+            "passengers": list(struct.unpack_from(f"<{count}q", self._mm, boardings))
+        }
+
+    def iter_route_data(self):
+        return map(self.route_data, range(self.route_count))
+
+    def iter_passenger_data(self):
+        return map(self.passenger_data, range(self.passenger_count))
+
+    def iter_transport_data(self):
+        return map(self.transport_data, range(self.transport_count))
+
+    # Объекты создаются по требованию и кэшируются
+    def _route_at(self, row):
+        route = self._routes.get(row)
+        if route is None:
+            route = self._routes[row] = _route_from_data(self.route_data(row))
+        return route
+
+    def _passenger_at(self, row):
+        passenger = self._passengers.get(row)
+        if passenger is None:
+            passenger = self._passengers[row] = _passenger_from_data(self.passenger_data(row))
+        return passenger
+
+    def _transport_at(self, row):
+        transport = self._transports.get(row)
+        if transport is None:
+            transport_data = self.transport_data(row)
+            transport = _transport_from_data(transport_data)
+            if transport_data["route_id"]:
+                transport.route = self.find_route(transport_data["route_id"])
+            transport.passengers = PassengerSet(
+                passenger for passenger in map(self.find_passenger, transport_data["passengers"])
+                if passenger is not None
+            )
+            self._transports[row] = transport
+        return transport
+
+    def find_route(self, route_id):
+        row = self._row_of("route_index", route_id)
+        return None if row is None else self._route_at(row)
+
+    def find_passenger(self, passenger_id):
+        row = self._row_of("passenger_index", passenger_id)
+        return None if row is None else self._passenger_at(row)
+
+    def find_transport(self, transport_id):
+        row = self._row_of("transport_index", transport_id)
+        return None if row is None else self._transport_at(row)
+
+    def routes(self):
+        return map(self._route_at, range(self.route_count))
+
+    def passengers(self):
+        return map(self._passenger_at, range(self.passenger_count))
+
+    def transports(self):
+        return map(self._transport_at, range(self.transport_count))
+
+
+def open_snapshot(filename):
+    """Открытие снимка для ленивого чтения"""
+    return SnapshotReader(filename)
+
+
+def convert_to_snapshot(source, target):
+    """Преобразование JSON или XML файла в бинарный снимок"""
+    errors = []
+    system = TransportSystem(
+        events=CallbackSink(lambda level, text: errors.append(text), level=logging.ERROR)
+    )
+    if source.lower().endswith(".xml"):
+        system.load_from_xml(source, stream=True)
+    else:
+        system.load_from_json(source, stream=True)
+    if errors:
+        raise FileOperationError(errors[0])
+    write_snapshot(system, target)
+
+
+def convert_from_snapshot(source, target):
+    """Преобразование бинарного снимка в JSON или XML по расширению target
+
+    Записи переносятся по одной, без создания объектов предметной области.
+    """
+    with SnapshotReader(source) as reader:
+        if target.lower().endswith(".xml"):
+            write_atomic(target, lambda f: _write_xml_stream(f, (
+                ("transports", map(_transport_data_to_xml, reader.iter_transport_data())),
+                ("passengers", map(_passenger_data_to_xml, reader.iter_passenger_data())),
+                ("routes", map(_route_data_to_xml, reader.iter_route_data()))
+            )))
+        else:
+            write_atomic(target, lambda f: _write_json_stream(f, (
+                ("transports", reader.iter_transport_data()),
+                ("passengers", reader.iter_passenger_data()),
+                ("routes", reader.iter_route_data())
+            )))
@@ -0,0 +1,152 @@
+"""Пакетная проверка СНИЛС на массивах NumPy
+
+Номера разбираются и проверяются столбцом целиком: строки переводятся
+в матрицу кодов символов, из нее выбираются цифры, а контрольная сумма
+считается одним матричным умножением на веса 9..1. Правила те же, что
+у поштучной проверки transport_system.snils_reason:
+    - допускаются цифры, дефисы и пробелы, цифр должно быть 11;
+    - контрольное число - сумма цифр с весами 9..1 по модулю 101
+      (100 считается как 0);
+    - номера не больше 001-001-998 не проверяются.
+
+Требуется пакет numpy; загрузчики TransportSystem используют его
+автоматически, если он установлен.
+
+Пример:
+    result = validate_snils(["112-233-445 95", "112-233-445 00"])
+    result.valid        # array([ True, False])
+    result.errors()     # [(1, "неверная контрольная сумма")]
+
+Сверка с поштучной проверкой и разметкой файла с образцами:
+    python transport_snils.py test_snils.txt
+"""
+import sys
+
+import numpy as np
+
+from transport_system import SNILS_REASONS, _SNILS_UNCHECKED, snils_reason
+
+_WEIGHTS = np.arange(9, 0, -1, dtype=np.int64)
+_POWERS = 10 ** np.arange(8, -1, -1, dtype=np.int64)
+
+
+class SnilsValidation:
+    """Результат проверки столбца номеров
+
+    valid - маска корректных строк; reasons - коды причин из
+    SNILS_REASONS (0 - номер корректен); digits - матрица цифр (n, 11),
+    осмысленная только для строк с 11 цифрами.
+    """
+
+    def __init__(self, reasons, digits):
+        self.reasons = reasons
+        self.valid = reasons == 0
+        self.digits = digits
+
+    def __len__(self):
+        return len(self.reasons)
+
+    def errors(self):
+        """Пары (номер строки, причина) для некорректных номеров"""
+        rows = np.flatnonzero(self.reasons)
+        return [(int(row), SNILS_REASONS[int(self.reasons[row])]) for row in rows]
+
+
+def parse_snils(values):
+    """Матрица цифр (n, 11) и коды ошибок разбора для столбца номеров
+
+    None и пустые строки получают код 1, посторонние символы - 2,
+    число цифр, отличное от 11, - 3.
+    """
+    codes = np.asarray(["" if value is None else value for value in values], dtype=str)
+    count = len(codes)
+    width = codes.dtype.itemsize // 4
+    if count == 0 or width == 0:
+        return np.zeros((count, 11), dtype=np.int64), np.ones(count, dtype=np.int8)
+
+    # Строки фиксированной ширины в UTF-32: короткие дополнены нулевыми кодами
+    chars = codes.view(np.uint32).reshape(count, width)
+    is_digit = (chars >= 48) & (chars <= 57)
+    allowed = is_digit | (chars == 45) | (chars == 32) | (chars == 0)
+    digit_count = is_digit.sum(axis=1)
+
+    reasons = np.zeros(count, dtype=np.int8)
+    reasons[digit_count != 11] = 3
+    reasons[~allowed.all(axis=1)] = 2
+    reasons[(chars == 0).all(axis=1)] = 1
+
+    if width < 11:
+        return np.zeros((count, 11), dtype=np.int64), reasons
+    # Устойчивая сортировка по признаку "не цифра" ставит цифры в начало строки
+    positions = np.argsort(~is_digit, axis=1, kind="stable")[:, :11]
+    digits = np.take_along_axis(chars, positions, axis=1).astype(np.int64) - 48
+    return digits, reasons
+
+
+def snils_checksums(digits):
+    """Контрольные числа для матрицы цифр (n, 11) или (n, 9)"""
+    checksums = digits[:, :9] @ _WEIGHTS % 101
+    checksums[checksums == 100] = 0
+    return checksums
+
+
+def validate_snils(values):
+    """Проверка столбца номеров СНИЛС (строки или None)"""
+    digits, reasons = parse_snils(values)
+    parsed = reasons == 0
+    numbers = digits[:, :9] @ _POWERS
+    given = digits[:, 9] * 10 + digits[:, 10]
+    wrong = parsed & (numbers > _SNILS_UNCHECKED) & (snils_checksums(digits) != given)
+    reasons[wrong] = 4
+    return SnilsValidation(reasons, digits)
+
+
+def read_samples(filename):
+    """Номера из файла с разделами "Корректные" / "Некорректные": [(номер, ожидается корректным)]"""
+    samples = []
+    expected = None
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("Корректные"):
+                expected = True
+            elif line.startswith("Некорректные"):
+                expected = False
+            elif line and expected is not None:
+                samples.append((line, expected))
+    return samples
+
+
+def check_samples(samples):
+    """Расхождения пакетной проверки с поштучной и с разметкой
+
+    Возвращает список (номер, ожидается корректным, код пакетной
+    проверки, код поштучной проверки) для строк, где хотя бы одна
+    проверка не совпала.
+    """
+    result = validate_snils([number for number, _ in samples])
+    return [
+        (number, expected, reason, scalar)
+        for (number, expected), reason, scalar in zip(
+            samples, result.reasons.tolist(), (snils_reason(number) for number, _ in samples)
+        )
+        if reason != scalar or (not reason) != expected
+    ]
+
+
+def main(argv=None):
+    filename = (argv if argv is not None else sys.argv[1:] or ["test_snils.txt"])[0]
+    samples = read_samples(filename)
+    mismatches = check_samples(samples)
+    for number, expected, reason, scalar in mismatches:
+        print(
+            f"{number}: NumPy - {SNILS_REASONS[reason] if reason else 'корректен'}, "
+            f"цикл - {SNILS_REASONS[scalar] if scalar else 'корректен'}, "
+            f"в файле - {'корректный' if expected else 'некорректный'}"
+        )
+    print(f"Номеров: {len(samples)}, расхождений: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,532 @@
+"""Хранение транспортной системы в базе SQLite
+
+Таблицы:
+    routes      - маршруты
+    passengers  - пассажиры (номер билета уникален)
+    transports  - транспорт с id маршрута
+    boardings   - пассажиры в транспорте, по одной строке на пассажира
+Индексы по id, номеру билета, маршруту и типу транспорта и по
+транспорту в boardings позволяют находить отдельные записи без чтения
+всей базы. Порядок строк (rowid) совпадает с порядком в списках
+TransportSystem и сохраняется при выгрузке.
+
+Запись:
+    write_database  - полная перезапись базы состоянием системы в одной транзакции;
+    SqliteStorage   - дозапись мутаций системы (TransportSystem.enable_sqlite)
+                      пакетами: одна транзакция на batch_size мутаций или
+                      на flush_interval секунд. Пакет, транзакция которого
+                      не удалась, остается в очереди и пишется следующей
+                      попыткой (до retries попыток; пакет, нарушающий
+                      ограничения базы, сразу отбрасывается с ошибкой);
+                      при падении процесса незаписанные мутации теряются.
+Чтение:
+    SqliteReader    - объекты создаются только для найденных записей (open_database);
+                      база открывается только для чтения и не меняется.
+
+Пример:
+    with open_database("transport.db") as db:
+        db.find_passenger_by_ticket("B001")
+        db.find_transports_on_route(3)
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+from transport_io import write_atomic
+from transport_system import (
+    CallbackSink,
+    FileOperationError,
+    PassengerSet,
+    TransportSystem,
+    _passenger_data_to_xml,
+    _passenger_from_data,
+    _route_data_to_xml,
+    _route_from_data,
+    _transport_data_to_xml,
+    _transport_from_data,
+    _write_json_stream,
+    _write_xml_stream,
+)
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS routes (
+    id INTEGER NOT NULL,
+    start_point TEXT NOT NULL,
+    end_point TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS passengers (
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    ticket_number TEXT NOT NULL,
+    snils TEXT
+);
+CREATE TABLE IF NOT EXISTS transports (
+    id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    capacity INTEGER NOT NULL,
+    bus_number TEXT,
+    line_number TEXT,
+    carriages INTEGER,
+    route_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS boardings (
+    passenger_id INTEGER NOT NULL,
+    transport_id INTEGER NOT NULL
+);
+"""
+
+# Индексы отделены от таблиц: при полной перезаписи они удаляются и
+# строятся заново после вставки, что быстрее обновления на каждой строке
+_INDEXES = (
+    ("routes_id", "CREATE UNIQUE INDEX IF NOT EXISTS routes_id ON routes (id)"),
+    ("passengers_id", "CREATE UNIQUE INDEX IF NOT EXISTS passengers_id ON passengers (id)"),
+    ("passengers_ticket", "CREATE UNIQUE INDEX IF NOT EXISTS passengers_ticket ON passengers (ticket_number)"),
+    ("transports_id", "CREATE UNIQUE INDEX IF NOT EXISTS transports_id ON transports (id)"),
+    ("transports_route", "CREATE INDEX IF NOT EXISTS transports_route ON transports (route_id)"),
+    ("transports_type", "CREATE INDEX IF NOT EXISTS transports_type ON transports (type)"),
+    ("boardings_passenger", "CREATE UNIQUE INDEX IF NOT EXISTS boardings_passenger ON boardings (passenger_id)"),
+    ("boardings_transport", "CREATE INDEX IF NOT EXISTS boardings_transport ON boardings (transport_id)"),
+)
+
+_INSERT_ROUTE = "INSERT INTO routes (id, start_point, end_point) VALUES (?, ?, ?)"
+_INSERT_PASSENGER = "INSERT INTO passengers (id, name, ticket_number, snils) VALUES (?, ?, ?, ?)"
+_INSERT_TRANSPORT = (
+    "INSERT INTO transports (id, type, name, capacity, bus_number, line_number, carriages, route_id)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_INSERT_BOARDING = "INSERT INTO boardings (passenger_id, transport_id) VALUES (?, ?)"
+_DELETE_BOARDING = "DELETE FROM boardings WHERE passenger_id = ?"
+_UPDATE_ROUTE = "UPDATE transports SET route_id = ? WHERE id = ?"
+
+_ROUTE_COLUMNS = "id, start_point, end_point"
+_PASSENGER_COLUMNS = "id, name, ticket_number, snils"
+_TRANSPORT_COLUMNS = "id, type, name, capacity, bus_number, line_number, carriages, route_id"
+_BOARDED_PASSENGERS = (
+    "SELECT p.id, p.name, p.ticket_number, p.snils"
+    " FROM boardings b JOIN passengers p ON p.id = b.passenger_id"
+    " WHERE b.transport_id = ? ORDER BY b.rowid"
+)
+
+
+def _route_row(route):
+    return route.id, route.start_point, route.end_point
+
+
+def _passenger_row(passenger):
+    return passenger.id, passenger.name, passenger.ticket_number, passenger.snils
+
+
+def _transport_row(transport):
+    return (
+        transport.id, getattr(transport, 'type', 'transport'), transport.name, transport.capacity,
+        getattr(transport, 'bus_number', None), getattr(transport, 'line_number', None),
+        getattr(transport, 'carriages', None), transport.route.id if transport.route else None
+    )
+
+
+def _boarding_rows(transport):
+    return [(passenger.id, transport.id) for passenger in transport.passengers]
+
+
+# Строки таблиц для мутаций из TransportSystem._record: [(запрос, строки)]
+_STATEMENTS = {
+    "add_route": lambda route: [(_INSERT_ROUTE, [_route_row(route)])],
+    "add_routes": lambda routes: [(_INSERT_ROUTE, list(map(_route_row, routes)))],
+    "add_passenger": lambda passenger: [(_INSERT_PASSENGER, [_passenger_row(passenger)])],
+    "add_passengers": lambda passengers: [(_INSERT_PASSENGER, list(map(_passenger_row, passengers)))],
+    "add_transport": lambda transport: [
+        (_INSERT_TRANSPORT, [_transport_row(transport)]),
+        (_INSERT_BOARDING, _boarding_rows(transport))
+    ],
+    "add_transports": lambda transports: [
+        (_INSERT_TRANSPORT, list(map(_transport_row, transports))),
+        (_INSERT_BOARDING, [row for transport in transports for row in _boarding_rows(transport)])
+    ],
+    "assign_route": lambda transport, route: [(_UPDATE_ROUTE, [(route.id, transport.id)])],
+    "board": lambda transport, passenger: [(_INSERT_BOARDING, [(passenger.id, transport.id)])],
+    "alight": lambda transport, passenger: [(_DELETE_BOARDING, [(passenger.id,)])],
+    "board_many": lambda transport, passengers: [
+        (_INSERT_BOARDING, [(passenger.id, transport.id) for passenger in passengers])
+    ],
+}
+
+
+def connect(filename):
+    """Соединение с базой; схема создается, если базы еще нет"""
+    try:
+        connection = sqlite3.connect(filename, check_same_thread=False)
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            connection.close()
+            raise FileOperationError(f"Неподдерживаемая версия базы: {version}")
+        connection.executescript(_SCHEMA)
+        with connection:
+            for _, statement in _INDEXES:
+                connection.execute(statement)
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return connection
+    except sqlite3.DatabaseError as e:
+        raise FileOperationError(f"Файл {filename} не является базой SQLite: {e}")
+
+
+def connect_readonly(filename):
+    """Соединение только для чтения; проверяется лишь версия схемы"""
+    try:
+        connection = sqlite3.connect(
+            f"file:{pathname2url(os.path.abspath(filename))}?mode=ro", uri=True, check_same_thread=False
+        )
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise FileOperationError(f"Файл {filename} не является базой SQLite: {e}")
+    if version != SCHEMA_VERSION:
+        connection.close()
+        raise FileOperationError(f"Неподдерживаемая версия базы: {version}")
+    return connection
+
+
+def _write_all(connection, system):
+    with connection:
+        for name, _ in _INDEXES:
+            connection.execute(f"DROP INDEX IF EXISTS {name}")
+        for table in ("boardings", "transports", "passengers", "routes"):
+            connection.execute(f"DELETE FROM {table}")
+        connection.executemany(_INSERT_ROUTE, map(_route_row, system.routes))
+        connection.executemany(_INSERT_PASSENGER, map(_passenger_row, system.passengers))
+        connection.executemany(_INSERT_TRANSPORT, map(_transport_row, system.transports))
+        connection.executemany(
+            _INSERT_BOARDING,
+            (row for transport in system.transports for row in _boarding_rows(transport))
+        )
+        for _, statement in _INDEXES:
+            connection.execute(statement)
+
+
+def write_database(system, filename):
+    """Полная перезапись базы состоянием system в одной транзакции"""
+    connection = connect(filename)
+    try:
+        _write_all(connection, system)
+    finally:
+        connection.close()
+
+
+class SqliteStorage:
+    """Дозапись мутаций в базу пакетными транзакциями
+
+    Мутации копятся в памяти и записываются одной транзакцией, когда их
+    набирается batch_size или с прошлой записи прошло flush_interval
+    секунд (проверяется при очередной мутации); flush() записывает
+    накопленное принудительно. Если транзакция не удалась, накопленное
+    остается в очереди и пишется следующей попыткой; после retries
+    неудачных попыток или при нарушении ограничений базы (повторная
+    попытка не поможет) пакет отбрасывается, о чем сообщает
+    FileOperationError. Методы можно вызывать из нескольких потоков.
+    """
+
+    def __init__(self, filename, batch_size=1000, flush_interval=0.5, retries=3):
+        self.filename = filename
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.retries = max(1, retries)
+        self._connection = connect(filename)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        # [запрос, строки]; подряд идущие одинаковые запросы объединяются
+        self._pending = []
+        self._pending_count = 0
+        self._failures = 0
+        # Запись отложена до replace: база еще не заполнена срезом
+        self._held = False
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+
+    def append(self, operation, *args):
+        statements = _STATEMENTS[operation](*args)
+        with self._lock:
+            pending = self._pending
+            for sql, rows in statements:
+                if not rows:
+                    continue
+                if pending and pending[-1][0] == sql:
+                    pending[-1][1].extend(rows)
+                else:
+                    pending.append([sql, rows])
+            self._pending_count += 1
+            if (self._pending_count >= self.batch_size
+                    or (self.flush_interval is not None
+                        and time.monotonic() - self._last_flush >= self.flush_interval)):
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._pending and not self._held:
+                try:
+                    with self._connection:
+                        for sql, rows in self._pending:
+                            self._connection.executemany(sql, rows)
+                except sqlite3.DatabaseError as e:
+                    self._failures += 1
+                    if isinstance(e, sqlite3.IntegrityError) or self._failures >= self.retries:
+                        count = self._pending_count
+                        self._discard()
+                        raise FileOperationError(
+                            f"Ошибка записи в базу {self.filename}, отброшено мутаций: {count}: {e}"
+                        )
+                    raise FileOperationError(f"Ошибка записи в базу {self.filename}: {e}")
+                self._discard()
+            self._last_flush = time.monotonic()
+
+    def _discard(self):
+        self._pending = []
+        self._pending_count = 0
+        self._failures = 0
+
+    def hold(self):
+        """Отложить запись мутаций до replace(..., pending=True) или release()"""
+        with self._lock:
+            self._held = True
+
+    def release(self):
+        """Запись отложенных мутаций без перезаписи базы (она уже совпадает со срезом)"""
+        with self._lock:
+            self._held = False
+            self.flush()
+
+    def replace(self, system, pending=False):
+        """Перезапись базы состоянием system
+
+        pending=True - накопленные мутации сделаны после среза system
+        (см. hold) и дописываются следом за ним, иначе они отбрасываются
+        (например, после загрузки из файла).
+        """
+        with self._lock:
+            if not pending:
+                self._discard()
+            self._held = True
+        # Пока запись отложена, соединением пользуется только replace,
+        # поэтому мутации копятся в очереди, не дожидаясь полной перезаписи
+        _write_all(self._connection, system)
+        with self._lock:
+            self._held = False
+            self.flush()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self.flush()
+                finally:
+                    self._connection.close()
+                    self._connection = None
+
+
+class SqliteReader:
+    """Чтение базы без загрузки всех объектов
+
+    find_* выполняют запрос по индексу и создают объект только для
+    найденной записи. Созданные объекты кэшируются, поэтому повторные
+    обращения возвращают те же экземпляры.
+    """
+
+    def __init__(self, filename):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(filename)
+        self._connection = connect_readonly(filename)
+        self._routes = {}
+        self._passengers = {}
+        self._transports = {}
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _count(self, table):
+        return self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    @property
+    def route_count(self):
+        return self._count("routes")
+
+    @property
+    def passenger_count(self):
+        return self._count("passengers")
+
+    @property
+    def transport_count(self):
+        return self._count("transports")
+
+    # Записи в виде словарей того же формата, что и в JSON
+    @staticmethod
+    def _route_data(row):
+        route_id, start_point, end_point = row
+        return {"id": route_id, "start_point": start_point, "end_point": end_point}
+
+    @staticmethod
+    def _passenger_data(row):
+        passenger_id, name, ticket_number, snils = row
+        passenger_data = {"id": passenger_id, "name": name, "ticket_number": ticket_number}
+        if snils is not None:
+            passenger_data["snils"] = snils
+        return passenger_data
+
+    def _transport_data(self, row):
+        transport_data = self._transport_fields(row)
+        passengers = self._connection.execute(
+            "SELECT passenger_id FROM boardings WHERE transport_id = ? ORDER BY rowid", (row[0],)
+        )
+        transport_data["passengers"] = [passenger_id for passenger_id, in passengers]
+        return transport_data
+
+    @staticmethod
+    def _transport_fields(row):
+        """Словарь транспорта без списка пассажиров"""
+        transport_id, transport_type, name, capacity, bus_number, line_number, carriages, route_id = row
+        return {
+            "id": transport_id,
+            "type": transport_type,
+            "name": name,
+            "capacity": capacity,
+            "bus_number": bus_number,
+            "line_number": line_number,
+            "carriages": carriages,
+            "route_id": route_id,
+            "passengers": []
+        }
+
+    def iter_route_data(self):
+        return map(self._route_data, self._connection.execute(
+            f"SELECT {_ROUTE_COLUMNS} FROM routes ORDER BY rowid"
+        ))
+
+    def iter_passenger_data(self):
+        return map(self._passenger_data, self._connection.execute(
+            f"SELECT {_PASSENGER_COLUMNS} FROM passengers ORDER BY rowid"
+        ))
+
+    def iter_transport_data(self):
+        return map(self._transport_data, self._connection.execute(
+            f"SELECT {_TRANSPORT_COLUMNS} FROM transports ORDER BY rowid"
+        ))
+
+    # Объекты создаются по требованию и кэшируются
+    def find_route(self, route_id):
+        route = self._routes.get(route_id)
+        if route is None:
+            row = self._connection.execute(
+                f"SELECT {_ROUTE_COLUMNS} FROM routes WHERE id = ?", (route_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            route = self._routes[route_id] = _route_from_data(self._route_data(row))
+        return route
+
+    def _passenger_from_row(self, row):
+        passenger = self._passengers.get(row[0])
+        if passenger is None:
+            passenger = self._passengers[row[0]] = _passenger_from_data(self._passenger_data(row))
+        return passenger
+
+    def find_passenger(self, passenger_id):
+        passenger = self._passengers.get(passenger_id)
+        if passenger is None:
+            row = self._connection.execute(
+                f"SELECT {_PASSENGER_COLUMNS} FROM passengers WHERE id = ?", (passenger_id,)
+            ).fetchone()
+            passenger = None if row is None else self._passenger_from_row(row)
+        return passenger
+
+    def find_passenger_by_ticket(self, ticket_number):
+        row = self._connection.execute(
+            f"SELECT {_PASSENGER_COLUMNS} FROM passengers WHERE ticket_number = ?", (ticket_number,)
+        ).fetchone()
+        return None if row is None else self._passenger_from_row(row)
+
+    def _transport_from_row(self, row):
+        transport = self._transports.get(row[0])
+        if transport is None:
+            transport_data = self._transport_fields(row)
+            transport = _transport_from_data(transport_data)
+            if transport_data["route_id"]:
+                transport.route = self.find_route(transport_data["route_id"])
+            # Пассажиры транспорта читаются одним запросом по индексу boardings
+            transport.passengers = PassengerSet(map(
+                self._passenger_from_row, self._connection.execute(_BOARDED_PASSENGERS, (row[0],))
+            ))
+            self._transports[row[0]] = transport
+        return transport
+
+    def find_transport(self, transport_id):
+        transport = self._transports.get(transport_id)
+        if transport is None:
+            row = self._connection.execute(
+                f"SELECT {_TRANSPORT_COLUMNS} FROM transports WHERE id = ?", (transport_id,)
+            ).fetchone()
+            transport = None if row is None else self._transport_from_row(row)
+        return transport
+
+    def find_transports_on_route(self, route_id):
+        return [self._transport_from_row(row) for row in self._connection.execute(
+            f"SELECT {_TRANSPORT_COLUMNS} FROM transports WHERE route_id = ? ORDER BY rowid", (route_id,)
+        )]
+
+    def find_transports_by_type(self, transport_type):
+        return [self._transport_from_row(row) for row in self._connection.execute(
+            f"SELECT {_TRANSPORT_COLUMNS} FROM transports WHERE type = ? ORDER BY rowid", (transport_type,)
+        )]
+
+    def find_passenger_transport(self, passenger_id):
+        row = self._connection.execute(
+            "SELECT transport_id FROM boardings WHERE passenger_id = ?", (passenger_id,)
+        ).fetchone()
+        return None if row is None else self.find_transport(row[0])
+
+
+def open_database(filename):
+    """Открытие базы для чтения без загрузки всех объектов"""
+    return SqliteReader(filename)
+
+
+def convert_to_sqlite(source, target):
+    """Преобразование JSON или XML файла в базу SQLite"""
+    errors = []
+    system = TransportSystem(
+        events=CallbackSink(lambda level, text: errors.append(text), level=logging.ERROR)
+    )
+    if source.lower().endswith(".xml"):
+        system.load_from_xml(source, stream=True)
+    else:
+        system.load_from_json(source, stream=True)
+    if errors:
+        raise FileOperationError(errors[0])
+    write_database(system, target)
+
+
+def convert_from_sqlite(source, target):
+    """Выгрузка базы в JSON или XML по расширению target
+
+    Записи переносятся по одной, без создания объектов предметной области.
+    """
+    with SqliteReader(source) as reader:
+        if target.lower().endswith(".xml"):
+            write_atomic(target, lambda f: _write_xml_stream(f, (
+                ("transports", map(_transport_data_to_xml, reader.iter_transport_data())),
+                ("passengers", map(_passenger_data_to_xml, reader.iter_passenger_data())),
+                ("routes", map(_route_data_to_xml, reader.iter_route_data()))
+            )))
+        else:
+            write_atomic(target, lambda f: _write_json_stream(f, (
+                ("transports", reader.iter_transport_data()),
+                ("passengers", reader.iter_passenger_data()),
+                ("routes", reader.iter_route_data())
+            )))
@@ -1,8 +1,244 @@
 import json
+import logging
+import re
+import sys
+import threading
+import time
 import xml.etree.ElementTree as ET
+from array import array
+from functools import lru_cache, partial
+from itertools import count, groupby, islice
+from operator import attrgetter
+
+
+class EventSink:
+    """Приемник сообщений транспортной системы
+
+    Уровни совпадают с уровнями модуля logging. Текст сообщения
+    форматируется только если уровень проходит фильтр, поэтому при
+    отключенном выводе массовые операции не тратят время на строки.
+    summaries=True включает итоговые сводки по загрузке и сохранению.
+    """
+
+    def __init__(self, level=logging.DEBUG, summaries=False):
+        self.level = level
+        self.summaries = summaries
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def emit(self, level, message, *args):
+        if level >= self.level:
+            self.write(level, message % args if args else message)
+
+    def write(self, level, text):
+        raise NotImplementedError
+
+    def debug(self, message, *args):
+        self.emit(logging.DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.emit(logging.INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.emit(logging.WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.emit(logging.ERROR, message, *args)
+
+    def summary(self, action, counts, started):
+        """Итоговая сводка вида «Загружено из JSON: пассажиров 1 204 311 за 3.2 с»"""
+        if self.summaries:
+            details = ", ".join(
+                f"{name} {count:,}".replace(",", " ") for name, count in counts
+            )
+            self.emit(
+                logging.INFO, "%s: %s за %.1f с",
+                action, details, time.perf_counter() - started
+            )
+
+
+class SilentSink(EventSink):
+    """Полностью отключенный вывод"""
+
+    def __init__(self):
+        super().__init__(level=logging.CRITICAL + 1)
+
+    def enabled(self, level):
+        return False
+
+    def emit(self, level, message, *args):
+        pass
+
+    def summary(self, action, counts, started):
+        pass
+
+
+class StdoutSink(EventSink):
+    """Вывод сообщений через print (поведение по умолчанию)"""
+
+    def __init__(self, level=logging.DEBUG, summaries=False, stream=None):
+        super().__init__(level, summaries)
+        self.stream = stream
+
+    def write(self, level, text):
+        print(text, file=self.stream or sys.stdout)
+
+
+class LoggingSink(EventSink):
+    """Передача сообщений в logging"""
+
+    def __init__(self, logger=None, level=logging.DEBUG, summaries=False):
+        super().__init__(level, summaries)
+        self.logger = logger or logging.getLogger("transport_system")
+
+    def write(self, level, text):
+        self.logger.log(level, text)
+
+
+class CallbackSink(EventSink):
+    """Передача сообщений в пользовательскую функцию callback(level, text)"""
+
+    def __init__(self, callback, level=logging.DEBUG, summaries=False):
+        super().__init__(level, summaries)
+        self.callback = callback
+
+    def write(self, level, text):
+        self.callback(level, text)
+
+
+# Общий приемник для объектов, которым не назначен свой
+default_event_sink = StdoutSink()
+
+
+class PassengerSet:
+    """Упорядоченное множество пассажиров с проверкой вхождения за O(1)
+
+    share() отдает копию, у которой общий с оригиналом словарь; словарь
+    копируется при первом изменении любой из двух (копирование при записи).
+    """
+
+    __slots__ = ("_items", "_shared")
+
+    def __init__(self, passengers=()):
+        self._items = dict.fromkeys(passengers)
+        self._shared = False
+
+    def _own(self):
+        if self._shared:
+            self._items = dict(self._items)
+            self._shared = False
+
+    def share(self):
+        """Копия за O(1) для чтения, пока оригинал продолжает меняться"""
+        copy = PassengerSet()
+        copy._items = self._items
+        copy._shared = self._shared = True
+        return copy
+
+    def add(self, passenger):
+        self._own()
+        self._items[passenger] = None
+
+    # Совместимость с кодом, работавшим со списком
+    append = add
+
+    def update(self, passengers):
+        self._own()
+        self._items.update(dict.fromkeys(passengers))
+
+    def remove(self, passenger):
+        self._own()
+        del self._items[passenger]
+
+    def discard(self, passenger):
+        self._own()
+        self._items.pop(passenger, None)
+
+    def clear(self):
+        self._own()
+        self._items.clear()
+
+    def __contains__(self, passenger):
+        return passenger in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"PassengerSet({list(self._items)!r})"
+
+
+class BatchResult:
+    """Итог пакетной операции
+
+    accepted - принятые объекты в исходном порядке,
+    rejected - пары (объект, исключение с причиной отказа).
+    """
+
+    __slots__ = ("accepted", "rejected")
+
+    def __init__(self):
+        self.accepted = []
+        self.rejected = []
+
+    def raise_first(self):
+        """Выброс причины первого отказа, если отказы были"""
+        if self.rejected:
+            raise self.rejected[0][1]
+
+    def __repr__(self):
+        return f"BatchResult(принято: {len(self.accepted)}, отклонено: {len(self.rejected)})"
+
+
+_get_id = attrgetter("id")
+
+
+_snils_validator = None
+
+
+def _invalid_snils(passengers):
+    """{id(пассажир): код причины} для пассажиров пакета с некорректным СНИЛС
+
+    Номера пакета проверяются разом через transport_snils, если
+    установлен numpy, иначе по одному.
+    """
+    global _snils_validator
+    rows = [(passenger, passenger.snils) for passenger in passengers
+            if passenger is not None and passenger.snils is not None]
+    if not rows:
+        return {}
+    if _snils_validator is None:
+        try:
+            from transport_snils import validate_snils
+            _snils_validator = lambda values: validate_snils(values).reasons.tolist()
+        except ImportError:
+            _snils_validator = lambda values: list(map(snils_reason, values))
+    reasons = _snils_validator([snils for _, snils in rows])
+    return {id(passenger): reason for (passenger, _), reason in zip(rows, reasons) if reason}
+
+
+@lru_cache(maxsize=None)
+def _slot_names(cls):
+    """Имена всех слотов класса и его предков"""
+    return tuple(name for klass in cls.__mro__ for name in getattr(klass, "__slots__", ()))
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class Transport:
+    __slots__ = ("id", "name", "capacity", "route", "passengers", "system", "events", "_lock", "_version")
+
     def __init__(self, transport_id, name, capacity):
         if capacity <= 0:
             raise InvalidDataError("Вместимость должна быть больше нуля")
@@ -15,27 +251,71 @@ class Transport:
         self.name = name
         self.capacity = capacity
         self.route = None
-        self.passengers = []
+        self.passengers = PassengerSet()
+        self.system = None
+        self.events = default_event_sink
+        # Посадка и высадка в разных транспортных средствах идут независимо;
+        # место пассажира в системе закрепляется атомарным dict.setdefault
+        self._lock = threading.Lock()
+        # Номер изменения состава пассажиров (для кэша запросов)
+        self._version = 0
+
+    def _problem(self, error):
+        self.events.warning("Проблема: %s", error)
+        if self.system is not None and self.system.metrics is not None:
+            self.system.metrics.count_error(error)
 
     def add_passenger(self, passenger):
+        metrics = self.system.metrics if self.system is not None else None
+        if metrics is not None:
+            return metrics.timed_boarding(self._add_passenger, passenger)
+        return self._add_passenger(passenger)
+
+    def _add_passenger(self, passenger):
         try:
             if passenger is None:
                 raise InvalidDataError("Пассажир не может быть пустым")
 
-            if len(self.passengers) >= self.capacity:
-                raise CapacityExceededError(
-                    f"В транспорте {self.name} нет мест! Максимум: {self.capacity}"
-                )
+            with self._lock:
+                if passenger in self.passengers:
+                    raise InvalidDataError(f"{passenger.name} уже находится в {self.name}")
 
-            self.passengers.append(passenger)
-            print(f"Успешно добавлен {passenger.name} в {self.name}")
+                if len(self.passengers) >= self.capacity:
+                    raise CapacityExceededError(
+                        f"В транспорте {self.name} нет мест! Максимум: {self.capacity}"
+                    )
+
+                version = None
+                if self.system is not None:
+                    self.system._check_registered((passenger,))
+                    current = self.system._passenger_locations.setdefault(passenger.id, self)
+                    if current is not self:
+                        raise InvalidDataError(
+                            f"{passenger.name} уже находится в {current.name}"
+                        )
+                    # Посадка попадает в журнал, пока место пассажира
+                    # закреплено за этим транспортом
+                    try:
+                        version = self.system._log("board", self, passenger)
+                    except FileOperationError:
+                        del self.system._passenger_locations[passenger.id]
+                        raise
+
+                self.passengers.add(passenger)
+                if self.system is not None:
+                    self.system._record("board", self, passenger, version=version)
+
+            self.events.info("Успешно добавлен %s в %s", passenger.name, self.name)
             return True
 
         except CapacityExceededError as e:
-            print(f"Проблема: {e}")
+            self._problem(e)
             return False
-        except InvalidDataError as e:
-            print(f"Проблема: {e}")
+        except (InvalidDataError, PassengerNotFoundError) as e:
+            self._problem(e)
+            return False
+        except FileOperationError as e:
+            self.events.error("Проблема с файлом: %s", e)
             return False
 
     def remove_passenger(self, passenger):
@@ -43,64 +323,243 @@ class Transport:
             if passenger is None:
                 raise InvalidDataError("Пассажир не может быть пустым")
 
-            if passenger in self.passengers:
-                self.passengers.remove(passenger)
-                print(f"Удален {passenger.name} из {self.name}")
-                return True
-            else:
-                raise PassengerNotFoundError(
-                    f"Не найден {passenger.name} в {self.name}"
-                )
+            with self._lock:
+                if passenger not in self.passengers:
+                    raise PassengerNotFoundError(
+                        f"Не найден {passenger.name} в {self.name}"
+                    )
+                if self.system is None:
+                    self.passengers.remove(passenger)
+                else:
+                    # Место пассажира освобождается только после записи
+                    # высадки в журнал: иначе посадка в другой транспорт
+                    # могла бы попасть в журнал раньше этой высадки
+                    version = self.system._log("alight", self, passenger)
+                    self.passengers.remove(passenger)
+                    self.system._record("alight", self, passenger, version=version)
+                    self.system._passenger_locations.pop(passenger.id, None)
+
+            self.events.info("Удален %s из %s", passenger.name, self.name)
+            return True
 
         except (PassengerNotFoundError, InvalidDataError) as e:
-            print(f"Проблема: {e}")
+            self._problem(e)
+            return False
+        except FileOperationError as e:
+            self.events.error("Проблема с файлом: %s", e)
             return False
         except Exception as e:
-            print(f"Неизвестная проблема: {e}")
+            self.events.error("Неизвестная проблема: %s", e)
+            return False
+
+    def board_many(self, passengers):
+        """Пакетная посадка
+
+        Проверки выполняются в одном проходе, места заполняются до
+        оставшейся вместимости, лишние пассажиры попадают в rejected.
+        """
+        result = BatchResult()
+        passengers = list(passengers)
+
+        with self._lock:
+            if not self._board_fast(passengers, result):
+                self._board_each(passengers, result)
+            version = None
+            if self.system is not None and result.accepted:
+                try:
+                    version = self.system._log("board_many", self, result.accepted)
+                except FileOperationError as e:
+                    # Пакет не записан в журнал: места освобождаются,
+                    # пассажиры пакета отклоняются
+                    self.events.error("Проблема с файлом: %s", e)
+                    locations = self.system._passenger_locations
+                    for passenger in result.accepted:
+                        del locations[passenger.id]
+                    result.rejected.extend((passenger, e) for passenger in result.accepted)
+                    result.accepted = []
+            self.passengers.update(result.accepted)
+            if version is not None:
+                self.system._record("board_many", self, result.accepted, version=version)
+
+        if self.system is not None and self.system.metrics is not None:
+            self.system.metrics.count_batch(result)
+        self.events.info(
+            "В %s посажено пассажиров: %d, отклонено: %d",
+            self.name, len(result.accepted), len(result.rejected)
+        )
+        return result
+
+    def _board_fast(self, passengers, result):
+        """Быстрый путь: пакет проверяется операциями над множествами,
+        места заполняются одним срезом; False - нужен поштучный разбор"""
+        if None in passengers:
             return False
+        ids = list(map(_get_id, passengers))
+        if (len(set(ids)) != len(ids)
+                or not self.passengers._items.keys().isdisjoint(passengers)):
+            return False
+
+        seats = max(self.capacity - len(self.passengers), 0)
+        if self.system is not None:
+            try:
+                self.system._check_registered(passengers)
+            except PassengerNotFoundError:
+                return False
+            locations = self.system._passenger_locations
+            if not locations.keys().isdisjoint(ids):
+                return False
+            # Другой поток мог занять кого-то из пакета после проверки
+            claims = [locations.setdefault(passenger_id, self) for passenger_id in ids[:seats]]
+            if any(claim is not self for claim in claims):
+                for passenger_id, claim in zip(ids, claims):
+                    if claim is self:
+                        del locations[passenger_id]
+                return False
+
+        result.accepted.extend(passengers[:seats])
+        if seats < len(passengers):
+            error = CapacityExceededError(
+                f"В транспорте {self.name} нет мест! Максимум: {self.capacity}"
+            )
+            result.rejected.extend((passenger, error) for passenger in passengers[seats:])
+        return True
+
+    def _board_each(self, passengers, result):
+        aboard = self.passengers
+        locations = self.system._passenger_locations if self.system is not None else {}
+        seats = self.capacity - len(aboard)
+        batch_ids = set()
+
+        for passenger in passengers:
+            if passenger is None:
+                result.rejected.append((passenger, InvalidDataError("Пассажир не может быть пустым")))
+            elif passenger.id in batch_ids or passenger in aboard:
+                result.rejected.append((passenger, InvalidDataError(
+                    f"{passenger.name} уже находится в {self.name}"
+                )))
+            elif len(result.accepted) >= seats:
+                result.rejected.append((passenger, CapacityExceededError(
+                    f"В транспорте {self.name} нет мест! Максимум: {self.capacity}"
+                )))
+            else:
+                if self.system is not None:
+                    try:
+                        self.system._check_registered((passenger,))
+                    except PassengerNotFoundError as e:
+                        result.rejected.append((passenger, e))
+                        continue
+                current = locations.setdefault(passenger.id, self)
+                if current is not self:
+                    result.rejected.append((passenger, InvalidDataError(
+                        f"{passenger.name} уже находится в {current.name}"
+                    )))
+                    continue
+                result.accepted.append(passenger)
+                batch_ids.add(passenger.id)
+
+    def _snapshot_copy(self, route, passengers):
+        """Копия транспорта для среза системы (см. TransportSystem.snapshot)"""
+        clone = object.__new__(type(self))
+        for name in _slot_names(type(self)):
+            setattr(clone, name, getattr(self, name))
+        clone.route = route
+        clone.passengers = passengers
+        clone.system = None
+        clone._lock = threading.Lock()
+        return clone
 
     def __str__(self):
         return f"{self.name} (ID: {self.id}, мест: {self.capacity})"
 
 
 class Bus(Transport):
+    __slots__ = ("bus_number",)
+    type = "bus"
+
     def __init__(self, transport_id, name, capacity, bus_number):
         super().__init__(transport_id, name, capacity)
         if not bus_number:
             raise InvalidDataError("Номер автобуса не может быть пустым")
         self.bus_number = bus_number
-        self.type = "bus"
 
     def __str__(self):
         return f"Автобус {self.bus_number} - {self.name}"
 
 
 class Tram(Transport):
+    __slots__ = ("line_number",)
+    type = "tram"
+
     def __init__(self, transport_id, name, capacity, line_number):
         super().__init__(transport_id, name, capacity)
         if not line_number:
             raise InvalidDataError("Номер линии трамвая не может быть пустым")
         self.line_number = line_number
-        self.type = "tram"
 
     def __str__(self):
         return f"Трамвай {self.line_number} - {self.name}"
 
 
 class Train(Transport):
+    __slots__ = ("carriages",)
+    type = "train"
+
     def __init__(self, transport_id, name, capacity, carriages):
         super().__init__(transport_id, name, capacity)
         if carriages <= 0:
             raise InvalidDataError("Количество вагонов должно быть положительным")
         self.carriages = carriages
-        self.type = "train"
 
     def __str__(self):
         return f"Поезд ({self.carriages} вагонов) - {self.name}"
 
 
+# Числовые коды типов транспорта для двоичного снимка и столбцов аналитики
+TYPE_CODES = {"transport": 0, "bus": 1, "tram": 2, "train": 3}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+
+# Причины отклонения СНИЛС; коды общие с пакетной проверкой transport_snils
+SNILS_REASONS = {
+    1: "пустой номер",
+    2: "недопустимые символы",
+    3: "должно быть 11 цифр",
+    4: "неверная контрольная сумма",
+}
+
+# Номера не больше 001-001-998 выдавались без контрольной суммы
+_SNILS_UNCHECKED = 1001998
+
+
+def snils_checksum(number):
+    """Контрольное число для первых девяти цифр СНИЛС (число от 0 до 999999999)"""
+    total = sum(int(digit) * weight for digit, weight in zip(f"{number:09d}", range(9, 0, -1)))
+    checksum = total % 101
+    return 0 if checksum == 100 else checksum
+
+
+def snils_reason(snils):
+    """Код причины из SNILS_REASONS, по которой номер некорректен, или 0
+
+    Допускается запись вида 112-233-445 95 и 11 цифр подряд.
+    """
+    if not snils:
+        return 1
+    digits = snils.replace("-", "").replace(" ", "")
+    if digits and not (digits.isascii() and digits.isdigit()):
+        return 2
+    if len(digits) != 11:
+        return 3
+    number = int(digits[:9])
+    if number > _SNILS_UNCHECKED and snils_checksum(number) != int(digits[9:]):
+        return 4
+    return 0
+
+
 class Passenger:
-    def __init__(self, passenger_id, name, ticket_number):
+    __slots__ = ("id", "name", "ticket_number", "snils")
+
+    def __init__(self, passenger_id, name, ticket_number, snils=None):
         if passenger_id <= 0:
             raise InvalidDataError("ID пассажира должен быть положительным")
         if not name:
@@ -111,12 +570,16 @@ class Passenger:
         self.id = passenger_id
         self.name = name
         self.ticket_number = ticket_number
+        # СНИЛС необязателен; контрольная сумма проверяется при регистрации в системе
+        self.snils = snils
 
     def __str__(self):
         return f"Пассажир {self.name} (билет: {self.ticket_number})"
 
 
 class Route:
+    __slots__ = ("id", "start_point", "end_point")
+
     def __init__(self, route_id, start_point, end_point):
         if route_id <= 0:
             raise InvalidDataError("ID маршрута должен быть положительным")
@@ -131,38 +594,906 @@ class Route:
         return f"Маршрут {self.id}: {self.start_point} -> {self.end_point}"
 
 
+class StoredPassenger(Passenger):
+    """Легкое представление строки PassengerStore с интерфейсом Passenger"""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def id(self):
+        return self._store._ids[self._row]
+
+    @property
+    def name(self):
+        return self._store._names[self._row]
+
+    @property
+    def ticket_number(self):
+        return self._store._tickets[self._row]
+
+    @property
+    def snils(self):
+        return self._store._snils[self._row]
+
+    def __eq__(self, other):
+        if isinstance(other, StoredPassenger):
+            return self._store is other._store and self._row == other._row
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self._store), self._row))
+
+
+class PassengerStore:
+    """Компактное колоночное хранилище пассажиров
+
+    ID хранятся в array('q'), имена и номера билетов - в списках
+    интернированных строк, СНИЛС - в списке строк или None. Объекты Passenger не хранятся: при обращении
+    создаются представления StoredPassenger. Хранилище одновременно
+    служит списком пассажиров и индексом по ID.
+    """
+
+    __slots__ = ("_ids", "_names", "_tickets", "_snils", "_rows")
+
+    def __init__(self, passengers=()):
+        self._ids = array('q')
+        self._names = []
+        self._tickets = []
+        self._snils = []
+        self._rows = {}
+        self.extend(passengers)
+
+    def append(self, passenger):
+        if passenger.id in self._rows:
+            raise DuplicateIdError(f"Пассажир с ID {passenger.id} уже существует")
+        self._rows[passenger.id] = len(self._ids)
+        self._ids.append(passenger.id)
+        self._names.append(sys.intern(passenger.name))
+        self._tickets.append(sys.intern(passenger.ticket_number))
+        self._snils.append(passenger.snils)
+
+    def extend(self, passengers):
+        for passenger in passengers:
+            self.append(passenger)
+
+    # Интерфейс индекса id -> пассажир
+    def __setitem__(self, passenger_id, passenger):
+        self.append(passenger)
+
+    def update(self, passengers_by_id):
+        self.extend(passengers_by_id.values())
+
+    def get(self, passenger_id, default=None):
+        row = self._rows.get(passenger_id)
+        return default if row is None else StoredPassenger(self, row)
+
+    def __contains__(self, passenger_id):
+        return passenger_id in self._rows
+
+    def __iter__(self):
+        for row in range(len(self._ids)):
+            yield StoredPassenger(self, row)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def clear(self):
+        del self._ids[:]
+        self._names.clear()
+        self._tickets.clear()
+        self._snils.clear()
+        self._rows.clear()
+
+
+class _PassengerPrefix:
+    """Первые count пассажиров списка или PassengerStore
+
+    И список, и хранилище пополняются только в конец, поэтому префикс не
+    меняется, пока система регистрирует новых пассажиров. Как и
+    PassengerStore, служит срезу и списком пассажиров, и индексом по ID.
+    """
+
+    __slots__ = ("_passengers", "_count", "_by_id")
+
+    def __init__(self, passengers, count):
+        self._passengers = passengers
+        self._count = count
+        self._by_id = None
+
+    def get(self, passenger_id, default=None):
+        if isinstance(self._passengers, PassengerStore):
+            row = self._passengers._rows.get(passenger_id)
+            if row is None or row >= self._count:
+                return default
+            return StoredPassenger(self._passengers, row)
+        # Индекс по ID для списка строится при первом поиске
+        if self._by_id is None:
+            self._by_id = {passenger.id: passenger for passenger in self}
+        return self._by_id.get(passenger_id, default)
+
+    def __contains__(self, passenger_id):
+        return self.get(passenger_id) is not None
+
+    def __iter__(self):
+        return islice(self._passengers, self._count)
+
+    def __len__(self):
+        return self._count
+
+    def rows(self, start, stop):
+        """Пассажиры с номерами [start, stop) без обхода начала списка"""
+        stop = min(stop, self._count)
+        if isinstance(self._passengers, PassengerStore):
+            return (StoredPassenger(self._passengers, row) for row in range(start, stop))
+        if isinstance(self._passengers, _PassengerPrefix):
+            # Срез со среза
+            return self._passengers.rows(start, stop)
+        return self._passengers[start:stop]
+
+
+def _route_from_data(route_data):
+    return Route(
+        route_data["id"],
+        route_data["start_point"],
+        route_data["end_point"]
+    )
+
+
+def _passenger_from_data(passenger_data):
+    return Passenger(
+        passenger_data["id"],
+        passenger_data["name"],
+        passenger_data["ticket_number"],
+        passenger_data.get("snils")
+    )
+
+
+def _transport_from_data(transport_data):
+    transport_type = transport_data["type"]
+
+    if transport_type == "bus":
+        return Bus(
+            transport_data["id"],
+            transport_data["name"],
+            transport_data["capacity"],
+            transport_data["bus_number"]
+        )
+    if transport_type == "tram":
+        return Tram(
+            transport_data["id"],
+            transport_data["name"],
+            transport_data["capacity"],
+            transport_data["line_number"]
+        )
+    if transport_type == "train":
+        return Train(
+            transport_data["id"],
+            transport_data["name"],
+            transport_data["capacity"],
+            transport_data["carriages"]
+        )
+    return Transport(
+        transport_data["id"],
+        transport_data["name"],
+        transport_data["capacity"]
+    )
+
+
+def _route_data_from_xml(route_elem):
+    return {
+        "id": int(route_elem.find("id").text),
+        "start_point": route_elem.find("start_point").text,
+        "end_point": route_elem.find("end_point").text
+    }
+
+
+def _passenger_data_from_xml(passenger_elem):
+    return {
+        "id": int(passenger_elem.find("id").text),
+        "name": passenger_elem.find("name").text,
+        "ticket_number": passenger_elem.find("ticket_number").text,
+        "snils": passenger_elem.findtext("snils")
+    }
+
+
+def _transport_data_from_xml(transport_elem):
+    carriages = transport_elem.findtext("carriages")
+    route_id = transport_elem.findtext("route_id")
+    return {
+        "id": int(transport_elem.find("id").text),
+        "type": transport_elem.find("type").text,
+        "name": transport_elem.find("name").text,
+        "capacity": int(transport_elem.find("capacity").text),
+        "bus_number": transport_elem.findtext("bus_number"),
+        "line_number": transport_elem.findtext("line_number"),
+        "carriages": int(carriages) if carriages else None,
+        "route_id": int(route_id) if route_id else None,
+        "passengers": [
+            int(passenger_id_elem.text)
+            for passenger_id_elem in transport_elem.iterfind("passengers/passenger_id")
+        ]
+    }
+
+
+def _transport_to_data(transport):
+    return {
+        "id": transport.id,
+        "type": getattr(transport, 'type', 'transport'),
+        "name": transport.name,
+        "capacity": transport.capacity,
+        "bus_number": getattr(transport, 'bus_number', None),
+        "line_number": getattr(transport, 'line_number', None),
+        "carriages": getattr(transport, 'carriages', None),
+        "route_id": transport.route.id if transport.route else None,
+        "passengers": [p.id for p in transport.passengers]
+    }
+
+
+def _passenger_to_data(passenger):
+    # СНИЛС пишется, только если задан: файлы без него не меняются
+    passenger_data = {
+        "id": passenger.id,
+        "name": passenger.name,
+        "ticket_number": passenger.ticket_number
+    }
+    if passenger.snils is not None:
+        passenger_data["snils"] = passenger.snils
+    return passenger_data
+
+
+def _route_to_data(route):
+    return {
+        "id": route.id,
+        "start_point": route.start_point,
+        "end_point": route.end_point
+    }
+
+
+# Элементы XML строятся из тех же словарей, что пишутся в JSON:
+# поля подтипов (bus_number, line_number, carriages) выводятся,
+# только если заданы
+def _transport_data_to_xml(transport_data):
+    transport_elem = ET.Element("transport")
+    ET.SubElement(transport_elem, "id").text = str(transport_data["id"])
+    ET.SubElement(transport_elem, "type").text = transport_data["type"]
+    ET.SubElement(transport_elem, "name").text = transport_data["name"]
+    ET.SubElement(transport_elem, "capacity").text = str(transport_data["capacity"])
+
+    if transport_data.get("bus_number") is not None:
+        ET.SubElement(transport_elem, "bus_number").text = transport_data["bus_number"]
+    if transport_data.get("line_number") is not None:
+        ET.SubElement(transport_elem, "line_number").text = transport_data["line_number"]
+    if transport_data.get("carriages") is not None:
+        ET.SubElement(transport_elem, "carriages").text = str(transport_data["carriages"])
+
+    route_id = transport_data.get("route_id")
+    ET.SubElement(transport_elem, "route_id").text = str(route_id) if route_id else ""
+
+    passengers_elem = ET.SubElement(transport_elem, "passengers")
+    for passenger_id in transport_data["passengers"]:
+        ET.SubElement(passengers_elem, "passenger_id").text = str(passenger_id)
+    return transport_elem
+
+
+def _passenger_data_to_xml(passenger_data):
+    passenger_elem = ET.Element("passenger")
+    ET.SubElement(passenger_elem, "id").text = str(passenger_data["id"])
+    ET.SubElement(passenger_elem, "name").text = passenger_data["name"]
+    ET.SubElement(passenger_elem, "ticket_number").text = passenger_data["ticket_number"]
+    if passenger_data.get("snils") is not None:
+        ET.SubElement(passenger_elem, "snils").text = passenger_data["snils"]
+    return passenger_elem
+
+
+def _route_data_to_xml(route_data):
+    route_elem = ET.Element("route")
+    ET.SubElement(route_elem, "id").text = str(route_data["id"])
+    ET.SubElement(route_elem, "start_point").text = route_data["start_point"]
+    ET.SubElement(route_elem, "end_point").text = route_data["end_point"]
+    return route_elem
+
+
+def _transport_to_xml(transport):
+    return _transport_data_to_xml(_transport_to_data(transport))
+
+
+def _passenger_to_xml(passenger):
+    return _passenger_data_to_xml(_passenger_to_data(passenger))
+
+
+def _route_to_xml(route):
+    return _route_data_to_xml(_route_to_data(route))
+
+
+def _encode_flat_record(record, encode):
+    """Запись с полями-скалярами и списками скаляров в виде json.dumps(indent=2)
+
+    Модуль json с отступами работает на чистом Python; здесь C-кодировщику
+    (encode без отступов) отдаются только значения, а отступы
+    расставляются вручную. Для прочих записей возвращает None.
+    """
+    if type(record) is not dict:
+        return None
+    if not record:
+        return "{}"
+    parts = []
+    for key, value in record.items():
+        if type(key) is not str:
+            return None
+        if type(value) is list:
+            if not value:
+                text = "[]"
+            elif any(type(item) in (list, dict) for item in value):
+                return None
+            else:
+                text = "[\n    " + ",\n    ".join(map(encode, value)) + "\n  ]"
+        elif type(value) is dict:
+            return None
+        else:
+            text = encode(value)
+        parts.append(encode(key) + ": " + text)
+    return "{\n  " + ",\n  ".join(parts) + "\n}"
+
+
+def _write_json_stream(f, sections, compact=False):
+    """Запись секций JSON по одной записи, без построения общего словаря
+
+    sections - последовательность пар (имя секции, итератор словарей).
+    Без compact вывод совпадает с json.dump(indent=2).
+    """
+    if compact:
+        newline, pad, colon, indent = "", "", ":", None
+    else:
+        newline, pad, colon, indent = "\n", "  ", ": ", 2
+    encode = json.JSONEncoder(
+        ensure_ascii=False, indent=indent, separators=(",", colon)
+    ).encode
+    encode_value = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    f.write("{" + newline + pad + '"transport_system"' + colon + "{")
+    for section_index, (name, records) in enumerate(sections):
+        f.write(("," if section_index else "") + newline + pad * 2 + f'"{name}"' + colon + "[")
+        empty = True
+        for record in records:
+            if compact:
+                text = encode(record)
+            else:
+                text = _encode_flat_record(record, encode_value) or encode(record)
+                text = text.replace("\n", "\n" + pad * 3)
+            f.write(("" if empty else ",") + newline + pad * 3 + text)
+            empty = False
+        f.write("]" if empty else newline + pad * 2 + "]")
+    f.write(newline + pad + "}" + newline + "}")
+
+
+def _write_xml_stream(f, sections, serialize=None):
+    """Запись секций XML по одному элементу; вывод совпадает с ElementTree.write
+
+    serialize переводит элемент в строку (по умолчанию ET.tostring);
+    serialize=str позволяет передать в секциях уже готовый текст элементов.
+    """
+    if serialize is None:
+        serialize = partial(ET.tostring, encoding="unicode")
+    f.write("<?xml version='1.0' encoding='utf-8'?>\n<transport_system>")
+    for name, elements in sections:
+        empty = True
+        for element in elements:
+            if empty:
+                f.write(f"<{name}>")
+                empty = False
+            f.write(serialize(element))
+        f.write(f"<{name} />" if empty else f"</{name}>")
+    f.write("</transport_system>")
+
+
+def _iter_xml_records(filename):
+    """Записи второго уровня (route, passenger, transport) по мере чтения XML
+
+    Каждая запись удаляется из секции, как только потребитель перешел
+    к следующей, поэтому дерево документа целиком не накапливается.
+    """
+    depth = 0
+    section = None
+    for event, elem in ET.iterparse(filename, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 2:
+                section = elem
+            continue
+
+        depth -= 1
+        if depth == 2:
+            yield elem
+            section.clear()
+
+
+_LOAD_BATCH_SIZE = 1024
+
+# Мутации, меняющие граф остановок (маршруты и назначенный на них транспорт)
+_NETWORK_OPERATIONS = frozenset((
+    "add_transport", "add_transports", "add_route", "add_routes", "assign_route"
+))
+
+# Мутации, меняющие состав пассажиров одного транспорта (первый аргумент)
+_OCCUPANCY_OPERATIONS = frozenset(("board", "alight", "board_many"))
+
+# Разделы отчета; show_system_info выводит все, кроме "load"
+REPORT_SECTIONS = ("summary", "load", "routes", "transports", "passengers")
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonStreamReader:
+    """Потоковый разбор JSON: объекты и массивы читаются по одному элементу"""
+
+    def __init__(self, file, chunk_size=1 << 16):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self._pos = _JSON_WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                break
+        return self._buffer[self._pos:self._pos + 1]
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise json.JSONDecodeError(f"Ожидался символ {char!r}", self._buffer, self._pos)
+        self._pos += 1
+
+    def _separator(self, closing):
+        """Пропуск запятой; True, если встречена закрывающая скобка"""
+        if self._peek() == ",":
+            self._pos += 1
+            return False
+        self._expect(closing)
+        return True
+
+    def value(self):
+        """Чтение одного значения целиком"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе буфера может продолжаться в следующем блоке
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def keys(self):
+        """Ключи объекта; значение каждого ключа должен прочитать вызывающий"""
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            if self._separator("}"):
+                return
+
+    def items(self):
+        """Элементы массива по одному"""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self._separator("]"):
+                return
+
+
 class TransportSystem:
-    def __init__(self):
+    def __init__(self, events=None, compact=False):
+        self.events = events if events is not None else default_event_sink
         self.transports = []
-        self.passengers = []
         self.routes = []
 
+        # Индексы id -> объект для поиска за O(1)
+        self._transports_by_id = {}
+        self._routes_by_id = {}
+
+        # В компактном режиме пассажиры хранятся по столбцам, и
+        # хранилище выполняет роль и списка, и индекса
+        if compact:
+            self.passengers = self._passengers_by_id = PassengerStore()
+        else:
+            self.passengers = []
+            self._passengers_by_id = {}
+
+        # Обратный индекс: id пассажира -> транспорт, в котором он едет
+        self._passenger_locations = {}
+
+        # Вторичные индексы: номер билета -> id пассажира (билеты уникальны),
+        # id маршрута -> {id транспорта: транспорт}, тип -> [транспорт]
+        self._passengers_by_ticket = {}
+        self._transports_by_route = {}
+        self._transports_by_type = {}
+
+        # Общее число мест для сводки без обхода транспорта
+        self._seats = 0
+
+        # Журнал мутаций (см. enable_journal)
+        self.journal = None
+
+        # База SQLite, в которую дописываются мутации (см. enable_sqlite)
+        self.storage = None
+
+        # Учет изменений для инкрементальной записи сегментов (см. save_to_segments)
+        self.changes = None
+
+        # Метрики (см. enable_metrics)
+        self.metrics = None
+
+        # Столбцы NumPy для аналитики парка (см. enable_analytics)
+        self.analytics = None
+
+        # Граф остановок для plan_journey строится по требованию и
+        # перестраивается, когда меняется _network_version
+        self._network = None
+        self._network_version = 0
+
+        # Номер любого изменения данных; по нему и по _network_version
+        # кэш запросов (см. enable_query_cache) отбрасывает устаревшие ответы.
+        # Номера берутся из itertools.count, чтобы посадки из разных потоков
+        # не получили один и тот же номер
+        self._versions = count(1)
+        self._version = 0
+        self.queries = None
+
+        # Регистрация объектов из нескольких потоков; посадка защищена
+        # блокировками самих транспортных средств
+        self._registry_lock = threading.Lock()
+
+    def _log(self, operation, *args):
+        """Номер мутации и запись ее в журнал
+
+        Вызывается под той же блокировкой, что и сама мутация. Посадка и
+        высадка пишут журнал до изменения памяти: FileOperationError
+        означает, что мутация не выполнена и отменять нечего.
+        """
+        version = next(self._versions)
+        if self.journal is not None:
+            self.journal.append(version, operation, *args)
+        return version
+
+    def _check_journal(self):
+        """Регистрация не начинается, если журнал остановлен после ошибки"""
+        if self.journal is not None and self.journal.failed is not None:
+            raise FileOperationError(f"Журнал мутаций остановлен после ошибки: {self.journal.failed}")
+
+    def _check_registered(self, passengers):
+        """Журнал и база хранят пассажиров в транспорте ссылками на id: пока
+        они подключены, садятся только зарегистрированные в системе пассажиры"""
+        if self.journal is None and self.storage is None:
+            return
+        for passenger in passengers:
+            if self._passengers_by_id.get(passenger.id) is None:
+                raise PassengerNotFoundError(f"Пассажир {passenger.name} не зарегистрирован в системе")
+
+    def _record(self, operation, *args, version=None):
+        """Уведомление об успешной мутации
+
+        version - номер от _log, если мутация уже записана в журнал.
+        Иначе журнал пишется здесь первым, и при его ошибке остальные
+        получатели мутацию не видят; регистрация, уже выполненная в
+        памяти, остается, а журнал останавливается до compact_journal.
+        Ошибка записи в базу SQLite только сообщается: мутация остается
+        в очереди базы.
+        """
+        if version is None:
+            version = self._log(operation, *args)
+        self._version = version
+        if operation in _OCCUPANCY_OPERATIONS:
+            args[0]._version += 1
+        elif operation in _NETWORK_OPERATIONS:
+            self._network_version = version
+        if self.analytics is not None:
+            self.analytics.apply(operation, args)
+        if self.storage is not None:
+            try:
+                self.storage.append(operation, *args)
+            except FileOperationError as e:
+                # Мутация осталась в очереди базы и будет записана следующей транзакцией
+                self.events.error("Проблема с файлом: %s", e)
+        if self.changes is not None:
+            self.changes.apply(operation, args, version)
+
+    def _problem(self, error):
+        self.events.warning("Проблема: %s", error)
+        if self.metrics is not None:
+            self.metrics.count_error(error)
+
+    def _after_load(self):
+        """Состояние полностью заменено загрузкой из файла"""
+        self._version = self._network_version = next(self._versions)
+        if self.analytics is not None:
+            self.analytics.rebuild()
+        if self.journal is not None:
+            self.journal.compact(self)
+        if self.storage is not None:
+            self.storage.replace(self)
+
+    def _register_transport(self, transport):
+        if transport.id in self._transports_by_id:
+            raise DuplicateIdError(f"Транспорт с ID {transport.id} уже существует")
+        self._check_registered(transport.passengers)
+        for passenger in transport.passengers:
+            current = self._passenger_locations.get(passenger.id)
+            if current is not None:
+                raise InvalidDataError(
+                    f"{passenger.name} уже находится в {current.name}"
+                )
+        self._transports_by_id[transport.id] = transport
+        self.transports.append(transport)
+        self._index_transport(transport)
+        transport.system = self
+        transport.events = self.events
+        for passenger in transport.passengers:
+            self._passenger_locations[passenger.id] = transport
+
+    def _index_transport(self, transport):
+        self._seats += transport.capacity
+        self._transports_by_type.setdefault(getattr(transport, 'type', 'transport'), []).append(transport)
+        if transport.route is not None:
+            self._transports_by_route.setdefault(transport.route.id, {})[transport.id] = transport
+
+    def _register_passenger(self, passenger):
+        if passenger.id in self._passengers_by_id:
+            raise DuplicateIdError(f"Пассажир с ID {passenger.id} уже существует")
+        if passenger.ticket_number in self._passengers_by_ticket:
+            raise DuplicateIdError(f"Билет {passenger.ticket_number} уже зарегистрирован")
+        if passenger.snils is not None:
+            reason = snils_reason(passenger.snils)
+            if reason:
+                raise InvalidDataError(f"Некорректный СНИЛС {passenger.snils}: {SNILS_REASONS[reason]}")
+        self._passengers_by_id[passenger.id] = passenger
+        self._passengers_by_ticket[passenger.ticket_number] = passenger.id
+        if self.passengers is not self._passengers_by_id:
+            self.passengers.append(passenger)
+
+    def _register_route(self, route):
+        if route.id in self._routes_by_id:
+            raise DuplicateIdError(f"Маршрут с ID {route.id} уже существует")
+        self._routes_by_id[route.id] = route
+        self.routes.append(route)
+
+    def set_event_sink(self, events):
+        """Замена приемника сообщений для системы и всего ее транспорта"""
+        self.events = events
+        for transport in self.transports:
+            transport.events = events
+
+    def _load_counts(self):
+        return (
+            ("маршрутов", len(self.routes)),
+            ("пассажиров", len(self.passengers)),
+            ("транспорта", len(self.transports))
+        )
+
+    def _clear(self):
+        for transport in self.transports:
+            transport.system = None
+        # Номера строк прежнего транспорта больше не действуют
+        self.changes = None
+        # Списки заменяются новыми, а не очищаются: срезы (см. snapshot)
+        # продолжают читать прежние
+        self.transports = []
+        self.routes = []
+        if self.passengers is self._passengers_by_id:
+            self.passengers = self._passengers_by_id = PassengerStore()
+        else:
+            self.passengers = []
+            self._passengers_by_id.clear()
+        self._passengers_by_ticket = {}
+        self._transports_by_id.clear()
+        self._routes_by_id.clear()
+        self._passenger_locations.clear()
+        self._transports_by_route.clear()
+        self._transports_by_type.clear()
+        self._seats = 0
+
     def add_transport(self, transport):
         try:
             if transport is None:
                 raise InvalidDataError("Транспорт не может быть пустым")
-            self.transports.append(transport)
-            print(f"Зарегистрирован транспорт: {transport}")
-        except InvalidDataError as e:
-            print(f"Проблема: {e}")
+            with self._registry_lock:
+                self._check_journal()
+                self._register_transport(transport)
+                self._record("add_transport", transport)
+            self.events.info("Зарегистрирован транспорт: %s", transport)
+            return True
+        except (InvalidDataError, DuplicateIdError, PassengerNotFoundError) as e:
+            self._problem(e)
+            return False
+        except FileOperationError as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
 
     def add_passenger(self, passenger):
         try:
             if passenger is None:
                 raise InvalidDataError("Пассажир не может быть пустым")
-            self.passengers.append(passenger)
-            print(f"Зарегистрирован пассажир: {passenger}")
-        except InvalidDataError as e:
-            print(f"Проблема: {e}")
+            with self._registry_lock:
+                self._check_journal()
+                self._register_passenger(passenger)
+                self._record("add_passenger", passenger)
+            self.events.info("Зарегистрирован пассажир: %s", passenger)
+            return True
+        except (InvalidDataError, DuplicateIdError) as e:
+            self._problem(e)
+            return False
+        except FileOperationError as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
 
     def add_route(self, route):
         try:
             if route is None:
                 raise InvalidDataError("Маршрут не может быть пустым")
-            self.routes.append(route)
-            print(f"Создан маршрут: {route}")
-        except InvalidDataError as e:
-            print(f"Проблема: {e}")
+            with self._registry_lock:
+                self._check_journal()
+                self._register_route(route)
+                self._record("add_route", route)
+            self.events.info("Создан маршрут: %s", route)
+            return True
+        except (InvalidDataError, DuplicateIdError) as e:
+            self._problem(e)
+            return False
+        except FileOperationError as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
+
+    def _add_many(self, items, index, target, kind, empty_message, check=None):
+        """Пакетная регистрация без вывода сообщений"""
+        result = BatchResult()
+        batch = {}
+        for item in items:
+            if item is None:
+                result.rejected.append((item, InvalidDataError(empty_message)))
+                continue
+            if item.id in index or item.id in batch:
+                result.rejected.append((item, DuplicateIdError(
+                    f"{kind} с ID {item.id} уже существует"
+                )))
+                continue
+            if check is not None:
+                try:
+                    check(item)
+                except TransportError as e:
+                    result.rejected.append((item, e))
+                    continue
+            batch[item.id] = item
+            result.accepted.append(item)
+
+        index.update(batch)
+        if target is not index:
+            target.extend(result.accepted)
+        return result
+
+    def _add_many_transports(self, transports):
+        batch_locations = {}
+
+        def check(transport):
+            self._check_registered(transport.passengers)
+            for passenger in transport.passengers:
+                current = (self._passenger_locations.get(passenger.id)
+                           or batch_locations.get(passenger.id))
+                if current is not None:
+                    raise InvalidDataError(f"{passenger.name} уже находится в {current.name}")
+            for passenger in transport.passengers:
+                batch_locations[passenger.id] = transport
+
+        result = self._add_many(
+            transports, self._transports_by_id, self.transports,
+            "Транспорт", "Транспорт не может быть пустым", check
+        )
+        for transport in result.accepted:
+            transport.system = self
+            transport.events = self.events
+            self._index_transport(transport)
+        self._passenger_locations.update(batch_locations)
+        return result
+
+    def _add_many_passengers(self, passengers):
+        passengers = list(passengers)
+        batch_tickets = {}
+        invalid_snils = _invalid_snils(passengers)
+
+        def check(passenger):
+            ticket_number = passenger.ticket_number
+            if ticket_number in self._passengers_by_ticket or ticket_number in batch_tickets:
+                raise DuplicateIdError(f"Билет {ticket_number} уже зарегистрирован")
+            if invalid_snils:
+                reason = invalid_snils.get(id(passenger))
+                if reason:
+                    raise InvalidDataError(f"Некорректный СНИЛС {passenger.snils}: {SNILS_REASONS[reason]}")
+            batch_tickets[ticket_number] = passenger.id
+
+        result = self._add_many(
+            passengers, self._passengers_by_id, self.passengers,
+            "Пассажир", "Пассажир не может быть пустым", check
+        )
+        self._passengers_by_ticket.update(batch_tickets)
+        return result
+
+    def _add_many_routes(self, routes):
+        return self._add_many(
+            routes, self._routes_by_id, self.routes,
+            "Маршрут", "Маршрут не может быть пустым"
+        )
+
+    def _register_batch(self, operation, add_many, items):
+        """Пакетная регистрация под блокировкой реестра с записью мутации"""
+        with self._registry_lock:
+            try:
+                self._check_journal()
+            except FileOperationError as e:
+                self.events.error("Проблема с файлом: %s", e)
+                result = BatchResult()
+                result.rejected.extend((item, e) for item in items)
+                return result
+            result = add_many(items)
+            if result.accepted:
+                try:
+                    self._record(operation, result.accepted)
+                except FileOperationError as e:
+                    self.events.error("Проблема с файлом: %s", e)
+        return result
+
+    def add_transports(self, transports):
+        """Пакетная регистрация транспорта"""
+        result = self._register_batch("add_transports", self._add_many_transports, transports)
+        self.events.info(
+            "Зарегистрировано транспорта: %d, отклонено: %d",
+            len(result.accepted), len(result.rejected)
+        )
+        return result
+
+    def add_passengers(self, passengers):
+        """Пакетная регистрация пассажиров"""
+        result = self._register_batch("add_passengers", self._add_many_passengers, passengers)
+        self.events.info(
+            "Зарегистрировано пассажиров: %d, отклонено: %d",
+            len(result.accepted), len(result.rejected)
+        )
+        return result
+
+    def add_routes(self, routes):
+        """Пакетное создание маршрутов"""
+        result = self._register_batch("add_routes", self._add_many_routes, routes)
+        self.events.info(
+            "Создано маршрутов: %d, отклонено: %d",
+            len(result.accepted), len(result.rejected)
+        )
+        return result
 
     def assign_route_to_transport(self, transport_id, route_id):
         try:
@@ -174,334 +1505,1043 @@ class TransportSystem:
             if route is None:
                 raise PassengerNotFoundError(f"Не существует маршрута с ID {route_id}")
 
-            transport.route = route
-            print(f"Назначен {route} для {transport.name}")
+            with transport._lock:
+                version = self._log("assign_route", transport, route)
+                if transport.route is not None:
+                    self._transports_by_route.get(transport.route.id, {}).pop(transport.id, None)
+                transport.route = route
+                self._transports_by_route.setdefault(route.id, {})[transport.id] = transport
+                self._record("assign_route", transport, route, version=version)
+            self.events.info("Назначен %s для %s", route, transport.name)
+            return True
 
         except PassengerNotFoundError as e:
-            print(f"Проблема: {e}")
+            self._problem(e)
+            return False
+        except FileOperationError as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
 
     def find_transport(self, transport_id):
-        for transport in self.transports:
-            if transport.id == transport_id:
-                return transport
-        return None
+        return self._transports_by_id.get(transport_id)
 
     def find_passenger(self, passenger_id):
-        for passenger in self.passengers:
-            if passenger.id == passenger_id:
-                return passenger
-        return None
+        return self._passengers_by_id.get(passenger_id)
 
     def find_route(self, route_id):
-        for route in self.routes:
-            if route.id == route_id:
-                return route
-        return None
+        return self._routes_by_id.get(route_id)
 
-    def show_system_info(self):
-        """Отображение текущего состояния системы"""
-        print("\n" + "=" * 60)
-        print(" СВОДКА ПО ТРАНСПОРТНОЙ СИСТЕМЕ")
-        print("=" * 60)
+    def find_passenger_by_ticket(self, ticket_number):
+        """Пассажир по номеру билета (проверка на турникете) или None"""
+        passenger_id = self._passengers_by_ticket.get(ticket_number)
+        return None if passenger_id is None else self._passengers_by_id.get(passenger_id)
 
-        print(f"\nОСНОВНЫЕ ПОКАЗАТЕЛИ:")
-        print(f" Единиц транспорта: {len(self.transports)}")
-        print(f" Зарегистрировано пассажиров: {len(self.passengers)}")
-        print(f" Активных маршрутов: {len(self.routes)}")
+    def find_transports_on_route(self, route_id):
+        """Транспорт, назначенный на маршрут, в порядке назначения"""
+        return list(self._transports_by_route.get(route_id, {}).values())
 
-        print(f"\nСПИСОК МАРШРУТОВ:")
-        for route in self.routes:
-            print(f" {route}")
+    def find_transports_by_type(self, transport_type):
+        """Транспорт типа "bus", "tram" или "train" в порядке регистрации"""
+        return list(self._transports_by_type.get(transport_type, ()))
 
-        print(f"\nТРАНСПОРТНЫЕ СРЕДСТВА:")
-        for transport in self.transports:
-            route_status = f" на маршруте {transport.route}" if transport.route else " (маршрут не назначен)"
-            passenger_count = f", пассажиров: {len(transport.passengers)}"
-            print(f" {transport}{route_status}{passenger_count}")
+    def find_passenger_transport(self, passenger_id):
+        """Транспорт, в котором сейчас находится пассажир"""
+        return self._passenger_locations.get(passenger_id)
+
+    def plan_journey(self, origin, destination, weight=None):
+        """Поездка между остановками (см. transport_network)
 
-            if transport.passengers:
-                for passenger in transport.passengers:
-                    print(f"   - {passenger.name}")
+        Возвращает кортеж участков (откуда, куда, маршрут) с наименьшим
+        числом пересадок или, если задан weight(route), с наименьшей
+        суммарной стоимостью; None, если поездка невозможна.
+        """
+        try:
+            if self._network is None:
+                from transport_network import RouteNetwork
+                self._network = RouteNetwork(self)
+
+            journey = self._network.plan(origin, destination, weight)
+            if journey is None:
+                for stop in (origin, destination):
+                    if not self._network.has_stop(stop):
+                        raise PassengerNotFoundError(f"Остановку {stop} не обслуживает ни один маршрут")
+                self.events.info("Поездка из %s в %s невозможна", origin, destination)
+            return journey
+
+        except PassengerNotFoundError as e:
+            self._problem(e)
+            return None
+
+    def enable_analytics(self):
+        """Включение аналитики парка на столбцах NumPy (см. transport_analytics)
+
+        Возвращает FleetAnalytics или None, если numpy не установлен.
+        """
+        if self.analytics is None:
+            try:
+                from transport_analytics import FleetAnalytics
+            except ImportError as e:
+                self.events.error("Для аналитики нужен пакет numpy: %s", e)
+                return None
+            # Аналитика подключается сама, под блокировками среза (rebuild)
+            FleetAnalytics(self)
+        return self.analytics
+
+    def disable_analytics(self):
+        self.analytics = None
+
+    def enable_query_cache(self, max_entries=1024):
+        """Включение кэша ответов на частые запросы (см. transport_cache)"""
+        if self.queries is None:
+            from transport_cache import QueryCache
+            self.queries = QueryCache(self, max_entries)
+        return self.queries
+
+    def disable_query_cache(self):
+        self.queries = None
+
+    def enable_metrics(self, registry=None):
+        """Включение метрик (см. transport_metrics)
+
+        Возвращает TransportMetrics; registry позволяет собрать метрики
+        нескольких систем в один MetricsRegistry (имена не должны совпадать).
+        """
+        from transport_metrics import TransportMetrics
+
+        if self.metrics is None:
+            self.metrics = TransportMetrics(self, registry)
+            self.metrics.instrument(self)
+        return self.metrics
+
+    def disable_metrics(self):
+        if self.metrics is not None:
+            self.metrics.uninstrument(self)
+            self.metrics = None
+
+    def enable_journal(self, directory, fsync_every=100, fsync_interval=0.5):
+        """Включение журнала мутаций (см. transport_journal)
+
+        В каталоге создается снимок текущего состояния, после чего каждая
+        мутация дописывается в журнал. fsync выполняется после fsync_every
+        записей или если с прошлого fsync прошло fsync_interval секунд.
+        """
+        from transport_journal import MutationJournal
+
+        try:
+            MutationJournal.create(self, directory, fsync_every, fsync_interval)
+            self.events.info("Журнал мутаций включен: %s", directory)
+            return True
+        except (IOError, TransportError) as e:
+            self.journal = None
+            self.events.error("Проблема с файлом: %s", e)
+            return False
+
+    def disable_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def enable_sqlite(self, filename, batch_size=1000, flush_interval=0.5, replace=True):
+        """Подключение базы SQLite, в которую дописываются мутации (см. transport_sqlite)
+
+        По умолчанию база сначала перезаписывается текущим состоянием;
+        replace=False - база уже совпадает с системой (например, система
+        только что загружена из нее). Мутации пишутся транзакциями по
+        batch_size штук или раз в flush_interval секунд.
+        """
+        from transport_sqlite import SqliteStorage
+
+        try:
+            storage = SqliteStorage(filename, batch_size, flush_interval)
+            storage.hold()
+            previous = self.storage
+            # База подключается под блокировками среза: мутации после него
+            # копятся в очереди и пишутся следом за срезом
+            view = self._attach("storage", storage)
+            try:
+                if previous is not None:
+                    previous.close()
+                if replace:
+                    storage.replace(view, pending=True)
+                else:
+                    storage.release()
+            except BaseException:
+                self.storage = None
+                storage.close()
+                raise
+            self.events.info("Запись в базу SQLite включена: %s", filename)
+            return True
+        except (IOError, TransportError) as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
 
-        print(f"\nСПИСОК ПАССАЖИРОВ:")
+    def disable_sqlite(self):
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
+
+    def compact_journal(self):
+        """Свертка журнала в новый снимок"""
+        try:
+            if self.journal is None:
+                raise FileOperationError("Журнал мутаций не включен")
+            self.journal.compact(self)
+            self.events.info("Журнал свернут в снимок: %s", self.journal.snapshot_path)
+            return True
+        except (IOError, TransportError) as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
+
+    @classmethod
+    def recover(cls, directory, events=None, fsync_every=100, fsync_interval=0.5, **options):
+        """Восстановление системы из последнего снимка и хвоста журнала
+
+        Возвращает систему с подключенным журналом; при поврежденных
+        данных выбрасывает FileOperationError.
+        """
+        from transport_journal import recover
+
+        return recover(cls, directory, events, fsync_every, fsync_interval, **options)
+
+    def snapshot(self):
+        """Согласованный срез системы для чтения (см. SystemSnapshot)
+
+        На время среза берутся блокировка реестра и блокировки всего
+        транспорта, но запоминаются только длины списков и у каждого
+        транспортного средства - маршрут и общий словарь пассажиров
+        (PassengerSet.share). Пассажиры не копируются: транспорт копирует
+        свой словарь сам при первой посадке или высадке после среза, поэтому
+        запись в файл и отчеты по срезу не останавливают посадку.
+        """
+        return SystemSnapshot(self, *self._capture())
+
+    def _attach(self, name, receiver):
+        """Срез системы и подключение receiver (журнала или базы) как атрибута name
+
+        Подключение выполняется под блокировками среза: мутации до среза в
+        нем уже есть, а следующие receiver получит через _record.
+        """
+        return SystemSnapshot(self, *self._capture(attach=lambda: setattr(self, name, receiver)))
+
+    def _capture(self, select=None, attach=None):
+        """Состояние для среза под блокировками реестра и всего транспорта
+
+        select(transports) возвращает номера транспорта, который нужно
+        запомнить (по умолчанию весь); attach() вызывается после
+        запоминания состояния. Оба вызываются под блокировками.
+        """
+        with self._registry_lock:
+            transports = list(self.transports)
+            locks = [transport._lock for transport in transports]
+            for lock in locks:
+                lock.acquire()
+            try:
+                if select is not None:
+                    transports = [transports[row] for row in select(transports)]
+                state = [
+                    (transport, transport.route, transport.passengers.share())
+                    for transport in transports
+                ]
+                passengers = _PassengerPrefix(self.passengers, len(self.passengers))
+                routes = list(self.routes)
+                # Номер среза берется из счетчика, а не из _version: потоки
+                # присваивают _version не по порядку номеров, а все мутации
+                # с номером меньше выданного уже завершены (их блокировки
+                # взяты срезом), следующие получат номер больше
+                version = next(self._versions) - 1
+                if attach is not None:
+                    attach()
+            finally:
+                for lock in locks:
+                    lock.release()
+        return state, passengers, routes, version
+
+    def _report_transports(self, route_id, transport_type, min_occupancy):
+        # Отбор начинается с индекса по маршруту или типу, а не с обхода всего транспорта
+        if route_id is not None:
+            transports = self.find_transports_on_route(route_id)
+            if transport_type is not None:
+                transports = (t for t in transports if getattr(t, 'type', 'transport') == transport_type)
+        elif transport_type is not None:
+            transports = self.find_transports_by_type(transport_type)
+        else:
+            transports = self.transports
+        if min_occupancy is not None:
+            transports = (t for t in transports if len(t.passengers) >= min_occupancy * t.capacity)
+        return transports
+
+    @staticmethod
+    def _report_page(lines, offset, limit):
+        """Страница раздела; строка-подсказка, если за страницей есть еще записи"""
+        stop = None if limit is None else offset + limit
+        page = islice(lines, offset, None if stop is None else stop + 1)
+        for shown, line in enumerate(page, offset):
+            if shown == stop:
+                yield f" ... есть еще записи, следующая страница: offset={stop}"
+                return
+            yield line
+
+    def report(self, sections=None, route_id=None, transport_type=None, min_occupancy=None,
+               offset=0, limit=None, passenger_names=True, summary_only=False):
+        """Строки отчета о системе, формируемые по мере чтения
+
+        sections - разделы из REPORT_SECTIONS (по умолчанию как в
+        show_system_info); summary_only=True - только сводка и загрузка,
+        которые считаются по счетчикам без обхода транспорта и пассажиров.
+        Фильтры route_id, transport_type ("bus", "tram", "train") и
+        min_occupancy (доля занятых мест от 0 до 1) отбирают транспорт;
+        при фильтрах в разделе пассажиров остаются только пассажиры
+        отобранного транспорта. offset и limit задают страницу каждого
+        раздела-списка.
+
+        Разделы строятся по срезу системы (см. snapshot), поэтому посадка
+        во время чтения отчета не меняет его; сводка и загрузка при
+        summary_only=True читаются прямо из счетчиков.
+        """
+        if summary_only:
+            sections = ("summary", "load")
+        elif sections is None:
+            sections = ("summary", "routes", "transports", "passengers")
+        unknown = set(sections) - set(REPORT_SECTIONS)
+        if unknown:
+            raise InvalidDataError(f"Неизвестные разделы отчета: {', '.join(sorted(unknown))}")
+        filtered = route_id is not None or transport_type is not None or min_occupancy is not None
+        view = self if summary_only else self.snapshot()
+
+        yield ""
+        yield "=" * 60
+        yield " СВОДКА ПО ТРАНСПОРТНОЙ СИСТЕМЕ"
+        yield "=" * 60
+
+        for section in sections:
+            yield ""
+            if section == "summary":
+                yield "ОСНОВНЫЕ ПОКАЗАТЕЛИ:"
+                yield f" Единиц транспорта: {len(view.transports)}"
+                yield f" Зарегистрировано пассажиров: {len(view.passengers)}"
+                yield f" Активных маршрутов: {len(view.routes)}"
+
+            elif section == "load":
+                in_transit = len(view._passenger_locations)
+                yield "ЗАГРУЗКА:"
+                yield f" Пассажиров в пути: {in_transit}"
+                yield f" Ожидают транспорт: {len(view.passengers) - in_transit}"
+                yield f" Мест в транспорте: {view._seats}"
+                load = in_transit / view._seats * 100 if view._seats else 0.0
+                yield f" Занято мест: {load:.1f}%"
+
+            elif section == "routes":
+                yield "СПИСОК МАРШРУТОВ:"
+                if route_id is not None:
+                    route = view._routes_by_id.get(route_id)
+                    routes = () if route is None else (route,)
+                else:
+                    routes = view.routes
+                yield from view._report_page((f" {route}" for route in routes), offset, limit)
+
+            elif section == "transports":
+                yield "ТРАНСПОРТНЫЕ СРЕДСТВА:"
+                yield from view._report_page(
+                    view._report_transport_lines(
+                        view._report_transports(route_id, transport_type, min_occupancy),
+                        passenger_names
+                    ),
+                    offset, limit
+                )
+
+            elif section == "passengers":
+                yield "СПИСОК ПАССАЖИРОВ:"
+                if filtered:
+                    lines = (
+                        f" {passenger.name} находится в {transport.name}"
+                        for transport in view._report_transports(route_id, transport_type, min_occupancy)
+                        for passenger in transport.passengers
+                    )
+                else:
+                    lines = view._report_passenger_lines()
+                yield from view._report_page(lines, offset, limit)
+
+    @staticmethod
+    def _report_transport_lines(transports, passenger_names):
+        # Транспорт с именами пассажиров - одна запись страницы
+        for transport in transports:
+            route_status = f" на маршруте {transport.route}" if transport.route else " (маршрут не назначен)"
+            line = f" {transport}{route_status}, пассажиров: {len(transport.passengers)}"
+            if passenger_names and transport.passengers:
+                line += "".join(f"\n   - {passenger.name}" for passenger in transport.passengers)
+            yield line
+
+    def _report_passenger_lines(self):
+        locations = self._passenger_locations
         for passenger in self.passengers:
-            current_transport = None
-            for transport in self.transports:
-                if passenger in transport.passengers:
-                    current_transport = transport.name
-                    break
-            location_info = f" находится в {current_transport}" if current_transport else " (ожидает транспорт)"
-            print(f" {passenger.name}{location_info}")
-
-    def save_to_json(self, filename):
-        """Запись данных в JSON формат"""
+            current_transport = locations.get(passenger.id)
+            location_info = f" находится в {current_transport.name}" if current_transport else " (ожидает транспорт)"
+            yield f" {passenger.name}{location_info}"
+
+    def write_report(self, stream=None, **options):
+        """Запись отчета (см. report) в поток, по умолчанию в sys.stdout"""
+        stream = sys.stdout if stream is None else stream
+        stream.writelines(f"{line}\n" for line in self.report(**options))
+
+    def show_system_info(self):
+        """Отображение текущего состояния системы"""
+        self.write_report()
+
+    def _json_sections(self):
+        return (
+            ("transports", map(_transport_to_data, self.transports)),
+            ("passengers", map(_passenger_to_data, self.passengers)),
+            ("routes", map(_route_to_data, self.routes))
+        )
+
+    def save_to_json(self, filename, stream=False, compact=False):
+        """Запись данных в JSON формат
+
+        stream=True пишет записи в файл по одной, не собирая весь документ
+        в памяти; compact=True отключает отступы.
+        """
+        started = time.perf_counter()
         try:
             if not filename:
                 raise InvalidDataError("Не указано имя файла")
+            view = self.snapshot()
+
+            if stream:
+                with open(filename, 'w', encoding='utf-8') as f:
+                    _write_json_stream(f, view._json_sections(), compact=compact)
+                self.events.info("Данные записаны в JSON файл: %s", filename)
+                self.events.summary("Записано в JSON", view._load_counts(), started)
+                return True
 
             data = {
                 "transport_system": {
-                    "transports": [
-                        {
-                            "id": t.id,
-                            "type": getattr(t, 'type', 'transport'),
-                            "name": t.name,
-                            "capacity": t.capacity,
-                            "bus_number": getattr(t, 'bus_number', None),
-                            "line_number": getattr(t, 'line_number', None),
-                            "carriages": getattr(t, 'carriages', None),
-                            "route_id": t.route.id if t.route else None,
-                            "passengers": [p.id for p in t.passengers]
-                        }
-                        for t in self.transports
-                    ],
-                    "passengers": [
-                        {
-                            "id": p.id,
-                            "name": p.name,
-                            "ticket_number": p.ticket_number
-                        }
-                        for p in self.passengers
-                    ],
-                    "routes": [
-                        {
-                            "id": r.id,
-                            "start_point": r.start_point,
-                            "end_point": r.end_point
-                        }
-                        for r in self.routes
-                    ]
+                    "transports": [_transport_to_data(t) for t in view.transports],
+                    "passengers": [_passenger_to_data(p) for p in view.passengers],
+                    "routes": [_route_to_data(r) for r in view.routes]
                 }
             }
 
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            print(f"Данные записаны в JSON файл: {filename}")
+                if compact:
+                    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                else:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+            self.events.info("Данные записаны в JSON файл: %s", filename)
+            self.events.summary("Записано в JSON", view._load_counts(), started)
+            return True
 
         except InvalidDataError as e:
-            print(f"Ошибка в данных: {e}")
+            self.events.error("Ошибка в данных: %s", e)
+            return False
         except IOError as e:
-            print(f"Проблема с файлом: {e}")
+            self.events.error("Проблема с файлом: %s", e)
+            return False
         except Exception as e:
-            print(f"Неизвестная проблема при записи JSON: {e}")
-
-    def load_from_json(self, filename):
-        """Чтение данных из JSON файла"""
-        try:
-            if not filename:
-                raise InvalidDataError("Не указано имя файла")
-
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            print(f"Чтение данных из JSON файла: {filename}")
-
-            self.transports.clear()
-            self.passengers.clear()
-            self.routes.clear()
+            self.events.error("Неизвестная проблема при записи JSON: %s", e)
+            return False
 
-            for route_data in data["transport_system"]["routes"]:
-                route = Route(
-                    route_data["id"],
-                    route_data["start_point"],
-                    route_data["end_point"]
-                )
-                self.routes.append(route)
-                print(f" Загружен маршрут: {route}")
-
-            for passenger_data in data["transport_system"]["passengers"]:
-                passenger = Passenger(
-                    passenger_data["id"],
-                    passenger_data["name"],
-                    passenger_data["ticket_number"]
-                )
-                self.passengers.append(passenger)
-                print(f" Загружен пассажир: {passenger}")
-
-            for transport_data in data["transport_system"]["transports"]:
-                transport_type = transport_data["type"]
-
-                if transport_type == "bus":
-                    transport = Bus(
-                        transport_data["id"],
-                        transport_data["name"],
-                        transport_data["capacity"],
-                        transport_data["bus_number"]
-                    )
-                elif transport_type == "tram":
-                    transport = Tram(
-                        transport_data["id"],
-                        transport_data["name"],
-                        transport_data["capacity"],
-                        transport_data["line_number"]
+    def _link_loaded_transport(self, transport, route_id, passenger_ids):
+        """Связывание загруженного транспорта с маршрутом и пассажирами"""
+        if route_id:
+            route = self.find_route(route_id)
+            if route:
+                transport.route = route
+
+        find_passenger = self._passengers_by_id.get
+        transport.passengers.update(
+            passenger for passenger in map(find_passenger, passenger_ids) if passenger
+        )
+        return transport
+
+    def _load_batches(self, add_many, objects, message):
+        """Регистрация загружаемых объектов пакетами; первая ошибка прерывает загрузку"""
+        verbose = self.events.enabled(logging.DEBUG)
+        for chunk in _chunks(objects, _LOAD_BATCH_SIZE):
+            result = add_many(chunk)
+            if verbose:
+                for item in result.accepted:
+                    self.events.debug(message, item)
+            result.raise_first()
+
+    def _load_linked_transports(self, pending):
+        self._load_batches(
+            self._add_many_transports,
+            (self._link_loaded_transport(*item) for item in pending),
+            " Загружен транспорт: %s"
+        )
+
+    def _load_json_stream(self, f):
+        """Потоковая загрузка: объекты создаются по мере чтения массивов"""
+        reader = _JsonStreamReader(f)
+        # Транспорт в файле идет раньше пассажиров, поэтому связи
+        # откладываются до конца чтения в компактном виде
+        pending = []
+
+        for key in reader.keys():
+            if key != "transport_system":
+                reader.value()
+                continue
+
+            for section in reader.keys():
+                if section == "routes":
+                    self._load_batches(
+                        self._add_many_routes,
+                        map(_route_from_data, reader.items()),
+                        " Загружен маршрут: %s"
                     )
-                elif transport_type == "train":
-                    transport = Train(
-                        transport_data["id"],
-                        transport_data["name"],
-                        transport_data["capacity"],
-                        transport_data["carriages"]
+                elif section == "passengers":
+                    self._load_batches(
+                        self._add_many_passengers,
+                        map(_passenger_from_data, reader.items()),
+                        " Загружен пассажир: %s"
                     )
+                elif section == "transports":
+                    for transport_data in reader.items():
+                        pending.append((
+                            _transport_from_data(transport_data),
+                            transport_data["route_id"],
+                            array('q', transport_data["passengers"])
+                        ))
                 else:
-                    transport = Transport(
-                        transport_data["id"],
-                        transport_data["name"],
-                        transport_data["capacity"]
-                    )
+                    reader.value()
 
-                if transport_data["route_id"]:
-                    route = self.find_route(transport_data["route_id"])
-                    if route:
-                        transport.route = route
+        self._load_linked_transports(pending)
 
-                for passenger_id in transport_data["passengers"]:
-                    passenger = self.find_passenger(passenger_id)
-                    if passenger:
-                        transport.passengers.append(passenger)
+    def load_from_json(self, filename, stream=False):
+        """Чтение данных из JSON файла
 
-                self.transports.append(transport)
-                print(f" Загружен транспорт: {transport}")
+        При stream=True файл разбирается по частям, и пиковая память
+        определяется размером итогового графа объектов, а не документа.
+        """
+        started = time.perf_counter()
+        try:
+            if not filename:
+                raise InvalidDataError("Не указано имя файла")
 
-            print("Все данные успешно загружены из JSON!")
+            if stream:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    self.events.info("Чтение данных из JSON файла: %s", filename)
+                    self._clear()
+                    self._load_json_stream(f)
+                self._after_load()
+                self.events.info("Все данные успешно загружены из JSON!")
+                self.events.summary("Загружено из JSON", self._load_counts(), started)
+                return
+
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.events.info("Чтение данных из JSON файла: %s", filename)
+
+            self._clear()
+
+            self._load_batches(
+                self._add_many_routes,
+                map(_route_from_data, data["transport_system"]["routes"]),
+                " Загружен маршрут: %s"
+            )
+            self._load_batches(
+                self._add_many_passengers,
+                map(_passenger_from_data, data["transport_system"]["passengers"]),
+                " Загружен пассажир: %s"
+            )
+            self._load_linked_transports(
+                (_transport_from_data(transport_data),
+                 transport_data["route_id"],
+                 transport_data["passengers"])
+                for transport_data in data["transport_system"]["transports"]
+            )
+
+            self._after_load()
+            self.events.info("Все данные успешно загружены из JSON!")
+            self.events.summary("Загружено из JSON", self._load_counts(), started)
 
         except FileNotFoundError:
-            print(f"Файл {filename} не обнаружен")
+            self.events.error("Файл %s не обнаружен", filename)
         except json.JSONDecodeError:
-            print(f"Некорректный JSON в файле {filename}")
-        except InvalidDataError as e:
-            print(f"Ошибка в данных: {e}")
+            self.events.error("Некорректный JSON в файле %s", filename)
+        except (InvalidDataError, DuplicateIdError) as e:
+            self.events.error("Ошибка в данных: %s", e)
         except Exception as e:
-            print(f"Неизвестная проблема при чтении JSON: {e}")
+            self.events.error("Неизвестная проблема при чтении JSON: %s", e)
+
+    def save_to_xml(self, filename, stream=False):
+        """Запись данных в XML формат
 
-    def save_to_xml(self, filename):
-        """Запись данных в XML формат"""
+        stream=True сериализует записи по одной прямо в файл вместо
+        построения полного дерева элементов.
+        """
+        started = time.perf_counter()
         try:
             if not filename:
                 raise InvalidDataError("Не указано имя файла")
+            view = self.snapshot()
+
+            if stream:
+                with open(filename, 'w', encoding='utf-8') as f:
+                    _write_xml_stream(f, (
+                        ("transports", map(_transport_to_xml, view.transports)),
+                        ("passengers", map(_passenger_to_xml, view.passengers)),
+                        ("routes", map(_route_to_xml, view.routes))
+                    ))
+                self.events.info("Данные записаны в XML файл: %s", filename)
+                self.events.summary("Записано в XML", view._load_counts(), started)
+                return True
 
             root = ET.Element("transport_system")
-
-            transports_elem = ET.SubElement(root, "transports")
-            for transport in self.transports:
-                transport_elem = ET.SubElement(transports_elem, "transport")
-                ET.SubElement(transport_elem, "id").text = str(transport.id)
-                ET.SubElement(transport_elem, "type").text = getattr(transport, 'type', 'transport')
-                ET.SubElement(transport_elem, "name").text = transport.name
-                ET.SubElement(transport_elem, "capacity").text = str(transport.capacity)
-
-                if hasattr(transport, 'bus_number'):
-                    ET.SubElement(transport_elem, "bus_number").text = transport.bus_number
-                if hasattr(transport, 'line_number'):
-                    ET.SubElement(transport_elem, "line_number").text = transport.line_number
-                if hasattr(transport, 'carriages'):
-                    ET.SubElement(transport_elem, "carriages").text = str(transport.carriages)
-
-                ET.SubElement(transport_elem, "route_id").text = str(transport.route.id) if transport.route else ""
-
-                passengers_elem = ET.SubElement(transport_elem, "passengers")
-                for passenger in transport.passengers:
-                    ET.SubElement(passengers_elem, "passenger_id").text = str(passenger.id)
-
-            passengers_elem = ET.SubElement(root, "passengers")
-            for passenger in self.passengers:
-                passenger_elem = ET.SubElement(passengers_elem, "passenger")
-                ET.SubElement(passenger_elem, "id").text = str(passenger.id)
-                ET.SubElement(passenger_elem, "name").text = passenger.name
-                ET.SubElement(passenger_elem, "ticket_number").text = passenger.ticket_number
-
-            routes_elem = ET.SubElement(root, "routes")
-            for route in self.routes:
-                route_elem = ET.SubElement(routes_elem, "route")
-                ET.SubElement(route_elem, "id").text = str(route.id)
-                ET.SubElement(route_elem, "start_point").text = route.start_point
-                ET.SubElement(route_elem, "end_point").text = route.end_point
+            for name, elements in (
+                ("transports", map(_transport_to_xml, view.transports)),
+                ("passengers", map(_passenger_to_xml, view.passengers)),
+                ("routes", map(_route_to_xml, view.routes))
+            ):
+                ET.SubElement(root, name).extend(elements)
 
             tree = ET.ElementTree(root)
             tree.write(filename, encoding='utf-8', xml_declaration=True)
-            print(f"Данные записаны в XML файл: {filename}")
+            self.events.info("Данные записаны в XML файл: %s", filename)
+            self.events.summary("Записано в XML", view._load_counts(), started)
+            return True
 
         except InvalidDataError as e:
-            print(f"Ошибка в данных: {e}")
+            self.events.error("Ошибка в данных: %s", e)
+            return False
         except IOError as e:
-            print(f"Проблема с файлом: {e}")
+            self.events.error("Проблема с файлом: %s", e)
+            return False
         except Exception as e:
-            print(f"Неизвестная проблема при записи XML: {e}")
+            self.events.error("Неизвестная проблема при записи XML: %s", e)
+            return False
 
-    def load_from_xml(self, filename):
-        """Чтение данных из XML файла"""
+    def _load_xml_stream(self, filename):
+        """Событийный разбор XML: каждая запись удаляется сразу после обработки"""
+        pending = []
+
+        # Секции могут идти в любом порядке, записи одного вида идут подряд
+        for tag, elements in groupby(_iter_xml_records(filename), key=lambda elem: elem.tag):
+            if tag == "route":
+                self._load_batches(
+                    self._add_many_routes,
+                    (_route_from_data(_route_data_from_xml(elem)) for elem in elements),
+                    " Загружен маршрут: %s"
+                )
+            elif tag == "passenger":
+                self._load_batches(
+                    self._add_many_passengers,
+                    (_passenger_from_data(_passenger_data_from_xml(elem)) for elem in elements),
+                    " Загружен пассажир: %s"
+                )
+            elif tag == "transport":
+                for elem in elements:
+                    transport_data = _transport_data_from_xml(elem)
+                    pending.append((
+                        _transport_from_data(transport_data),
+                        transport_data["route_id"],
+                        array('q', transport_data["passengers"])
+                    ))
+
+        self._load_linked_transports(pending)
+
+    def load_from_xml(self, filename, stream=False):
+        """Чтение данных из XML файла
+
+        При stream=True документ разбирается через iterparse без
+        построения полного дерева в памяти.
+        """
+        started = time.perf_counter()
         try:
             if not filename:
                 raise InvalidDataError("Не указано имя файла")
 
+            if stream:
+                self.events.info("Чтение данных из XML файла: %s", filename)
+                self._clear()
+                self._load_xml_stream(filename)
+                self._after_load()
+                self.events.info("Все данные успешно загружены из XML!")
+                self.events.summary("Загружено из XML", self._load_counts(), started)
+                return
+
             tree = ET.parse(filename)
             root = tree.getroot()
-            print(f"Чтение данных из XML файла: {filename}")
+            self.events.info("Чтение данных из XML файла: %s", filename)
+
+            self._clear()
+
+            self._load_batches(
+                self._add_many_routes,
+                (_route_from_data(_route_data_from_xml(elem)) for elem in root.find("routes")),
+                " Загружен маршрут: %s"
+            )
+            self._load_batches(
+                self._add_many_passengers,
+                (_passenger_from_data(_passenger_data_from_xml(elem))
+                 for elem in root.find("passengers")),
+                " Загружен пассажир: %s"
+            )
+            transport_records = map(_transport_data_from_xml, root.find("transports"))
+            self._load_linked_transports(
+                (_transport_from_data(transport_data),
+                 transport_data["route_id"],
+                 transport_data["passengers"])
+                for transport_data in transport_records
+            )
+
+            self._after_load()
+            self.events.info("Все данные успешно загружены из XML!")
+            self.events.summary("Загружено из XML", self._load_counts(), started)
+
+        except FileNotFoundError:
+            self.events.error("Файл %s не обнаружен", filename)
+        except ET.ParseError:
+            self.events.error("Некорректный XML в файле %s", filename)
+        except (InvalidDataError, DuplicateIdError) as e:
+            self.events.error("Ошибка в данных: %s", e)
+        except Exception as e:
+            self.events.error("Неизвестная проблема при чтении XML: %s", e)
+
+    def save_to_binary(self, filename):
+        """Запись данных в бинарный снимок (см. transport_snapshot)"""
+        from transport_snapshot import write_snapshot
 
-            self.transports.clear()
-            self.passengers.clear()
-            self.routes.clear()
+        started = time.perf_counter()
+        try:
+            if not filename:
+                raise InvalidDataError("Не указано имя файла")
 
-            for route_elem in root.find("routes"):
-                route = Route(
-                    int(route_elem.find("id").text),
-                    route_elem.find("start_point").text,
-                    route_elem.find("end_point").text
+            view = self.snapshot()
+            write_snapshot(view, filename)
+            self.events.info("Данные записаны в бинарный снимок: %s", filename)
+            self.events.summary("Записано в снимок", view._load_counts(), started)
+            return True
+
+        except InvalidDataError as e:
+            self.events.error("Ошибка в данных: %s", e)
+            return False
+        except IOError as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
+        except Exception as e:
+            self.events.error("Неизвестная проблема при записи снимка: %s", e)
+            return False
+
+    def load_from_binary(self, filename):
+        """Полная загрузка бинарного снимка
+
+        Для доступа без загрузки всех объектов служит
+        transport_snapshot.open_snapshot.
+        """
+        from transport_snapshot import SnapshotReader
+
+        started = time.perf_counter()
+        try:
+            if not filename:
+                raise InvalidDataError("Не указано имя файла")
+
+            with SnapshotReader(filename) as reader:
+                self.events.info("Чтение данных из бинарного снимка: %s", filename)
+                self._clear()
+                self._load_batches(
+                    self._add_many_routes,
+                    map(_route_from_data, reader.iter_route_data()),
+                    " Загружен маршрут: %s"
                 )
-                self.routes.append(route)
-                print(f" Загружен маршрут: {route}")
-
-            for passenger_elem in root.find("passengers"):
-                passenger = Passenger(
-                    int(passenger_elem.find("id").text),
-                    passenger_elem.find("name").text,
-                    passenger_elem.find("ticket_number").text
+                self._load_batches(
+                    self._add_many_passengers,
+                    map(_passenger_from_data, reader.iter_passenger_data()),
+                    " Загружен пассажир: %s"
+                )
+                self._load_linked_transports(
+                    (_transport_from_data(transport_data),
+                     transport_data["route_id"],
+                     transport_data["passengers"])
+                    for transport_data in reader.iter_transport_data()
                 )
-                self.passengers.append(passenger)
-                print(f" Загружен пассажир: {passenger}")
-
-            for transport_elem in root.find("transports"):
-                transport_type = transport_elem.find("type").text
-                transport_id = int(transport_elem.find("id").text)
-                name = transport_elem.find("name").text
-                capacity = int(transport_elem.find("capacity").text)
-
-                if transport_type == "bus":
-                    bus_number = transport_elem.find("bus_number").text
-                    transport = Bus(transport_id, name, capacity, bus_number)
-                elif transport_type == "tram":
-                    line_number = transport_elem.find("line_number").text
-                    transport = Tram(transport_id, name, capacity, line_number)
-                elif transport_type == "train":
-                    carriages = int(transport_elem.find("carriages").text)
-                    transport = Train(transport_id, name, capacity, carriages)
-                else:
-                    transport = Transport(transport_id, name, capacity)
 
-                route_id_elem = transport_elem.find("route_id")
-                if route_id_elem is not None and route_id_elem.text:
-                    route = self.find_route(int(route_id_elem.text))
-                    if route:
-                        transport.route = route
+            self._after_load()
+            self.events.info("Все данные успешно загружены из снимка!")
+            self.events.summary("Загружено из снимка", self._load_counts(), started)
 
-                passengers_elem = transport_elem.find("passengers")
-                if passengers_elem is not None:
-                    for passenger_id_elem in passengers_elem.findall("passenger_id"):
-                        passenger = self.find_passenger(int(passenger_id_elem.text))
-                        if passenger:
-                            transport.passengers.append(passenger)
+        except FileNotFoundError:
+            self.events.error("Файл %s не обнаружен", filename)
+        except (InvalidDataError, DuplicateIdError, FileOperationError) as e:
+            self.events.error("Ошибка в данных: %s", e)
+        except Exception as e:
+            self.events.error("Неизвестная проблема при чтении снимка: %s", e)
+
+    def save_to_sqlite(self, filename):
+        """Запись данных в базу SQLite (см. transport_sqlite)"""
+        from transport_sqlite import write_database
+
+        started = time.perf_counter()
+        try:
+            if not filename:
+                raise InvalidDataError("Не указано имя файла")
+
+            view = self.snapshot()
+            write_database(view, filename)
+            self.events.info("Данные записаны в базу SQLite: %s", filename)
+            self.events.summary("Записано в базу", view._load_counts(), started)
+            return True
+
+        except InvalidDataError as e:
+            self.events.error("Ошибка в данных: %s", e)
+            return False
+        except (IOError, FileOperationError) as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
+        except Exception as e:
+            self.events.error("Неизвестная проблема при записи в базу: %s", e)
+            return False
+
+    def load_from_sqlite(self, filename):
+        """Полная загрузка базы SQLite
+
+        Для доступа без загрузки всех объектов служит
+        transport_sqlite.open_database.
+        """
+        from transport_sqlite import SqliteReader
+
+        started = time.perf_counter()
+        try:
+            if not filename:
+                raise InvalidDataError("Не указано имя файла")
 
-                self.transports.append(transport)
-                print(f" Загружен транспорт: {transport}")
+            with SqliteReader(filename) as reader:
+                self.events.info("Чтение данных из базы SQLite: %s", filename)
+                self._clear()
+                self._load_batches(
+                    self._add_many_routes,
+                    map(_route_from_data, reader.iter_route_data()),
+                    " Загружен маршрут: %s"
+                )
+                self._load_batches(
+                    self._add_many_passengers,
+                    map(_passenger_from_data, reader.iter_passenger_data()),
+                    " Загружен пассажир: %s"
+                )
+                self._load_linked_transports(
+                    (_transport_from_data(transport_data),
+                     transport_data["route_id"],
+                     transport_data["passengers"])
+                    for transport_data in reader.iter_transport_data()
+                )
 
-            print("Все данные успешно загружены из XML!")
+            self._after_load()
+            self.events.info("Все данные успешно загружены из базы!")
+            self.events.summary("Загружено из базы", self._load_counts(), started)
 
         except FileNotFoundError:
-            print(f"Файл {filename} не обнаружен")
-        except ET.ParseError:
-            print(f"Некорректный XML в файле {filename}")
+            self.events.error("Файл %s не обнаружен", filename)
+        except (InvalidDataError, DuplicateIdError, FileOperationError) as e:
+            self.events.error("Ошибка в данных: %s", e)
+        except Exception as e:
+            self.events.error("Неизвестная проблема при чтении базы: %s", e)
+
+    def save_to_shards(self, directory, shards=4, file_format="json", workers=1):
+        """Запись данных в шардированный снимок (см. transport_shards)
+
+        При workers > 1 шарды пишутся в пуле процессов; ускорение от
+        этого не измерено, поэтому по умолчанию они пишутся по очереди.
+        """
+        from transport_shards import write_shards
+
+        started = time.perf_counter()
+        try:
+            if not directory:
+                raise InvalidDataError("Не указан каталог снимка")
+
+            view = self.snapshot()
+            write_shards(view, directory, shards, file_format, workers)
+            self.events.info("Данные записаны в шарды (%d): %s", shards, directory)
+            self.events.summary("Записано в шарды", view._load_counts(), started)
+            return True
+
         except InvalidDataError as e:
-            print(f"Ошибка в данных: {e}")
+            self.events.error("Ошибка в данных: %s", e)
+            return False
+        except IOError as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
         except Exception as e:
-            print(f"Неизвестная проблема при чтении XML: {e}")
+            self.events.error("Неизвестная проблема при записи шардов: %s", e)
+            return False
+
+    def load_from_shards(self, directory, workers=1):
+        """Чтение шардированного снимка
+
+        При workers > 1 шарды разбираются в пуле процессов. Объекты
+        создаются и связываются в текущем процессе, поэтому маршруты и
+        пассажиры из разных шардов находятся по id так же, как при обычной
+        загрузке. Порядок записей после загрузки идет по шардам.
+        """
+        from transport_shards import read_shards
+
+        started = time.perf_counter()
+        try:
+            if not directory:
+                raise InvalidDataError("Не указан каталог снимка")
+
+            transports, passengers, routes = read_shards(directory, workers)
+            self.events.info("Чтение данных из шардов: %s", directory)
+            self._clear()
+
+            self._load_batches(
+                self._add_many_routes,
+                map(_route_from_data, routes),
+                " Загружен маршрут: %s"
+            )
+            self._load_batches(
+                self._add_many_passengers,
+                map(_passenger_from_data, passengers),
+                " Загружен пассажир: %s"
+            )
+            self._load_linked_transports(
+                (_transport_from_data(transport_data),
+                 transport_data["route_id"],
+                 transport_data["passengers"])
+                for transport_data in transports
+            )
+
+            self._after_load()
+            self.events.info("Все данные успешно загружены из шардов!")
+            self.events.summary("Загружено из шардов", self._load_counts(), started)
+
+        except (InvalidDataError, DuplicateIdError, FileOperationError) as e:
+            self.events.error("Ошибка в данных: %s", e)
+        except IOError as e:
+            self.events.error("Проблема с файлом: %s", e)
+        except Exception as e:
+            self.events.error("Неизвестная проблема при чтении шардов: %s", e)
+
+    def save_to_segments(self, directory, file_format="json", chunk_size=256):
+        """Запись данных в сегментированный снимок (см. transport_segments)
+
+        Повторная запись в тот же каталог переписывает только сегменты,
+        изменившиеся с прошлой записи или загрузки.
+        """
+        from transport_segments import write_segments
+
+        started = time.perf_counter()
+        try:
+            if not directory:
+                raise InvalidDataError("Не указан каталог снимка")
+
+            written, total = write_segments(self, directory, file_format, chunk_size)
+            self.events.info("Данные записаны в сегменты (%d из %d): %s", written, total, directory)
+            self.events.summary("Записано в сегменты", self._load_counts(), started)
+            return True
+
+        except (InvalidDataError, FileOperationError) as e:
+            self.events.error("Ошибка в данных: %s", e)
+            return False
+        except IOError as e:
+            self.events.error("Проблема с файлом: %s", e)
+            return False
+        except Exception as e:
+            self.events.error("Неизвестная проблема при записи сегментов: %s", e)
+            return False
+
+    def load_from_segments(self, directory):
+        """Чтение сегментированного снимка
+
+        После полной загрузки включается учет изменений, и следующая
+        запись save_to_segments в тот же каталог будет инкрементальной.
+        """
+        from transport_segments import iter_section, read_manifest, track_loaded
+
+        started = time.perf_counter()
+        try:
+            if not directory:
+                raise InvalidDataError("Не указан каталог снимка")
+
+            manifest = read_manifest(directory)
+            if manifest is None:
+                raise FileOperationError(f"Нет сегментированного снимка в {directory}")
+            self.events.info("Чтение данных из сегментов: %s", directory)
+            self._clear()
+
+            self._load_batches(
+                self._add_many_routes,
+                map(_route_from_data, iter_section(directory, manifest, "routes")),
+                " Загружен маршрут: %s"
+            )
+            self._load_batches(
+                self._add_many_passengers,
+                map(_passenger_from_data, iter_section(directory, manifest, "passengers")),
+                " Загружен пассажир: %s"
+            )
+            self._load_linked_transports(
+                (_transport_from_data(transport_data),
+                 transport_data["route_id"],
+                 transport_data["passengers"])
+                for transport_data in iter_section(directory, manifest, "transports")
+            )
+
+            self._after_load()
+            track_loaded(self, directory, manifest)
+            self.events.info("Все данные успешно загружены из сегментов!")
+            self.events.summary("Загружено из сегментов", self._load_counts(), started)
+
+        except (InvalidDataError, DuplicateIdError, FileOperationError) as e:
+            self.events.error("Ошибка в данных: %s", e)
+        except IOError as e:
+            self.events.error("Проблема с файлом: %s", e)
+        except Exception as e:
+            self.events.error("Неизвестная проблема при чтении сегментов: %s", e)
+
+
+class SystemSnapshot(TransportSystem):
+    """Срез системы на момент TransportSystem.snapshot()
+
+    Читается так же, как сама система: поиск, отчеты, запись в файлы,
+    аналитика (enable_analytics). Транспорт среза - копии с маршрутом и
+    пассажирами на момент среза, пассажиры - префикс списка системы;
+    изменения живой системы в срез не попадают. Изменять срез нельзя.
+    """
+
+    def __init__(self, system, state, passengers, routes, version):
+        super().__init__(events=system.events)
+        self.passengers = self._passengers_by_id = passengers
+        # Билеты не удаляются и не переназначаются; поиск по ID
+        # отбрасывает пассажиров, зарегистрированных после среза
+        self._passengers_by_ticket = system._passengers_by_ticket
+        self.routes = routes
+        for route in routes:
+            self._routes_by_id[route.id] = route
+        for transport, route, riders in state:
+            clone = transport._snapshot_copy(route, riders)
+            self.transports.append(clone)
+            self._transports_by_id[clone.id] = clone
+            self._index_transport(clone)
+        self._locations = None
+        self._version = self._network_version = version
+
+    # Запись в файлы обходится без обратного индекса пассажир -> транспорт,
+    # поэтому он строится при первом обращении (отчет, поиск, шарды)
+    @property
+    def _passenger_locations(self):
+        if self._locations is None:
+            locations = {}
+            for transport in self.transports:
+                locations.update(dict.fromkeys(map(_get_id, transport.passengers), transport))
+            self._locations = locations
+        return self._locations
+
+    @_passenger_locations.setter
+    def _passenger_locations(self, locations):
+        self._locations = locations
+
+    def snapshot(self):
+        return self
+
+    def _read_only(self, *args, **kwargs):
+        raise InvalidDataError("Срез системы доступен только для чтения")
+
+    add_transport = add_passenger = add_route = _read_only
+    add_transports = add_passengers = add_routes = _read_only
+    assign_route_to_transport = _read_only
+    load_from_json = load_from_xml = load_from_binary = _read_only
+    load_from_sqlite = load_from_shards = load_from_segments = _read_only
+    enable_journal = enable_sqlite = _read_only
 
 
 # Классы для обработки исключительных ситуаций